@@ -1,5 +1,12 @@
 from django.apps import AppConfig
+from django.core.signals import request_started
 
 
 class CoreConfig(AppConfig):
     name = 'core'
+
+    def ready(self):
+        from .cache import sync_caches
+        from .db import check_connections
+        request_started.connect(check_connections)
+        request_started.connect(sync_caches)
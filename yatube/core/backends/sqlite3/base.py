@@ -0,0 +1,22 @@
+"""SQLite с WAL, настраиваемыми PRAGMA и транзакциями BEGIN IMMEDIATE.
+
+PRAGMA берутся из ключа `PRAGMAS` описания базы в settings.DATABASES и
+выполняются один раз на новое соединение, что при CONN_MAX_AGE > 0
+означает один раз на много запросов.
+"""
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.settings_dict.get('PRAGMAS', {}).items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        # Блокировка записи берётся в начале транзакции. С обычным BEGIN
+        # транзакция, начавшая с чтения, при первой записи получает
+        # "database is locked" сразу, не дожидаясь busy timeout.
+        self.cursor().execute('BEGIN IMMEDIATE')
@@ -0,0 +1,341 @@
+"""Нагрузочный замер всех страниц проекта.
+
+Набор данных генерируется через mixer и Faker, затем каждая страница из
+posts/urls.py, users/urls.py и about/urls.py запрашивается тестовым
+клиентом и через настоящий WSGI-сервер. Для каждой страницы считаются
+p50/p99 времени ответа, число SQL-запросов и пик памяти на запрос, а
+результат сравнивается с сохранённым базовым замером.
+"""
+import gc
+import json
+import math
+import random
+import threading
+import time
+import tracemalloc
+from collections import namedtuple
+from http.client import HTTPConnection
+from urllib.parse import urlencode
+from wsgiref.simple_server import WSGIRequestHandler, make_server
+
+from django.core.wsgi import get_wsgi_application
+from django.db import connection, reset_queries
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import get_resolver, reverse
+from django.utils.crypto import get_random_string
+from faker import Faker
+from mixer.backend.django import mixer
+
+from posts.counters import rebuild_counters
+from posts.models import Comment, Follow, Group, Post, User
+from posts.search import rebuild_index
+from posts.timeline import rebuild_timelines
+
+NAMESPACES = ('posts', 'users', 'about')
+# SQLite не принимает больше 500 строк в одном INSERT ... SELECT.
+BATCH_SIZE = 500
+# Допуски сравнения с базовым замером.
+TOLERANCE = 0.5
+P99_FACTOR = 4
+MIN_LATENCY_DELTA_MS = 2.0
+
+Route = namedtuple('Route', 'name url method auth data')
+
+
+def seed(users=20, groups=5, posts=500, comments=500, follows=50,
+         random_seed=0):
+    """Заполнить базу данными для замера; вернуть опорные объекты."""
+    Faker.seed(random_seed)
+    fake = Faker('ru_RU')
+    rng = random.Random(random_seed)
+    authors = mixer.cycle(users).blend(
+        User, username=mixer.sequence('bench_user_{0}')
+    )
+    topics = mixer.cycle(groups).blend(
+        Group, slug=mixer.sequence('bench-group-{0}'),
+        title=mixer.sequence('Группа {0}')
+    )
+    Post.objects.bulk_create(
+        (Post(text=fake.text(max_nb_chars=300), author=rng.choice(authors),
+              group=rng.choice(topics + [None]))
+         for _ in range(posts)),
+        batch_size=BATCH_SIZE
+    )
+    post_ids = list(Post.objects.values_list('pk', flat=True))
+    Comment.objects.bulk_create(
+        (Comment(text=fake.sentence(), author=rng.choice(authors),
+                 post_id=rng.choice(post_ids))
+         for _ in range(comments if post_ids else 0)),
+        batch_size=BATCH_SIZE
+    )
+    pairs = {
+        tuple(rng.sample(authors, 2))
+        for _ in range(follows if users > 1 else 0)
+    }
+    Follow.objects.bulk_create(
+        Follow(user=user, author=author) for user, author in pairs
+    )
+    # bulk_create не вызывает сигналы: производные данные собираются разом.
+    rebuild_counters()
+    rebuild_timelines()
+    rebuild_index()
+    author = authors[0]
+    post = Post.objects.filter(author=author).first() or Post.objects.create(
+        author=author, text=fake.text(max_nb_chars=300), group=topics[0]
+    )
+    return {
+        'user': authors[-1],
+        'author': author,
+        'group': topics[0],
+        'post': post,
+    }
+
+
+def build_routes(sample):
+    """Все страницы проекта с параметрами из опорных объектов."""
+    author = sample['author'].username
+    post_id = sample['post'].pk
+    user, owner = sample['user'], sample['author']
+
+    def route(name, args=(), method='GET', auth=None, data=None):
+        return Route(name, reverse(name, args=args), method, auth, data)
+
+    return [
+        route('posts:index'),
+        route('posts:group_list', [sample['group'].slug]),
+        route('posts:profile', [author]),
+        route('posts:post_detail', [post_id]),
+        route('posts:post_comments', [post_id]),
+        route('posts:post_create', auth=owner),
+        route('posts:post_edit', [post_id], auth=owner),
+        route('posts:add_comment', [post_id], 'POST', user,
+              {'text': 'Комментарий для замера'}),
+        route('posts:follow_index', auth=user),
+        route('posts:profile_follow', [author], auth=user),
+        route('posts:profile_unfollow', [author], auth=user),
+        route('posts:followers', [author]),
+        route('posts:following', [user.username], auth=user),
+        route('posts:bulk_follow', method='POST', auth=user,
+              data={'username': author}),
+        route('posts:api_posts'),
+        route('posts:api_group_posts', [sample['group'].slug]),
+        route('posts:api_profile_posts', [author]),
+        route('posts:api_post', [post_id]),
+        route('posts:api_post_comments', [post_id]),
+        route('posts:index_atom'),
+        route('posts:index_rss'),
+        route('posts:group_atom', [sample['group'].slug]),
+        route('posts:group_rss', [sample['group'].slug]),
+        route('posts:profile_atom', [author]),
+        route('posts:profile_rss', [author]),
+        route('posts:search', data={'q': 'текст'}),
+        route('posts:search_api', data={'q': 'текст'}),
+        route('users:signup'),
+        route('users:login'),
+        route('users:logout', auth=user),
+        route('users:password_reset'),
+        route('users:password_change', auth=user),
+        route('about:author'),
+        route('about:tech'),
+    ]
+
+
+def missing_routes(routes):
+    """Имена страниц из urls.py, для которых нет замера."""
+    resolver = get_resolver()
+    names = set()
+    for namespace in NAMESPACES:
+        for pattern in resolver.namespace_dict[namespace][1].url_patterns:
+            if pattern.name:
+                names.add(f'{namespace}:{pattern.name}')
+    return sorted(names - {route.name for route in routes})
+
+
+def percentile(values, share):
+    """Значение по методу ближайшего ранга."""
+    ordered = sorted(values)
+    rank = max(math.ceil(share * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def summarize(timings, queries=None, peak=None):
+    return {
+        'p50_ms': round(percentile(timings, 0.5) * 1000, 3),
+        'p99_ms': round(percentile(timings, 0.99) * 1000, 3),
+        'queries': queries,
+        'peak_kib': peak,
+    }
+
+
+class ClientDriver:
+    """Запросы через django.test.Client в текущем потоке."""
+
+    name = 'client'
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def client(self, route):
+        client = Client()
+        if route.auth is not None:
+            client.force_login(route.auth)
+        return client
+
+    def request(self, client, route):
+        if route.method == 'POST':
+            return client.post(route.url, route.data or {})
+        response = client.get(route.url, route.data or {})
+        if response.streaming:
+            # Потоковый ответ читает базу при отправке: дочитать его.
+            b''.join(response.streaming_content)
+        return response
+
+    def measure(self, route, requests, warmup):
+        client = self.client(route)
+        for _ in range(warmup):
+            self.request(client, route)
+        # Журнал ограничен по длине: отсчёт с пустого журнала. Считать
+        # нужно сразу, следующий запрос снова очистит журнал.
+        reset_queries()
+        with CaptureQueriesContext(connection) as captured:
+            self.request(client, route)
+        queries = len(captured)
+        tracemalloc.start()
+        try:
+            self.request(client, route)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        timings = []
+        for _ in range(requests):
+            started = time.perf_counter()
+            self.request(client, route)
+            timings.append(time.perf_counter() - started)
+        return summarize(timings, queries, peak // 1024)
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class WsgiDriver:
+    """Запросы по HTTP к wsgiref-серверу с приложением проекта."""
+
+    name = 'wsgi'
+    host = 'testserver'
+
+    def __enter__(self):
+        self.server = make_server(
+            '127.0.0.1', 0, get_wsgi_application(), handler_class=QuietHandler
+        )
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, daemon=True
+        )
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def headers(self, route):
+        # Несолёный секрет CSRF принимается и из cookie, и из заголовка.
+        token = get_random_string(32)
+        cookies = [f'csrftoken={token}']
+        if route.auth is not None:
+            client = Client()
+            client.force_login(route.auth)
+            cookies.append(f'sessionid={client.cookies["sessionid"].value}')
+        return {
+            'Host': self.host,
+            'Cookie': '; '.join(cookies),
+            'X-CSRFToken': token,
+            'Content-Type': 'application/x-www-form-urlencoded',
+        }
+
+    def request(self, http, route, headers):
+        body = urlencode(route.data or {})
+        url = route.url
+        if route.method == 'GET' and body:
+            url, body = f'{url}?{body}', None
+        http.request(route.method, url, body=body, headers=headers)
+        response = http.getresponse()
+        response.read()
+        return response
+
+    def measure(self, route, requests, warmup):
+        headers = self.headers(route)
+        http = HTTPConnection(*self.server.server_address)
+        try:
+            for _ in range(warmup):
+                self.request(http, route, headers)
+            timings = []
+            for _ in range(requests):
+                started = time.perf_counter()
+                self.request(http, route, headers)
+                timings.append(time.perf_counter() - started)
+        finally:
+            http.close()
+        return summarize(timings)
+
+
+def run(routes, drivers, requests=20, warmup=2):
+    """Замерить все страницы каждым способом; ключ — `способ:страница`."""
+    results = {}
+    for driver in drivers:
+        with driver:
+            for route in routes:
+                # Сборка мусора от прошлой страницы не попадает в замер.
+                gc.collect()
+                results[f'{driver.name}:{route.name}'] = driver.measure(
+                    route, requests, warmup
+                )
+    return results
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """Список регрессий относительно базового замера."""
+    regressions = []
+    for key, current in sorted(results.items()):
+        saved = baseline.get(key)
+        if saved is None:
+            continue
+        if (current['queries'] is not None and saved.get('queries') is not None
+                and current['queries'] > saved['queries']):
+            regressions.append(
+                f'{key}: запросов {current["queries"]} > {saved["queries"]}'
+            )
+        # Хвост распределения шумнее медианы, поэтому допуск для p99 шире.
+        for metric, allowed in (('p50_ms', tolerance),
+                                ('p99_ms', tolerance * P99_FACTOR)):
+            limit = max(saved[metric] * (1 + allowed),
+                        saved[metric] + MIN_LATENCY_DELTA_MS)
+            if current[metric] > limit:
+                regressions.append(
+                    f'{key}: {metric[:3]} {current[metric]} мс > '
+                    f'{limit:.3f} мс'
+                )
+        if current['peak_kib'] and saved.get('peak_kib'):
+            limit = saved['peak_kib'] * (1 + tolerance)
+            if current['peak_kib'] > limit:
+                regressions.append(
+                    f'{key}: память {current["peak_kib"]} КиБ > '
+                    f'{limit:.0f} КиБ'
+                )
+    return regressions
+
+
+def load_baseline(path):
+    with open(path, encoding='utf-8') as stream:
+        return json.load(stream)
+
+
+def save_baseline(path, results):
+    with open(path, 'w', encoding='utf-8') as stream:
+        json.dump(results, stream, ensure_ascii=False, indent=2,
+                  sort_keys=True)
@@ -0,0 +1,506 @@
+"""Бэкенды кэша, общие для всех процессов приложения.
+
+SQLiteCache хранит записи в файле SQLite и не требует внешних сервисов;
+incr в нём атомарен между процессами. TwoLevelCache ставит перед общим
+кэшем (SQLite, Redis, memcached) небольшой LRU в памяти процесса. Каждая
+запись в общий кэш публикуется в журнале инвалидаций, который лежит в том
+же общем кэше; процессы читают журнал в начале каждого запроса и не чаще
+раза в SYNC_INTERVAL секунд вне запросов и выбрасывают из своего LRU
+изменённые ключи.
+"""
+import pickle
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+SEQUENCE_KEY = 'twolevel:sequence'
+LOG_KEY = 'twolevel:log:{}'
+# SQLite ограничивает число параметров запроса.
+SQLITE_CHUNK = 500
+
+
+def _chunks(items, size=SQLITE_CHUNK):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class SQLiteCache(BaseCache):
+    """Кэш в файле SQLite, общий для процессов на одной машине.
+
+    Целые числа хранятся как INTEGER, поэтому incr — один UPDATE под
+    блокировкой записи. Остальные значения сериализуются pickle.
+    Просроченные и лишние записи удаляются раз в CULL_EVERY записей.
+    У каждого потока своё соединение: транзакции BEGIN IMMEDIATE на общем
+    соединении вложились бы друг в друга.
+    """
+
+    CULL_EVERY = 100
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self.path = location
+        self._local = threading.local()
+        self._writes = 0
+
+    @property
+    def connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(
+                self.path, timeout=20, isolation_level=None
+            )
+            connection.execute('PRAGMA journal_mode = wal')
+            connection.execute('PRAGMA synchronous = normal')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, '
+                'value BLOB NOT NULL, expires REAL)'
+            )
+            connection.execute(
+                'CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires)'
+            )
+            self._local.connection = connection
+        return connection
+
+    @staticmethod
+    def _encode(value):
+        if type(value) is int:
+            return value
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def _decode(value):
+        return value if isinstance(value, int) else pickle.loads(value)
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _write(self, sql, rows):
+        connection = self.connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.executemany(sql, rows)
+            self._writes += len(rows)
+            if self._writes >= self.CULL_EVERY:
+                self._writes = 0
+                self._cull(connection)
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    def _cull(self, connection):
+        connection.execute(
+            'DELETE FROM cache WHERE expires <= ?', [time.time()]
+        )
+        count, = connection.execute('SELECT COUNT(*) FROM cache').fetchone()
+        if count > self._max_entries:
+            # Бессрочные записи (поколения лент) удаляются последними.
+            connection.execute(
+                'DELETE FROM cache WHERE key IN (SELECT key FROM cache '
+                'ORDER BY expires IS NULL, expires LIMIT ?)',
+                [count // self._cull_frequency]
+            )
+
+    def get(self, key, default=None, version=None):
+        key = self._key(key, version)
+        row = self.connection.execute(
+            'SELECT value FROM cache WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)', [key, time.time()]
+        ).fetchone()
+        return default if row is None else self._decode(row[0])
+
+    def get_many(self, keys, version=None):
+        keys = {self._key(key, version): key for key in keys}
+        found = {}
+        for chunk in _chunks(keys):
+            rows = self.connection.execute(
+                'SELECT key, value FROM cache WHERE key IN ({}) '
+                'AND (expires IS NULL OR expires > ?)'.format(
+                    ', '.join('?' * len(chunk))
+                ), chunk + [time.time()]
+            )
+            for key, value in rows:
+                found[keys[key]] = self._decode(value)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expires = self.get_backend_timeout(timeout)
+        self._write(
+            'INSERT OR REPLACE INTO cache (key, value, expires) '
+            'VALUES (?, ?, ?)',
+            [(self._key(key, version), self._encode(value), expires)
+             for key, value in data.items()]
+        )
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        connection = self.connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute(
+                'DELETE FROM cache WHERE key = ? AND expires <= ?',
+                [key, time.time()]
+            )
+            added = connection.execute(
+                'INSERT OR IGNORE INTO cache (key, value, expires) '
+                'VALUES (?, ?, ?)',
+                [key, self._encode(value), self.get_backend_timeout(timeout)]
+            ).rowcount == 1
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        return added
+
+    def incr(self, key, delta=1, version=None):
+        raw_key = key
+        key = self._key(key, version)
+        connection = self.connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            updated = connection.execute(
+                'UPDATE cache SET value = value + ? WHERE key = ? '
+                'AND typeof(value) = \'integer\' '
+                'AND (expires IS NULL OR expires > ?)',
+                [delta, key, time.time()]
+            ).rowcount
+            row = connection.execute(
+                'SELECT value FROM cache WHERE key = ?', [key]
+            ).fetchone() if updated else None
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        if row is None:
+            raise ValueError("Key '%s' not found" % raw_key)
+        return row[0]
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        return self.connection.execute(
+            'UPDATE cache SET expires = ? WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            [self.get_backend_timeout(timeout), key, time.time()]
+        ).rowcount == 1
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version)
+
+    def delete_many(self, keys, version=None):
+        self._write(
+            'DELETE FROM cache WHERE key = ?',
+            [(self._key(key, version),) for key in keys]
+        )
+
+    def clear(self):
+        self.connection.execute('DELETE FROM cache')
+
+
+class LocalTier:
+    """LRU в памяти процесса, общий для потоков."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        # Последняя применённая запись журнала инвалидаций.
+        self.seen = None
+        self.synced = 0.0
+        self.stats = Counter()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, pickled = entry
+            if expires is not None and expires <= time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+        return pickled
+
+    def set(self, key, pickled, lifetime, seen=None, check=False):
+        """Запомнить запись; с `check` — только если журнал не сдвинулся.
+
+        Значение, прочитанное из общего кэша, могли изменить до того, как
+        оно попало в LRU. Если за это время журнал был прочитан, его
+        инвалидация уже применена, и такое значение осталось бы в LRU.
+        """
+        expires = time.monotonic() + lifetime
+        with self.lock:
+            if check and self.seen != seen:
+                self.stats['stale_reads'] += 1
+                return
+            self.entries[key] = (expires, pickled)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def count(self, name, number=1):
+        with self.lock:
+            self.stats[name] += number
+
+    def discard(self, keys):
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+_tiers = {}
+_tiers_lock = threading.Lock()
+
+
+class TwoLevelCache(BaseCache):
+    """LRU процесса перед общим кэшем с инвалидацией между процессами.
+
+    LOCATION — алиас общего кэша в CACHES. OPTIONS: LOCAL_MAX_ENTRIES —
+    размер LRU, LOCAL_TIMEOUT — сколько секунд запись живёт в LRU,
+    SYNC_INTERVAL — как часто читать журнал вне запросов, LOG_SIZE и
+    LOG_TIMEOUT — на сколько записей и секунд процесс может отстать от
+    журнала, прежде чем очистить LRU целиком.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.local_timeout = options.get('LOCAL_TIMEOUT', 60)
+        self.sync_interval = options.get('SYNC_INTERVAL', 1)
+        self.log_size = options.get('LOG_SIZE', 1000)
+        self.log_timeout = options.get('LOG_TIMEOUT', 300)
+        self.shared = caches[location]
+        with _tiers_lock:
+            self.tier = _tiers.setdefault(
+                location, LocalTier(options.get('LOCAL_MAX_ENTRIES', 1000))
+            )
+
+    def make_key(self, key, version=None):
+        return self.shared.make_key(key, version=version)
+
+    def validate_key(self, key):
+        self.shared.validate_key(key)
+
+    def _lifetime(self, timeout):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.shared.default_timeout
+        if timeout is None:
+            return self.local_timeout
+        return min(timeout, self.local_timeout)
+
+    def _remember(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._maybe_sync()
+        self._store(key, value, timeout, version)
+
+    def _remember_read(self, key, value, seen, version=None):
+        # Журнал читается до общего кэша, а не после: иначе инвалидация
+        # значения, пока оно в пути, применилась бы раньше его записи.
+        self._store(key, value, DEFAULT_TIMEOUT, version, seen, check=True)
+
+    def _store(self, key, value, timeout, version, seen=None, check=False):
+        lifetime = self._lifetime(timeout)
+        if lifetime > 0:
+            self.tier.set(
+                self.make_key(key, version),
+                pickle.dumps(value, pickle.HIGHEST_PROTOCOL), lifetime,
+                seen, check
+            )
+
+    # Журнал инвалидаций.
+
+    def publish(self, keys, version=None):
+        """Сообщить другим процессам, что ключи изменились."""
+        keys = [self.make_key(key, version) for key in keys]
+        try:
+            last = self.shared.incr(SEQUENCE_KEY, len(keys))
+        except ValueError:
+            self.shared.add(SEQUENCE_KEY, 0, None)
+            last = self.shared.incr(SEQUENCE_KEY, len(keys))
+        first = last - len(keys) + 1
+        self.shared.set_many(
+            {LOG_KEY.format(first + i): key for i, key in enumerate(keys)},
+            self.log_timeout
+        )
+        self.tier.count('published', len(keys))
+        with self.tier.lock:
+            # Свои изменения уже применены к LRU.
+            if self.tier.seen == first - 1:
+                self.tier.seen = last
+
+    def sync(self):
+        """Выбросить из LRU ключи, изменённые другими процессами."""
+        tier = self.tier
+        tier.synced = time.monotonic()
+        sequence = self.shared.get(SEQUENCE_KEY)
+        seen = tier.seen
+        if sequence == seen:
+            return
+        keys = None
+        if (sequence is not None and seen is not None
+                and 0 < sequence - seen <= self.log_size):
+            log = self.shared.get_many(
+                [LOG_KEY.format(n) for n in range(seen + 1, sequence + 1)]
+            )
+            if len(log) == sequence - seen:
+                keys = log.values()
+        with tier.lock:
+            if tier.seen != seen:
+                # Журнал уже прочитал другой поток.
+                return
+            if seen is None:
+                # Первое чтение журнала: всё, что в LRU, прочитано до него.
+                tier.entries.clear()
+            elif keys is None:
+                tier.entries.clear()
+                tier.stats['flushes'] += 1
+            else:
+                for key in keys:
+                    tier.entries.pop(key, None)
+                tier.stats['invalidated'] += len(keys)
+            tier.seen = sequence
+
+    def _maybe_sync(self):
+        if time.monotonic() - self.tier.synced >= self.sync_interval:
+            self.sync()
+
+    # Чтение.
+
+    def get(self, key, default=None, version=None):
+        self._maybe_sync()
+        pickled = self.tier.get(self.make_key(key, version))
+        if pickled is not None:
+            self.tier.count('local_hits')
+            return pickle.loads(pickled)
+        missing = object()
+        seen = self.tier.seen
+        value = self.shared.get(key, missing, version=version)
+        if value is missing:
+            self.tier.count('misses')
+            return default
+        self.tier.count('shared_hits')
+        self._remember_read(key, value, seen, version)
+        return value
+
+    def get_many(self, keys, version=None):
+        self._maybe_sync()
+        found = {}
+        missing = []
+        for key in keys:
+            pickled = self.tier.get(self.make_key(key, version))
+            if pickled is None:
+                missing.append(key)
+            else:
+                found[key] = pickle.loads(pickled)
+        self.tier.count('local_hits', len(found))
+        if missing:
+            seen = self.tier.seen
+            shared = self.shared.get_many(missing, version=version)
+            for key, value in shared.items():
+                self._remember_read(key, value, seen, version)
+            found.update(shared)
+            self.tier.count('shared_hits', len(shared))
+            self.tier.count('misses', len(missing) - len(shared))
+        return found
+
+    # Запись.
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.shared.set(key, value, timeout, version=version)
+        self._remember(key, value, timeout, version)
+        self.publish([key], version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.shared.set_many(data, timeout, version=version)
+        for key, value in data.items():
+            if key not in failed:
+                self._remember(key, value, timeout, version)
+        if data:
+            self.publish(list(data), version)
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        if not self.shared.add(key, value, timeout, version=version):
+            return False
+        self._remember(key, value, timeout, version)
+        self.publish([key], version)
+        return True
+
+    def incr(self, key, delta=1, version=None):
+        value = self.shared.incr(key, delta, version=version)
+        self.tier.discard([self.make_key(key, version)])
+        self.publish([key], version)
+        return value
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.shared.touch(key, timeout, version=version)
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version)
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        self.shared.delete_many(keys, version=version)
+        self.tier.discard([self.make_key(key, version) for key in keys])
+        if keys:
+            self.publish(keys, version)
+
+    def clear(self):
+        # Вместе с общим кэшем пропадает журнал: другие процессы увидят
+        # сброшенный счётчик и очистят свои LRU целиком.
+        self.shared.clear()
+        self.tier.clear()
+        with self.tier.lock:
+            self.tier.seen = None
+
+    def close(self, **kwargs):
+        self.shared.close(**kwargs)
+
+
+def sync_caches(**kwargs):
+    """Применить журналы инвалидаций в начале запроса."""
+    for alias in settings.CACHES:
+        backend = caches[alias]
+        if isinstance(backend, TwoLevelCache):
+            backend.sync()
+
+
+def cache_stats():
+    """Попадания в LRU и в общий кэш по каждому двухуровневому кэшу."""
+    stats = {}
+    for location, tier in sorted(_tiers.items()):
+        with tier.lock:
+            counts = dict(tier.stats)
+            entries = len(tier.entries)
+        hits = counts.get('local_hits', 0) + counts.get('shared_hits', 0)
+        reads = hits + counts.get('misses', 0)
+        stats[location] = dict(
+            counts,
+            entries=entries,
+            hit_rate=round(hits / reads, 4) if reads else None,
+            local_hit_rate=(
+                round(counts.get('local_hits', 0) / reads, 4)
+                if reads else None
+            ),
+        )
+    return stats
+
+
+def reset_stats():
+    for tier in _tiers.values():
+        with tier.lock:
+            tier.stats.clear()
@@ -0,0 +1,17 @@
+"""Проверка постоянных соединений с базой перед запросом."""
+from django.db import connections
+
+
+def check_connections(**kwargs):
+    """Закрыть соединения, которые перестали отвечать.
+
+    С CONN_MAX_AGE > 0 соединение переживает запрос, и его могли закрыть
+    сервер базы или пулер. Для баз с CONN_HEALTH_CHECKS оно проверяется в
+    начале запроса и при необходимости открывается заново.
+    """
+    for connection in connections.all():
+        if (connection.settings_dict.get('CONN_HEALTH_CHECKS')
+                and connection.connection is not None
+                and not connection.in_atomic_block
+                and not connection.is_usable()):
+            connection.close()
@@ -0,0 +1,114 @@
+import os
+import resource
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (override_settings, setup_test_environment,
+                               teardown_test_environment)
+
+from core import benchmark
+
+DEFAULT_BASELINE = os.path.join(settings.BASE_DIR, 'benchmark_baseline.json')
+# Общий кэш замера живёт в памяти процесса: настоящий (Redis, SQLite) не
+# очищается и не заполняется данными тестовой базы. У default свой алиас
+# общего уровня, чтобы и LRU процесса был отдельным.
+BENCHMARK_SHARED = {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    'LOCATION': 'benchmark',
+}
+BENCHMARK_CACHES = dict(
+    settings.CACHES,
+    default=dict(settings.CACHES['default'], LOCATION='benchmark'),
+    shared=BENCHMARK_SHARED,
+    benchmark=BENCHMARK_SHARED,
+)
+
+
+class Command(BaseCommand):
+    help = ('Замерить время ответа, число запросов и память всех страниц '
+            'на отдельной тестовой базе.')
+
+    def add_arguments(self, parser):
+        for name, default in (('users', 20), ('groups', 5), ('posts', 500),
+                              ('comments', 500), ('follows', 50)):
+            parser.add_argument(f'--{name}', type=int, default=default)
+        parser.add_argument('--requests', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument(
+            '--driver', choices=('client', 'wsgi', 'all'), default='all'
+        )
+        parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+        parser.add_argument(
+            '--save-baseline', action='store_true',
+            help='Записать результат как новый базовый замер.'
+        )
+        parser.add_argument(
+            '--tolerance', type=float, default=benchmark.TOLERANCE,
+            help='Допустимый рост p99 и памяти, доля от базового.'
+        )
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True
+        )
+        try:
+            # Замер повторяет одни и те же записи: лимит частоты отдал бы 429.
+            with override_settings(RATELIMIT_ENABLED=False,
+                                   CACHES=BENCHMARK_CACHES):
+                cache.clear()
+                results = self.measure(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+        self.report(results)
+        if options['save_baseline']:
+            benchmark.save_baseline(options['baseline'], results)
+            self.stdout.write(f'Базовый замер записан в {options["baseline"]}')
+            return
+        if not os.path.exists(options['baseline']):
+            self.stdout.write('Базового замера нет, сравнение пропущено.')
+            return
+        regressions = benchmark.compare(
+            results, benchmark.load_baseline(options['baseline']),
+            options['tolerance']
+        )
+        if regressions:
+            raise CommandError(
+                'Регрессии производительности:\n' + '\n'.join(regressions)
+            )
+        self.stdout.write(self.style.SUCCESS('Регрессий нет.'))
+
+    def measure(self, options):
+        sample = benchmark.seed(
+            options['users'], options['groups'], options['posts'],
+            options['comments'], options['follows']
+        )
+        routes = benchmark.build_routes(sample)
+        missing = benchmark.missing_routes(routes)
+        if missing:
+            raise CommandError('Нет замера для страниц: ' + ', '.join(missing))
+        drivers = []
+        if options['driver'] in ('client', 'all'):
+            drivers.append(benchmark.ClientDriver())
+        if options['driver'] in ('wsgi', 'all'):
+            drivers.append(benchmark.WsgiDriver())
+        return benchmark.run(
+            routes, drivers, options['requests'], options['warmup']
+        )
+
+    def report(self, results):
+        self.stdout.write(
+            f'{"страница":<40} {"p50, мс":>9} {"p99, мс":>9} '
+            f'{"запросы":>8} {"КиБ":>7}'
+        )
+        for key, row in sorted(results.items()):
+            self.stdout.write(
+                f'{key:<40} {row["p50_ms"]:>9.2f} {row["p99_ms"]:>9.2f} '
+                f'{row["queries"] if row["queries"] is not None else "-":>8} '
+                f'{row["peak_kib"] if row["peak_kib"] is not None else "-":>7}'
+            )
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        self.stdout.write(f'Пиковая память процесса: {maxrss} КиБ')
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from core import tasks
+
+
+class Command(BaseCommand):
+    help = 'Выполнять фоновые задачи из очереди.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Выполнить задачи, срок которых наступил, и выйти.'
+        )
+        parser.add_argument(
+            '--interval', type=float, default=1.0,
+            help='Пауза в секундах, когда очередь пуста.'
+        )
+
+    def handle(self, *args, **options):
+        done = 0
+        try:
+            while True:
+                done += tasks.run_pending()
+                close_old_connections()
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f'Задач выполнено: {done}.'))
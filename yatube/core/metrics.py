@@ -0,0 +1,186 @@
+"""Замеры производительности отдельных запросов и их сводка по страницам.
+
+Замер текущего запроса хранится в contextvar: его пополняют обёртка
+выполнения SQL, бэкенд шаблонов и счётчики кэша, а PerformanceMiddleware
+в конце запроса отправляет результат в сводку процесса. Сводка хранит
+суммы и выборку фиксированного размера для перцентилей, поэтому её объём
+не растёт с числом запросов.
+"""
+import math
+import random
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Сколько последних длительностей помнить на страницу для перцентилей.
+RESERVOIR_SIZE = 256
+
+_current = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    """Замер одного запроса."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_time = 0.0
+        self.queries = 0
+        self.duplicates = 0
+        self.template_time = 0.0
+        self.cache = Counter()
+        # Время, потраченное на сами замеры.
+        self.overhead = 0.0
+        self._seen = set()
+        self._template_depth = 0
+
+    def execute(self, execute, sql, params, many, context):
+        """Обёртка выполнения SQL для connection.execute_wrapper()."""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            finished = time.perf_counter()
+            self.db_time += finished - started
+            self.queries += 1
+            if not many:
+                key = (sql, repr(params))
+                if key in self._seen:
+                    self.duplicates += 1
+                else:
+                    self._seen.add(key)
+            self.overhead += time.perf_counter() - finished
+
+    @contextmanager
+    def template(self):
+        # Вложенные шаблоны (карточки постов) уже входят во внешний.
+        self._template_depth += 1
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._template_depth -= 1
+            if not self._template_depth:
+                self.template_time += time.perf_counter() - started
+
+    @property
+    def cache_hits(self):
+        return sum(n for name, n in self.cache.items()
+                   if not name.endswith('.miss'))
+
+    @property
+    def cache_misses(self):
+        return sum(n for name, n in self.cache.items()
+                   if name.endswith('.miss'))
+
+    def server_timing(self, total):
+        """Значение заголовка Server-Timing."""
+        return ', '.join((
+            f'total;dur={total * 1000:.2f}',
+            f'db;dur={self.db_time * 1000:.2f};'
+            f'desc="{self.queries} queries, {self.duplicates} duplicates"',
+            f'tpl;dur={self.template_time * 1000:.2f}',
+            f'cache;desc="{self.cache_hits} hits, '
+            f'{self.cache_misses} misses"',
+        ))
+
+
+def current():
+    """Замер текущего запроса или None, если запрос не замеряется."""
+    return _current.get()
+
+
+@contextmanager
+def measure(metrics=None):
+    """Замерять текущий контекст; `metrics` — продолжить начатый замер."""
+    if metrics is None:
+        metrics = RequestMetrics()
+    token = _current.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _current.reset(token)
+
+
+def record_cache(name):
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.cache[name] += 1
+
+
+class Aggregate:
+    """Сводка замеров одной страницы."""
+
+    FIELDS = ('total', 'db', 'queries', 'duplicates', 'template', 'hits',
+              'misses', 'overhead')
+
+    def __init__(self):
+        self.requests = 0
+        self.sums = dict.fromkeys(self.FIELDS, 0.0)
+        self.slowest = 0.0
+        self.reservoir = []
+
+    def add(self, values):
+        self.requests += 1
+        for field, value in values.items():
+            self.sums[field] += value
+        total = values['total']
+        self.slowest = max(self.slowest, total)
+        # Равномерная выборка фиксированного размера (алгоритм R).
+        if len(self.reservoir) < RESERVOIR_SIZE:
+            self.reservoir.append(total)
+        else:
+            index = random.randrange(self.requests)
+            if index < RESERVOIR_SIZE:
+                self.reservoir[index] = total
+
+    def percentile(self, share):
+        ordered = sorted(self.reservoir)
+        return ordered[max(math.ceil(share * len(ordered)), 1) - 1]
+
+    def as_dict(self):
+        count = self.requests
+        ms = ('total', 'db', 'template', 'overhead')
+        data = {'requests': count}
+        for field in self.FIELDS:
+            average = self.sums[field] / count
+            if field in ms:
+                data[f'avg_{field}_ms'] = round(average * 1000, 3)
+            else:
+                data[f'avg_{field}'] = round(average, 2)
+        data['p50_ms'] = round(self.percentile(0.5) * 1000, 3)
+        data['p99_ms'] = round(self.percentile(0.99) * 1000, 3)
+        data['max_ms'] = round(self.slowest * 1000, 3)
+        return data
+
+
+_aggregates = {}
+_lock = threading.Lock()
+
+
+def record(view_name, metrics, total):
+    values = {
+        'total': total,
+        'db': metrics.db_time,
+        'queries': metrics.queries,
+        'duplicates': metrics.duplicates,
+        'template': metrics.template_time,
+        'hits': metrics.cache_hits,
+        'misses': metrics.cache_misses,
+        'overhead': metrics.overhead,
+    }
+    with _lock:
+        _aggregates.setdefault(view_name, Aggregate()).add(values)
+
+
+def snapshot():
+    """Сводка по страницам в текущем процессе."""
+    with _lock:
+        return {name: aggregate.as_dict()
+                for name, aggregate in sorted(_aggregates.items())}
+
+
+def reset():
+    with _lock:
+        _aggregates.clear()
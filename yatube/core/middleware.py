@@ -0,0 +1,105 @@
+import random
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+from . import metrics, routers
+
+
+class PerformanceMiddleware:
+    """Замер времени запроса, SQL, шаблонов и кэша.
+
+    Замеряется доля запросов PERFORMANCE_SAMPLE_RATE. Для них в ответ
+    добавляется заголовок Server-Timing, а замер попадает в сводку,
+    которую отдаёт core.views.metrics. Потоковый ответ читает базу уже
+    после выхода из view, поэтому его тело отдаётся под тем же замером:
+    в Server-Timing попадает время до начала отдачи, в сводку — полное.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        rate = getattr(settings, 'PERFORMANCE_SAMPLE_RATE', 0)
+        if rate <= 0 or random.random() >= rate:
+            return self.get_response(request)
+        current = metrics.RequestMetrics()
+        with self.measuring(current):
+            response = self.get_response(request)
+        finished = time.perf_counter()
+        response['Server-Timing'] = current.server_timing(
+            finished - current.started
+        )
+        current.overhead += time.perf_counter() - finished
+        if response.streaming:
+            response.streaming_content = self.stream(
+                request, response.streaming_content, current
+            )
+        else:
+            self.record(request, current, finished)
+        return response
+
+    @staticmethod
+    @contextmanager
+    def measuring(current):
+        with metrics.measure(current), ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(
+                    connection.execute_wrapper(current.execute)
+                )
+            yield
+
+    def stream(self, request, chunks, current):
+        with self.measuring(current):
+            yield from chunks
+        self.record(request, current, time.perf_counter())
+
+    @staticmethod
+    def record(request, current, finished):
+        match = request.resolver_match
+        metrics.record(
+            match.view_name if match else '-', current,
+            finished - current.started
+        )
+
+
+class ReplicaRoutingMiddleware:
+    """Состояние маршрутизации запросов к базе на время запроса.
+
+    Посетитель с cookie закрепления читает только из основной базы. View,
+    помеченные routers.replica_reads, на безопасных методах читают с
+    реплики. Если запрос что-то записал, cookie закрепления ставится на
+    REPLICA_PIN_SECONDS секунд. Тело потокового ответа читается с той же
+    базы, что и view.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        pinned = routers.PIN_COOKIE in request.COOKIES
+        with routers.routing(pinned) as state:
+            response = self.get_response(request)
+        if state.wrote and getattr(settings, 'DATABASE_REPLICAS', ()):
+            response.set_cookie(
+                routers.PIN_COOKIE, '1',
+                max_age=getattr(settings, 'REPLICA_PIN_SECONDS', 5),
+                httponly=True, samesite='Lax'
+            )
+        if response.streaming:
+            response.streaming_content = self.stream(
+                response.streaming_content, state
+            )
+        return response
+
+    @staticmethod
+    def stream(chunks, state):
+        with routers.routing(state=state):
+            yield from chunks
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if (getattr(view_func, 'replica_reads', False)
+                and request.method in routers.SAFE_METHODS):
+            routers.use_replica()
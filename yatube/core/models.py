@@ -0,0 +1,46 @@
+from django.db import models
+from django.utils import timezone
+
+
+class Task(models.Model):
+    """Фоновая задача в очереди (см. core.tasks)."""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUSES = (
+        (QUEUED, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (FAILED, 'Не выполнена'),
+    )
+
+    name = models.CharField('Функция', max_length=200)
+    args = models.TextField('Аргументы в JSON', default='[]')
+    key = models.CharField(
+        'Ключ дедупликации',
+        max_length=200,
+        unique=True,
+        null=True,
+        blank=True
+    )
+    status = models.CharField(
+        'Состояние',
+        max_length=10,
+        choices=STATUSES,
+        default=QUEUED
+    )
+    attempts = models.PositiveIntegerField('Попытки', default=0)
+    # Для задачи в очереди — когда её можно брать, для выполняемой — когда
+    # истекает аренда и задачу может забрать другой обработчик.
+    run_at = models.DateTimeField('Срок', default=timezone.now)
+    created = models.DateTimeField('Поставлена', default=timezone.now)
+    error = models.TextField('Последняя ошибка', blank=True)
+
+    def __str__(self):
+        return f'{self.name}{self.args}'
+
+    class Meta:
+        verbose_name = 'Задача'
+        verbose_name_plural = 'Задачи'
+        indexes = [
+            models.Index(fields=['status', 'run_at'], name='task_due_idx'),
+        ]
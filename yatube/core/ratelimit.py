@@ -0,0 +1,133 @@
+"""Ограничение частоты запросов, которые пишут в базу.
+
+Лимиты задаются в RATELIMITS по имени области: `'10/m'` — не больше десяти
+запросов в минуту, кортеж лимитов вроде `('5/m', '50/d')` разрешает
+короткий всплеск и ограничивает длинную дистанцию, как ёмкость и скорость
+пополнения token bucket.
+
+Счёт ведётся скользящим окном: счётчик текущего окна плюс доля счётчика
+предыдущего, которая уменьшается по мере того, как окно сдвигается.
+Счётчики живут в общем кэше RATELIMIT_CACHE и растут атомарным incr, так
+что проверка — это incr и get без обращений к базе. Отказ — ответ 429 с
+Retry-After через столько секунд, когда запрос снова пройдёт.
+"""
+import math
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.shortcuts import render
+
+UNITS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 60 * 60 * 24}
+
+
+def parse_rate(rate):
+    """'10/m' -> (10, 60)."""
+    count, unit = rate.split('/')
+    return int(count), UNITS[unit]
+
+
+def client_key(request, key):
+    """Чей счётчик: пользователя или адреса, с которого пришёл запрос."""
+    if key == 'user' or key == 'user_or_ip' and request.user.is_authenticated:
+        return f'user:{request.user.pk}'
+    addresses = request.META.get(
+        getattr(settings, 'RATELIMIT_IP_META', 'REMOTE_ADDR'), ''
+    ).split(',')
+    # Клиент может прислать свой X-Forwarded-For, и прокси допишут адреса
+    # в его конец. Доверять можно только адресу, который дописал наш
+    # крайний прокси: RATELIMIT_PROXY_HOPS-му с конца.
+    hops = getattr(settings, 'RATELIMIT_PROXY_HOPS', 1)
+    return 'ip:' + addresses[-min(hops, len(addresses))].strip()
+
+
+def _count(cache, key, timeout):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        if cache.add(key, 1, timeout):
+            return 1
+        return cache.incr(key)
+
+
+def _window_key(scope, ident, period, window):
+    return f'ratelimit:{scope}:{ident}:{period}:{int(window)}'
+
+
+def hit(scope, ident, limit, period, now=None):
+    """Засчитать запрос; 0, если он в лимите, иначе секунды до повтора."""
+    cache = caches[getattr(settings, 'RATELIMIT_CACHE', 'default')]
+    now = time.time() if now is None else now
+    window, elapsed = divmod(now, period)
+    key = _window_key(scope, ident, period, window)
+    current = _count(cache, key, period * 2)
+    previous = cache.get(_window_key(scope, ident, period, window - 1), 0)
+    share = 1 - elapsed / period
+    if previous * share + current <= limit:
+        return 0
+    # Отклонённый запрос не считается, иначе Retry-After был бы неверен.
+    cache.decr(key)
+    current -= 1
+    if current < limit:
+        # Ждать, пока доля предыдущего окна не освободит место.
+        wait = period * (1 - (limit - current - 1) / previous) - elapsed
+    else:
+        # Текущее окно исчерпано: ждать его конца и убывания его доли.
+        wait = period - elapsed + period * (1 - (limit - 1) / current)
+    return max(1, math.ceil(round(wait, 6)))
+
+
+def unhit(scope, ident, period, now):
+    """Отменить запрос, засчитанный hit() в момент now."""
+    cache = caches[getattr(settings, 'RATELIMIT_CACHE', 'default')]
+    key = _window_key(scope, ident, period, now // period)
+    try:
+        cache.decr(key)
+    except ValueError:
+        pass
+
+
+def check(scope, ident, rates, now=None):
+    """Засчитать запрос во всех лимитах; 0 или секунды до повтора.
+
+    Если запрос не прошёл один из лимитов, он не считается ни в одном:
+    иначе отказы по минутному лимиту расходовали бы дневной.
+    """
+    now = time.time() if now is None else now
+    passed = []
+    for limit, period in map(parse_rate, rates):
+        retry_after = hit(scope, ident, limit, period, now)
+        if retry_after:
+            for counted in passed:
+                unhit(scope, ident, counted, now)
+            return retry_after
+        passed.append(period)
+    return 0
+
+
+def ratelimit(scope, key='user_or_ip', methods=('POST',)):
+    """Ограничить частоту запросов к view лимитами RATELIMITS[scope].
+
+    `key` — 'user', 'ip' или 'user_or_ip'. Для view за login_required
+    подходит 'user', для анонимных форм — 'ip': он не загружает сессию.
+    Запросы с методами не из `methods` не считаются; `None` — считать все.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if (getattr(settings, 'RATELIMIT_ENABLED', True)
+                    and (methods is None or request.method in methods)):
+                rates = settings.RATELIMITS.get(scope, ())
+                if isinstance(rates, str):
+                    rates = (rates,)
+                retry_after = check(scope, client_key(request, key), rates)
+                if retry_after:
+                    response = render(request, 'core/429.html', {
+                        'retry_after': retry_after,
+                    }, status=429)
+                    response['Retry-After'] = str(retry_after)
+                    return response
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,99 @@
+"""Чтение с реплик базы данных для страниц, которые ничего не пишут.
+
+Реплики перечислены в DATABASE_REPLICAS. Запрос читает с реплики, только
+если его view помечено декоратором `replica_reads` и метод безопасный.
+Любая запись идёт в основную базу и до конца запроса переключает чтение
+туда же. Кроме того, после записи посетителю ставится cookie, и
+REPLICA_PIN_SECONDS секунд все его запросы читают из основной базы: он
+сразу видит свои изменения, даже если реплика отстаёт.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+PIN_COOKIE = 'db_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_current = ContextVar('db_routing', default=None)
+
+
+class RoutingState:
+    """Куда читает текущий запрос."""
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.replica = None
+        self.wrote = False
+
+    def read_alias(self):
+        if self.pinned or self.wrote or self.replica is None:
+            return DEFAULT_DB_ALIAS
+        return self.replica
+
+
+def current():
+    """Состояние текущего запроса или None вне запроса."""
+    return _current.get()
+
+
+@contextmanager
+def routing(pinned=False, state=None):
+    """Состояние маршрутизации; `state` — продолжить начатый запрос."""
+    if state is None:
+        state = RoutingState(pinned)
+    token = _current.set(state)
+    try:
+        yield state
+    finally:
+        _current.reset(token)
+
+
+def use_replica():
+    """Читать с реплики до конца запроса, если нет записи и закрепления."""
+    state = _current.get()
+    replicas = getattr(settings, 'DATABASE_REPLICAS', ())
+    if state is not None and replicas and state.replica is None:
+        state.replica = random.choice(replicas)
+
+
+def reading_replica():
+    """Читает ли текущий запрос с реплики."""
+    state = _current.get()
+    return state is not None and state.read_alias() != DEFAULT_DB_ALIAS
+
+
+def replica_reads(view):
+    """Пометить view, которое только читает: его запросы идут на реплику."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        return view(*args, **kwargs)
+    wrapper.replica_reads = True
+    return wrapper
+
+
+class ReplicaRouter:
+    """Чтение по состоянию запроса, запись и миграции — в основную базу."""
+
+    def db_for_read(self, model, **hints):
+        state = _current.get()
+        if state is None:
+            return DEFAULT_DB_ALIAS
+        return state.read_alias()
+
+    def db_for_write(self, model, **hints):
+        state = _current.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики — копии основной базы, объекты из них можно связывать.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схема на реплики приходит репликацией.
+        return db not in getattr(settings, 'DATABASE_REPLICAS', ())
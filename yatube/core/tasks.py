@@ -0,0 +1,195 @@
+"""Очередь фоновых задач в базе данных.
+
+Задача — функция, помеченная декоратором `task`. `enqueue` ставит её в
+очередь после фиксации текущей транзакции, поэтому обработчик не увидит
+задачу раньше данных, ради которых она поставлена, а откат транзакции
+отменяет и задачу. Задачи с одинаковым ключом `key`, ещё не взятые в
+работу, схлопываются в одну.
+
+Задачи выполняет команда `run_tasks`; обработчиков может быть несколько.
+Взятая задача арендуется на TASKS_LEASE секунд: если обработчик упал,
+после аренды её заберёт другой. Упавшая задача повторяется с растущей
+паузой, пока не кончатся попытки. С TASKS_EAGER задачи выполняются сразу
+при постановке — так работают тесты и разработка без обработчика.
+"""
+import json
+import logging
+import time
+import traceback
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Min
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+TASKS_LEASE = getattr(settings, 'TASKS_LEASE', 60 * 5)
+STATS = ('done', 'failed', 'retried', 'deduplicated', 'wait_ms', 'run_ms')
+
+
+def task(max_attempts=3, retry_delay=10):
+    """Сделать функцию фоновой задачей: `func.enqueue(*args, key=...)`.
+
+    Аргументы задачи сохраняются в JSON, поэтому передаются id, а не
+    объекты. Пауза перед повтором удваивается с каждой попыткой.
+    """
+    def decorator(func):
+        func.task_name = f'{func.__module__}.{func.__name__}'
+        func.max_attempts = max_attempts
+        func.retry_delay = retry_delay
+        func.enqueue = partial(enqueue, func)
+        return func
+    return decorator
+
+
+def _stats_cache():
+    # Счётчики пишут и обработчики, и веб-процессы, поэтому нужен общий
+    # кэш, а не локальный уровень TwoLevelCache.
+    return caches[getattr(settings, 'TASKS_STATS_CACHE', 'default')]
+
+
+def record(**values):
+    stats = _stats_cache()
+    for name, value in values.items():
+        key = f'tasks:{name}'
+        try:
+            stats.incr(key, value)
+        except ValueError:
+            stats.add(key, 0, None)
+            stats.incr(key, value)
+
+
+def enqueue(func, *args, key=None, delay=0):
+    """Поставить задачу в очередь после фиксации транзакции."""
+    if getattr(settings, 'TASKS_EAGER', False):
+        func(*args)
+        return
+    payload = json.dumps(args)
+    transaction.on_commit(
+        lambda: _insert(func.task_name, payload, key, delay)
+    )
+
+
+def _insert(name, payload, key, delay):
+    now = timezone.now()
+    try:
+        with transaction.atomic():
+            Task.objects.create(
+                name=name, args=payload, key=key,
+                run_at=now + timedelta(seconds=delay), created=now
+            )
+    except IntegrityError:
+        # Такая же задача ещё ждёт в очереди.
+        record(deduplicated=1)
+
+
+def claim():
+    """Взять задачу, срок которой наступил; None, если таких нет."""
+    while True:
+        now = timezone.now()
+        with transaction.atomic():
+            task = Task.objects.select_for_update(skip_locked=True).filter(
+                status__in=(Task.QUEUED, Task.RUNNING), run_at__lte=now
+            ).order_by('run_at', 'pk').first()
+            if task is None:
+                return None
+            # Повторная задача с тем же ключом теперь встанет в очередь:
+            # эта уже может не увидеть изменений, ради которых её ставят.
+            taken = Task.objects.filter(
+                pk=task.pk, status=task.status, run_at=task.run_at
+            ).update(
+                status=Task.RUNNING, key=None, attempts=F('attempts') + 1,
+                run_at=now + timedelta(seconds=TASKS_LEASE)
+            )
+        if taken:
+            task.waited = now - task.run_at
+            task.attempts += 1
+            return task
+
+
+def run(task):
+    """Выполнить взятую задачу; False, если она упала."""
+    started = time.monotonic()
+    func = None
+    try:
+        func = import_string(task.name)
+        if getattr(func, 'task_name', None) != task.name:
+            raise ValueError(f'{task.name} не помечена декоратором task')
+        func(*json.loads(task.args))
+    except Exception:
+        logger.exception('Задача %s не выполнена', task)
+        _failed(task, func)
+        succeeded = False
+    else:
+        Task.objects.filter(pk=task.pk).delete()
+        record(done=1)
+        succeeded = True
+    record(
+        wait_ms=int(task.waited.total_seconds() * 1000),
+        run_ms=int((time.monotonic() - started) * 1000)
+    )
+    return succeeded
+
+
+def run_pending(limit=None):
+    """Выполнить задачи, срок которых наступил; вернуть их число."""
+    count = 0
+    while limit is None or count < limit:
+        task = claim()
+        if task is None:
+            break
+        run(task)
+        count += 1
+    return count
+
+
+def _failed(task, func):
+    max_attempts = getattr(func, 'max_attempts', 1)
+    error = traceback.format_exc()
+    if task.attempts >= max_attempts:
+        Task.objects.filter(pk=task.pk).update(
+            status=Task.FAILED, error=error
+        )
+        record(failed=1)
+        return
+    delay = func.retry_delay * 2 ** (task.attempts - 1)
+    Task.objects.filter(pk=task.pk).update(
+        status=Task.QUEUED, error=error,
+        run_at=timezone.now() + timedelta(seconds=delay)
+    )
+    record(retried=1)
+
+
+def queue_stats():
+    """Глубина очереди по состояниям и задачам, задержки выполнения."""
+    now = timezone.now()
+    depth = {
+        row['status']: row['count']
+        for row in Task.objects.values('status').annotate(count=Count('pk'))
+    }
+    queued = Task.objects.filter(status=Task.QUEUED)
+    oldest = queued.filter(run_at__lte=now).aggregate(
+        oldest=Min('run_at')
+    )['oldest']
+    totals = _stats_cache().get_many([f'tasks:{name}' for name in STATS])
+    totals = {name: totals.get(f'tasks:{name}', 0) for name in STATS}
+    runs = totals['done'] + totals['failed'] + totals['retried']
+    return {
+        'depth': depth,
+        'queued_by_name': dict(
+            queued.values_list('name').annotate(Count('pk')).order_by()
+        ),
+        'oldest_due_seconds': (
+            (now - oldest).total_seconds() if oldest else 0
+        ),
+        'totals': totals,
+        'avg_wait_ms': totals['wait_ms'] / runs if runs else None,
+        'avg_run_ms': totals['run_ms'] / runs if runs else None,
+    }
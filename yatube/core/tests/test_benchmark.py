@@ -0,0 +1,67 @@
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+
+from core import benchmark
+from core.management.commands.benchmark import Command
+
+
+class BenchmarkTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_every_route_is_measured(self):
+        sample = benchmark.seed(users=3, groups=2, posts=10, comments=5,
+                                follows=2)
+        routes = benchmark.build_routes(sample)
+        self.assertEqual(benchmark.missing_routes(routes), [])
+        results = benchmark.run(
+            routes, [benchmark.ClientDriver()], requests=2, warmup=0
+        )
+        self.assertEqual(len(results), len(routes))
+        detail = results['client:posts:post_detail']
+        self.assertGreater(detail['queries'], 0)
+        self.assertLessEqual(detail['p50_ms'], detail['p99_ms'])
+
+    def test_command_leaves_real_cache_alone(self):
+        cache.set('generation', 1, None)
+        caches['shared'].set('ratelimit', 3)
+        used = []
+
+        def measure(command, options):
+            used.append(caches['shared'].__class__.__name__)
+            cache.set('generation', 2, None)
+            return {}
+
+        command = 'core.management.commands.benchmark.'
+        with mock.patch.object(Command, 'measure', measure), \
+                mock.patch(command + 'setup_test_environment'), \
+                mock.patch(command + 'teardown_test_environment'), \
+                mock.patch.object(connection.creation, 'create_test_db'), \
+                mock.patch.object(connection.creation, 'destroy_test_db'):
+            call_command('benchmark', baseline='', stdout=StringIO())
+        self.assertEqual(used, ['LocMemCache'])
+        self.assertEqual(cache.get('generation'), 1)
+        self.assertEqual(caches['shared'].get('ratelimit'), 3)
+
+    def test_compare(self):
+        baseline = {'client:posts:index': {
+            'p50_ms': 1.0, 'p99_ms': 2.0, 'queries': 3, 'peak_kib': 100,
+        }}
+        same = dict(baseline['client:posts:index'])
+        self.assertEqual(
+            benchmark.compare({'client:posts:index': same}, baseline), []
+        )
+        worse = dict(same, queries=4, p50_ms=10.0, peak_kib=500)
+        self.assertEqual(
+            len(benchmark.compare({'client:posts:index': worse}, baseline)), 3
+        )
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(benchmark.percentile(values, 0.5), 50)
+        self.assertEqual(benchmark.percentile(values, 0.99), 99)
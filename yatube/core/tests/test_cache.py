@@ -0,0 +1,204 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from unittest import mock
+
+from django.conf import settings
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from core import cache as two_level
+from core.cache import LocalTier, SQLiteCache, TwoLevelCache
+from posts.models import User
+
+
+class TemporaryDirectoryMixin:
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(dir=settings.BASE_DIR)
+        self.path = os.path.join(self.directory, 'cache.sqlite3')
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+
+class SQLiteCacheTest(TemporaryDirectoryMixin, SimpleTestCase):
+    def backend(self, **options):
+        return SQLiteCache(self.path, {'OPTIONS': options})
+
+    def test_values(self):
+        cache = self.backend()
+        cache.set('page', {'content': b'<html>'})
+        cache.set('number', 5)
+        self.assertEqual(cache.get('page'), {'content': b'<html>'})
+        self.assertTrue(cache.add('new', 1))
+        self.assertFalse(cache.add('new', 2))
+        self.assertEqual(cache.incr('number', 2), 7)
+        self.assertEqual(cache.decr('number'), 6)
+        with self.assertRaises(ValueError):
+            cache.incr('missing')
+        self.assertEqual(
+            cache.get_many(['page', 'number', 'missing']),
+            {'page': {'content': b'<html>'}, 'number': 6}
+        )
+        cache.delete('page')
+        self.assertIsNone(cache.get('page'))
+
+    def test_expiry(self):
+        cache = self.backend()
+        cache.set('short', 1, 0.05)
+        cache.set('forever', 1, None)
+        time.sleep(0.1)
+        self.assertIsNone(cache.get('short'))
+        self.assertTrue(cache.add('short', 2))
+        self.assertEqual(cache.get('forever'), 1)
+
+    def test_cull_keeps_entries_without_timeout(self):
+        cache = self.backend(MAX_ENTRIES=50, CULL_FREQUENCY=2)
+        cache.set('generation', 1, None)
+        cache.set_many({f'page{n}': n for n in range(SQLiteCache.CULL_EVERY)})
+        count, = cache.connection.execute(
+            'SELECT COUNT(*) FROM cache'
+        ).fetchone()
+        self.assertLessEqual(count, 51)
+        self.assertEqual(cache.get('generation'), 1)
+
+    def test_incr_is_atomic_between_connections(self):
+        self.backend().set('counter', 0)
+        errors = []
+
+        def work():
+            # Своё соединение, как у отдельного процесса.
+            cache = self.backend()
+            try:
+                for _ in range(50):
+                    cache.incr('counter')
+            except Exception as error:
+                errors.append(error)
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(self.backend().get('counter'), 200)
+
+    def test_shared_backend_between_threads(self):
+        cache = self.backend()
+        cache.set('counter', 0)
+        errors = []
+
+        def work():
+            # Один объект кэша на все потоки, как в потоковом сервере.
+            try:
+                for n in range(100):
+                    cache.set(f'key{n}', n)
+                    cache.add(f'once{n}', n)
+                    cache.incr('counter')
+            except Exception as error:
+                errors.append(error)
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(cache.get('counter'), 800)
+
+
+class TwoLevelCacheTest(TemporaryDirectoryMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        caches_setting = dict(settings.CACHES, l2={
+            'BACKEND': 'core.cache.SQLiteCache', 'LOCATION': self.path,
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        })
+        override = override_settings(CACHES=caches_setting)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.addCleanup(two_level._tiers.pop, 'l2', None)
+        self.first = self.process()
+        self.second = self.process()
+
+    def process(self):
+        """Кэш с собственным LRU, как в отдельном процессе."""
+        cache = TwoLevelCache('l2', {'OPTIONS': {'SYNC_INTERVAL': 3600}})
+        cache.tier = LocalTier(100)
+        return cache
+
+    def test_reads_from_local_tier(self):
+        self.first.set('key', 'value')
+        self.assertEqual(self.first.get('key'), 'value')
+        self.assertEqual(self.second.get('key'), 'value')
+        self.assertEqual(self.second.get('key'), 'value')
+        self.assertEqual(self.first.tier.stats['local_hits'], 1)
+        self.assertEqual(self.second.tier.stats['shared_hits'], 1)
+        self.assertEqual(self.second.tier.stats['local_hits'], 1)
+
+    def test_invalidation_between_processes(self):
+        self.first.set('key', 1)
+        self.first.set('generation', 1, None)
+        self.second.sync()
+        self.assertEqual(
+            self.second.get_many(['key', 'generation']),
+            {'key': 1, 'generation': 1}
+        )
+        self.first.set('key', 2)
+        self.first.incr('generation')
+        # До чтения журнала второй процесс видит свою копию.
+        self.assertEqual(self.second.get('key'), 1)
+        self.second.sync()
+        self.assertEqual(self.second.get('key'), 2)
+        self.assertEqual(self.second.get('generation'), 2)
+        self.assertEqual(self.second.tier.stats['invalidated'], 2)
+        self.first.delete('key')
+        self.second.sync()
+        self.assertIsNone(self.second.get('key'))
+
+    def test_read_racing_invalidation_is_not_kept(self):
+        self.first.set('key', 1)
+        self.second.sync()
+        shared_get = self.second.shared.get
+
+        def racing_get(key, *args, **kwargs):
+            value = shared_get(key, *args, **kwargs)
+            if key == 'key':
+                # Пока значение в пути, другой процесс его меняет, а этот
+                # успевает прочитать журнал.
+                self.first.set('key', 2)
+                self.second.sync()
+            return value
+
+        with mock.patch.object(self.second.shared, 'get', racing_get):
+            self.assertEqual(self.second.get('key'), 1)
+        self.assertEqual(self.second.get('key'), 2)
+        self.assertEqual(self.second.tier.stats['stale_reads'], 1)
+
+    def test_clear_flushes_other_processes(self):
+        self.first.set('key', 1)
+        self.second.sync()
+        self.second.get('key')
+        self.first.clear()
+        self.second.sync()
+        self.assertIsNone(self.second.get('key'))
+        self.assertEqual(self.second.tier.stats['flushes'], 1)
+
+    def test_local_tier_is_bounded(self):
+        self.first.set_many({f'key{n}': n for n in range(150)})
+        self.assertEqual(len(self.first.tier.entries), 100)
+        self.assertEqual(self.first.get('key0'), 0)
+
+
+class CacheMetricsViewTest(TestCase):
+    def test_staff_only(self):
+        url = reverse('cache_metrics')
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.client.force_login(
+            User.objects.create_user(username='staff', is_staff=True)
+        )
+        self.client.get(reverse('posts:index'))
+        data = json.loads(self.client.get(url).content)
+        self.assertIn('shared', data)
+        self.assertIn('hit_rate', data['shared'])
@@ -0,0 +1,99 @@
+import os
+import shutil
+import tempfile
+import threading
+from unittest import mock
+
+from django.conf import settings
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+
+from core.backends.sqlite3.base import DatabaseWrapper
+from core.db import check_connections
+
+
+class SqliteBackendTest(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(dir=settings.BASE_DIR)
+        self.settings_dict = dict(
+            connection.settings_dict,
+            NAME=os.path.join(self.directory, 'test.sqlite3')
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def connect(self):
+        db = DatabaseWrapper(dict(self.settings_dict))
+        db.ensure_connection()
+        self.addCleanup(db.close)
+        return db
+
+    def pragma(self, db, name):
+        with db.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_pragmas(self):
+        db = self.connect()
+        self.assertEqual(self.pragma(db, 'journal_mode'), 'wal')
+        # NORMAL
+        self.assertEqual(self.pragma(db, 'synchronous'), 1)
+        self.assertEqual(
+            self.pragma(db, 'cache_size'),
+            self.settings_dict['PRAGMAS']['cache_size']
+        )
+
+    def test_concurrent_writers(self):
+        """Транзакции «прочитать и записать» из потоков не падают."""
+        with self.connect().cursor() as cursor:
+            cursor.execute('CREATE TABLE counter (value INTEGER)')
+            cursor.execute('INSERT INTO counter VALUES (0)')
+        errors = []
+
+        def work():
+            db = DatabaseWrapper(dict(self.settings_dict))
+            try:
+                for _ in range(20):
+                    # Так начинает транзакцию transaction.atomic().
+                    db._start_transaction_under_autocommit()
+                    with db.cursor() as cursor:
+                        cursor.execute('SELECT value FROM counter')
+                        value = cursor.fetchone()[0]
+                        cursor.execute(
+                            'UPDATE counter SET value = %s', [value + 1]
+                        )
+                        cursor.execute('COMMIT')
+            except Exception as error:
+                errors.append(error)
+            finally:
+                db.close()
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        with self.connect().cursor() as cursor:
+            cursor.execute('SELECT value FROM counter')
+            self.assertEqual(cursor.fetchone()[0], 80)
+
+
+class HealthCheckTest(TestCase):
+    def test_broken_connection_is_closed(self):
+        broken = mock.Mock(
+            settings_dict={'CONN_HEALTH_CHECKS': True},
+            in_atomic_block=False
+        )
+        broken.is_usable.return_value = False
+        with mock.patch('core.db.connections') as connections:
+            connections.all.return_value = [broken]
+            check_connections()
+        broken.close.assert_called_once_with()
+
+    def test_connection_is_kept_between_requests(self):
+        self.client.get('/about/tech/')
+        first = connection.connection
+        self.client.get('/about/tech/')
+        self.assertIs(connection.connection, first)
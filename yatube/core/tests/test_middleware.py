@@ -0,0 +1,89 @@
+import json
+import re
+
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from core import metrics
+from posts.models import Post, User
+
+METRICS_URL = reverse('performance_metrics')
+
+
+@override_settings(PERFORMANCE_SAMPLE_RATE=1)
+class PerformanceMiddlewareTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='timed')
+        cls.post = Post.objects.create(author=cls.user, text='Замер')
+        cls.staff = User.objects.create_user(username='staff', is_staff=True)
+
+    def setUp(self):
+        cache.clear()
+        metrics.reset()
+        self.client = Client()
+
+    def timing(self, response):
+        parts = {}
+        for part in re.split(r', (?=\w+;)', response['Server-Timing']):
+            name, *params = part.split(';')
+            parts[name] = dict(p.split('=', 1) for p in params)
+        return parts
+
+    def test_server_timing_header(self):
+        response = self.client.get(
+            reverse('posts:post_detail', args=[self.post.pk])
+        )
+        timing = self.timing(response)
+        self.assertEqual(
+            set(timing), {'total', 'db', 'tpl', 'cache'}
+        )
+        self.assertGreater(float(timing['tpl']['dur']), 0)
+        self.assertLessEqual(
+            float(timing['db']['dur']), float(timing['total']['dur'])
+        )
+        self.assertRegex(timing['db']['desc'], r'"[1-9]\d* queries')
+
+    def test_cache_hits_and_misses(self):
+        url = reverse('posts:index')
+        miss = self.timing(self.client.get(url))['cache']['desc']
+        hit = self.timing(self.client.get(url))['cache']['desc']
+        self.assertNotIn(' 0 misses', miss)
+        self.assertEqual(hit, '"1 hits, 0 misses"')
+
+    def test_duplicate_queries(self):
+        current = metrics.RequestMetrics()
+
+        def execute(sql, params, many, context):
+            return None
+
+        for params in ([1], [1], [2]):
+            current.execute(execute, 'SELECT %s', params, False, {})
+        self.assertEqual((current.queries, current.duplicates), (3, 1))
+
+    def test_streaming_response_is_measured_to_the_end(self):
+        response = self.client.get(reverse('posts:api_posts'))
+        self.assertIn('Server-Timing', response)
+        self.assertEqual(metrics.snapshot(), {})
+        b''.join(response.streaming_content)
+        stats = metrics.snapshot()['posts:api_posts']
+        self.assertEqual(stats['requests'], 1)
+        # Посты читаются во время отдачи тела, и этот запрос учтён.
+        self.assertGreaterEqual(stats['avg_queries'], 1)
+
+    @override_settings(PERFORMANCE_SAMPLE_RATE=0)
+    def test_not_sampled(self):
+        response = self.client.get(reverse('posts:index'))
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(metrics.snapshot(), {})
+
+    def test_metrics_endpoint(self):
+        self.client.get(reverse('posts:post_detail', args=[self.post.pk]))
+        self.assertEqual(self.client.get(METRICS_URL).status_code, 404)
+        self.client.force_login(self.staff)
+        data = json.loads(self.client.get(METRICS_URL).content)
+        detail = data['posts:post_detail']
+        self.assertEqual(detail['requests'], 1)
+        self.assertGreater(detail['avg_queries'], 0)
+        self.assertLess(detail['avg_overhead_ms'], detail['avg_total_ms'])
@@ -0,0 +1,119 @@
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+
+from core.ratelimit import check, client_key, hit, parse_rate
+from posts.models import Comment, Post, User
+
+
+class SlidingWindowTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_parse_rate(self):
+        self.assertEqual(parse_rate('10/m'), (10, 60))
+        self.assertEqual(parse_rate('5/d'), (5, 86400))
+
+    def test_window(self):
+        with self.assertNumQueries(0):
+            results = [hit('test', 'ip:1', 3, 60, now=600) for _ in range(4)]
+        self.assertEqual(results[:3], [0, 0, 0])
+        # Ждать конца окна и ещё треть следующего, пока доля трёх
+        # запросов не опустится до двух.
+        self.assertEqual(results[3], 80)
+        self.assertEqual(hit('test', 'ip:1', 3, 60, now=679), 1)
+        self.assertEqual(hit('test', 'ip:1', 3, 60, now=680), 0)
+        self.assertEqual(hit('test', 'ip:2', 3, 60, now=600), 0)
+
+    def test_previous_window_decays(self):
+        for _ in range(3):
+            hit('test', 'ip:1', 3, 60, now=600)
+        # Половина прошлого окна — 1.5 запроса, ещё один помещается.
+        self.assertEqual(hit('test', 'ip:1', 3, 60, now=690), 0)
+        self.assertEqual(hit('test', 'ip:1', 3, 60, now=690), 10)
+        self.assertEqual(hit('test', 'ip:1', 3, 60, now=700), 0)
+
+    @override_settings(RATELIMIT_IP_META='HTTP_X_FORWARDED_FOR')
+    def test_forwarded_address(self):
+        request = RequestFactory().get(
+            '/', HTTP_X_FORWARDED_FOR='1.1.1.1, 10.0.0.5, 10.0.0.9'
+        )
+        # Первый адрес мог подставить сам клиент.
+        self.assertEqual(client_key(request, 'ip'), 'ip:10.0.0.9')
+        with self.settings(RATELIMIT_PROXY_HOPS=2):
+            self.assertEqual(client_key(request, 'ip'), 'ip:10.0.0.5')
+        with self.settings(RATELIMIT_PROXY_HOPS=5):
+            self.assertEqual(client_key(request, 'ip'), 'ip:1.1.1.1')
+
+    def test_rejected_request_is_not_counted_anywhere(self):
+        rates = ('2/m', '3/h')
+        for _ in range(2):
+            self.assertEqual(check('test', 'ip:1', rates, now=3600), 0)
+        self.assertGreater(check('test', 'ip:1', rates, now=3600), 0)
+        # Отказ по минутному лимиту не израсходовал часовой.
+        self.assertEqual(check('test', 'ip:1', rates, now=3720), 0)
+        self.assertGreater(check('test', 'ip:1', rates, now=3720), 0)
+        # И отказ по часовому не оставил запрос в минутном.
+        self.assertEqual(hit('test', 'ip:1', 2, 60, now=3720), 0)
+
+
+@override_settings(RATELIMITS={'add_comment': '2/m', 'signup': '1/h',
+                               'follow': '1/m'})
+class RateLimitedViewsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='flooder')
+        cls.author = User.objects.create_user(username='author')
+        cls.post = Post.objects.create(author=cls.author, text='Пост')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def test_comment_flood(self):
+        url = reverse('posts:add_comment', args=[self.post.pk])
+        for _ in range(2):
+            self.assertEqual(
+                self.client.post(url, {'text': 'Спам'}).status_code, 302
+            )
+        response = self.client.post(url, {'text': 'Спам'})
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 0)
+        self.assertEqual(Comment.objects.count(), 2)
+        # Чтение не ограничивается.
+        self.assertEqual(
+            self.client.get(
+                reverse('posts:post_detail', args=[self.post.pk])
+            ).status_code, 200
+        )
+
+    def test_limits_are_per_user(self):
+        url = reverse('posts:profile_follow', args=[self.author.username])
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.assertEqual(self.client.get(url).status_code, 429)
+        self.client.force_login(self.author)
+        self.assertEqual(
+            self.client.get(reverse(
+                'posts:profile_unfollow', args=[self.user.username]
+            )).status_code, 302
+        )
+
+    def test_signup_by_address(self):
+        self.client.logout()
+        url = reverse('users:signup')
+        self.assertEqual(self.client.get(url).status_code, 200)
+        data = {'username': 'new', 'password1': 'Secret-123-pass',
+                'password2': 'Secret-123-pass'}
+        self.client.post(url, data)
+        response = self.client.post(url, data, REMOTE_ADDR='127.0.0.1')
+        self.assertEqual(response.status_code, 429)
+        self.assertNotEqual(
+            self.client.post(url, data, REMOTE_ADDR='10.0.0.2').status_code,
+            429
+        )
+
+    @override_settings(RATELIMIT_ENABLED=False)
+    def test_disabled(self):
+        url = reverse('posts:profile_follow', args=[self.author.username])
+        for _ in range(3):
+            self.assertEqual(self.client.get(url).status_code, 302)
@@ -0,0 +1,118 @@
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from core import routers
+from posts.models import Group, Post, User
+
+REPLICA = 'replica'
+
+
+@override_settings(DATABASE_REPLICAS=[REPLICA], REPLICA_PIN_SECONDS=5)
+class ReplicaRouterTest(TestCase):
+    """Основная база — тестовая default, реплика — отдельный файл SQLite.
+
+    Реплика получает копию основной базы до начала тестов, а всё, что
+    тесты пишут потом, попадает только в основную: так выглядит реплика,
+    которая отстаёт от записи.
+    """
+
+    databases = {'default', REPLICA}
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp(dir=settings.BASE_DIR)
+        path = os.path.join(cls.directory, 'replica.sqlite3')
+        primary = connections['default']
+        primary.ensure_connection()
+        with sqlite3.connect(path) as replica:
+            primary.connection.backup(replica)
+        connections.databases[REPLICA] = dict(
+            primary.settings_dict, NAME=path, TEST={}
+        )
+        connections.ensure_defaults(REPLICA)
+        connections.prepare_test_settings(REPLICA)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections[REPLICA].close()
+        del connections.databases[REPLICA]
+        delattr(connections._connections, REPLICA)
+        shutil.rmtree(cls.directory, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.group = Group.objects.create(
+            title='Свежая', slug='fresh', description='Только в основной'
+        )
+
+    def fresh_group_visible(self):
+        return Group.objects.filter(slug='fresh').exists()
+
+    def test_reads_primary_outside_request(self):
+        self.assertTrue(self.fresh_group_visible())
+
+    def test_write_switches_reads_to_primary(self):
+        with routers.routing():
+            routers.use_replica()
+            self.assertTrue(routers.reading_replica())
+            self.assertFalse(self.fresh_group_visible())
+            Group.objects.create(title='Ещё', slug='more', description='')
+            self.assertFalse(routers.reading_replica())
+            self.assertTrue(self.fresh_group_visible())
+
+    def test_pinned_request_reads_primary(self):
+        with routers.routing(pinned=True):
+            routers.use_replica()
+            self.assertTrue(self.fresh_group_visible())
+
+    def test_read_only_view_reads_replica(self):
+        url = reverse('posts:group_list', args=[self.group.slug])
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.client.post(url).status_code, 200)
+        self.client.cookies[routers.PIN_COOKIE] = '1'
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_streamed_rows_come_from_replica(self):
+        Post.objects.create(
+            author=User.objects.create_user(username='fresh_author'),
+            text='Только в основной'
+        )
+        response = self.client.get(reverse('posts:api_posts'))
+        data = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(data['results'], [])
+        response = self.client.get(reverse('posts:index_atom'))
+        self.assertNotIn(
+            'Только в основной',
+            b''.join(response.streaming_content).decode()
+        )
+
+    def test_write_pins_visitor_to_primary(self):
+        user = User.objects.create_user(username='reader')
+        author = User.objects.create_user(username='writer')
+        client = Client()
+        client.force_login(user)
+        response = client.get(
+            reverse('posts:profile_follow', args=[author.username])
+        )
+        cookie = response.cookies[routers.PIN_COOKIE]
+        self.assertEqual(cookie['max-age'], 5)
+        response = client.get(
+            reverse('posts:group_list', args=[self.group.slug])
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_no_migrations_on_replica(self):
+        router = routers.ReplicaRouter()
+        self.assertFalse(router.allow_migrate(REPLICA, 'posts'))
+        self.assertTrue(router.allow_migrate('default', 'posts'))
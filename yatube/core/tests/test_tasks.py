@@ -0,0 +1,142 @@
+import json
+from datetime import timedelta
+from io import StringIO
+
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from core import tasks
+from core.models import Task
+from posts.models import Follow, Post, User
+from posts.search import filter_posts
+
+calls = []
+
+
+@tasks.task()
+def remember(value):
+    calls.append(value)
+
+
+@tasks.task(max_attempts=2, retry_delay=60)
+def explode():
+    raise RuntimeError('Сбой')
+
+
+@override_settings(TASKS_EAGER=False)
+class TaskQueueTest(TransactionTestCase):
+    def setUp(self):
+        calls.clear()
+        caches['shared'].clear()
+
+    def test_enqueued_after_commit(self):
+        with transaction.atomic():
+            remember.enqueue(1)
+            self.assertFalse(Task.objects.exists())
+        self.assertEqual(Task.objects.get().args, '[1]')
+        try:
+            with transaction.atomic():
+                remember.enqueue(2)
+                raise ValueError
+        except ValueError:
+            pass
+        self.assertEqual(Task.objects.count(), 1)
+
+    def test_deduplication_key(self):
+        for value in range(3):
+            remember.enqueue(value, key='same')
+        self.assertEqual(tasks.run_pending(), 1)
+        self.assertEqual(calls, [0])
+        self.assertEqual(tasks.queue_stats()['totals']['deduplicated'], 2)
+
+    def test_run_pending(self):
+        remember.enqueue('now')
+        remember.enqueue('later', delay=60)
+        self.assertEqual(tasks.run_pending(), 1)
+        self.assertEqual(calls, ['now'])
+        stats = tasks.queue_stats()
+        self.assertEqual(stats['depth'], {Task.QUEUED: 1})
+        self.assertEqual(stats['totals']['done'], 1)
+
+    def test_retry_then_fail(self):
+        explode.enqueue()
+        with self.assertLogs('core.tasks', 'ERROR'):
+            self.assertEqual(tasks.run_pending(), 1)
+        task = Task.objects.get()
+        self.assertEqual((task.status, task.attempts), (Task.QUEUED, 1))
+        self.assertGreater(task.run_at, timezone.now())
+        self.assertIn('Сбой', task.error)
+        Task.objects.update(run_at=timezone.now())
+        with self.assertLogs('core.tasks', 'ERROR'):
+            tasks.run_pending()
+        task = Task.objects.get()
+        self.assertEqual((task.status, task.attempts), (Task.FAILED, 2))
+        self.assertEqual(tasks.run_pending(), 0)
+        totals = tasks.queue_stats()['totals']
+        self.assertEqual((totals['retried'], totals['failed']), (1, 1))
+
+    def test_expired_lease_is_taken_again(self):
+        remember.enqueue('lost')
+        self.assertIsNotNone(tasks.claim())
+        self.assertIsNone(tasks.claim())
+        Task.objects.update(run_at=timezone.now() - timedelta(seconds=1))
+        task = tasks.claim()
+        self.assertEqual(task.attempts, 2)
+        tasks.run(task)
+        self.assertEqual(calls, ['lost'])
+        self.assertFalse(Task.objects.exists())
+
+    def test_only_registered_tasks_run(self):
+        Task.objects.create(name='os.remove', args=json.dumps(['x']))
+        with self.assertLogs('core.tasks', 'ERROR'):
+            tasks.run_pending()
+        self.assertEqual(Task.objects.get().status, Task.FAILED)
+
+    def test_worker_command(self):
+        remember.enqueue('worker')
+        output = StringIO()
+        call_command('run_tasks', once=True, stdout=output)
+        self.assertEqual(calls, ['worker'])
+        self.assertIn('1', output.getvalue())
+
+    def test_post_side_effects_are_queued(self):
+        author = User.objects.create_user(username='queued')
+        self.client.force_login(author)
+        self.client.post(reverse('posts:post_create'), {'text': 'Очередь'})
+        post = Post.objects.get()
+        self.assertEqual(
+            set(Task.objects.values_list('name', flat=True)),
+            {'posts.search.index_post', 'posts.timeline.fan_out'}
+        )
+        self.assertFalse(filter_posts(Post.objects.all(), 'очередь'))
+        tasks.run_pending()
+        self.assertEqual(
+            list(filter_posts(Post.objects.all(), 'очередь')), [post]
+        )
+
+    def test_follow_backfill_is_queued(self):
+        reader = User.objects.create_user(username='reader')
+        author = User.objects.create_user(username='author')
+        Follow.objects.create(user=reader, author=author)
+        task = Task.objects.get()
+        self.assertEqual(
+            (task.name, task.key),
+            ('posts.timeline.backfill', f'backfill:{reader.pk}:{author.pk}')
+        )
+
+    def test_metrics_view(self):
+        url = reverse('task_metrics')
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.client.force_login(
+            User.objects.create_user(username='staff', is_staff=True)
+        )
+        remember.enqueue('metric')
+        data = json.loads(self.client.get(url).content)
+        self.assertEqual(data['depth'], {Task.QUEUED: 1})
+        self.assertEqual(
+            data['queued_by_name'], {'core.tests.test_tasks.remember': 1}
+        )
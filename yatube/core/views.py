@@ -1,5 +1,9 @@
+from django.http import Http404, JsonResponse
 from django.shortcuts import render
 
+from . import metrics, tasks
+from .cache import cache_stats, reset_stats
+
 
 def page_not_found(request, exception):
     # Переменная exception содержит отладочную информацию;
@@ -9,3 +13,32 @@ def page_not_found(request, exception):
 
 def csrf_failure(request, reason=''):
     return render(request, 'core/403csrf.html')
+
+
+def performance_metrics(request):
+    """Сводка замеров по страницам; доступна только персоналу."""
+    if not request.user.is_staff:
+        raise Http404
+    data = metrics.snapshot()
+    if request.GET.get('reset'):
+        metrics.reset()
+    return JsonResponse(data, json_dumps_params={'ensure_ascii': False})
+
+
+def cache_metrics(request):
+    """Попадания в двухуровневый кэш; доступны только персоналу."""
+    if not request.user.is_staff:
+        raise Http404
+    data = cache_stats()
+    if request.GET.get('reset'):
+        reset_stats()
+    return JsonResponse(data, json_dumps_params={'ensure_ascii': False})
+
+
+def task_metrics(request):
+    """Глубина очереди задач и задержки; доступны только персоналу."""
+    if not request.user.is_staff:
+        raise Http404
+    return JsonResponse(
+        tasks.queue_stats(), json_dumps_params={'ensure_ascii': False}
+    )
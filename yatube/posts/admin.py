@@ -1,14 +1,36 @@
 from django.contrib import admin
 
 from .models import Post, Group
+from .paginators import EstimatedCountPaginator
+from .search import filter_posts
 
 
 class PostAdmin(admin.ModelAdmin):
     list_display = ('pk', 'text', 'pub_date', 'author', 'group',)
     list_editable = ('group',)
     search_fields = ('text',)
+    # Фильтр по дате строит диапазон pub_date__gte/__lt по индексу.
     list_filter = ('pub_date',)
+    list_select_related = ('author', 'group')
     empty_value_display = '-пусто-'
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        formfield = super().formfield_for_foreignkey(
+            db_field, request, **kwargs
+        )
+        if db_field.name == 'group':
+            # Один список групп на все строки changelist вместо запроса
+            # на каждый выпадающий список.
+            formfield.choices = list(formfield.choices)
+        return formfield
+
+    def get_search_results(self, request, queryset, search_term):
+        # Поиск по поисковому индексу вместо LIKE по всей таблице.
+        if not search_term:
+            return queryset, False
+        return filter_posts(queryset, search_term), False
 
 
 admin.site.register(Post, PostAdmin)
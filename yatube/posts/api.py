@@ -0,0 +1,217 @@
+"""JSON API только для чтения: ленты, пост и его комментарии.
+
+Строки выбираются через queryset.values() — без создания моделей и только
+с колонками полей из параметра `fields=`, а автор и группа присоединяются,
+только если их поля запрошены. Ленты отдаются потоком: каждая строка
+сериализуется по мере чтения из базы, а курсор следующей страницы
+дописывается в конце ответа. Ответы не зависят от посетителя, поэтому
+API не читает сессию и пользователя, а страницы лент кэшируются для всех.
+"""
+import json
+
+from django.core.exceptions import ValidationError
+from django.db import router
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.views.decorators.http import condition, require_safe
+
+from core.routers import replica_reads
+
+from .caching import feed_page, make_etag, post_last_modified, post_state
+from .models import Comment, Group, Post, User
+from .paginators import CursorPaginator
+from .storage import post_image_storage
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 100
+# Сколько байт сериализованных строк копится перед отправкой.
+CHUNK_SIZE = 8192
+
+
+def _isoformat(value):
+    return value.isoformat()
+
+
+def _image_url(name):
+    return post_image_storage.url(name) if name else None
+
+
+# Поле ответа -> (колонка values(), преобразование значения).
+POST_FIELDS = {
+    'id': ('pk', None),
+    'text': ('text', None),
+    'pub_date': ('pub_date', _isoformat),
+    'author': ('author__username', None),
+    'group': ('group__slug', None),
+    'image': ('image', _image_url),
+    'comment_count': ('comment_count', None),
+}
+COMMENT_FIELDS = {
+    'id': ('pk', None),
+    'text': ('text', None),
+    'created': ('create', _isoformat),
+    'author': ('author__username', None),
+}
+
+
+def post_etag(request, post_id):
+    """ETag поста без части посетителя: ответы API ни от кого не зависят."""
+    state = post_state(request, post_id)
+    if state is not None:
+        return make_etag('api', post_id, state[0])
+
+
+def parse_fields(request, available):
+    """Запрошенные поля в порядке `available`."""
+    raw = request.GET.get('fields')
+    if not raw:
+        return list(available)
+    requested = {name.strip() for name in raw.split(',') if name.strip()}
+    unknown = requested - available.keys()
+    if unknown or not requested:
+        raise ValidationError(
+            'Неизвестные поля: {}. Доступны: {}'.format(
+                ', '.join(sorted(unknown)) or '—', ', '.join(available)
+            )
+        )
+    return [name for name in available if name in requested]
+
+
+def parse_limit(request):
+    try:
+        limit = int(request.GET.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise ValidationError('limit должен быть числом')
+    return min(max(limit, 1), MAX_LIMIT)
+
+
+def serializer(fields, available):
+    """Колонки для values() и функция, превращающая строку в словарь."""
+    spec = [(name, *available[name]) for name in fields]
+    columns = list(dict.fromkeys(column for _, column, _ in spec))
+
+    def serialize(row):
+        return {
+            name: convert(row[column]) if convert else row[column]
+            for name, column, convert in spec
+        }
+    return columns, serialize
+
+
+def bad_request(error):
+    return JsonResponse(
+        {'error': ' '.join(error.messages)}, status=400,
+        json_dumps_params={'ensure_ascii': False}
+    )
+
+
+def _dumps(data):
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+
+def stream_page(paginator, rows, limit, serialize):
+    """Куски JSON страницы: строки по мере чтения, затем курсор."""
+    yield '{"results":['
+    buffer = ''
+    last = None
+    for number, row in enumerate(rows[:limit + 1].iterator()):
+        if number == limit:
+            break
+        if last is not None:
+            buffer += ','
+        buffer += _dumps(serialize(row))
+        last = row
+        if len(buffer) >= CHUNK_SIZE:
+            yield buffer
+            buffer = ''
+    else:
+        # Строки кончились раньше: следующей страницы нет.
+        last = None
+    cursor = paginator.encode_cursor(last, paginator.AFTER) if last else None
+    yield buffer + '],"next":' + _dumps(cursor) + '}'
+
+
+def feed_response(request, queryset, available, keys=('pub_date', 'pk')):
+    """Потоковый ответ со страницей queryset после курсора из запроса."""
+    try:
+        fields = parse_fields(request, available)
+        limit = parse_limit(request)
+    except ValidationError as error:
+        return bad_request(error)
+    columns, serialize = serializer(fields, available)
+    # Строки читаются уже после выхода из view: база выбирается сейчас,
+    # пока действует маршрутизация запроса.
+    queryset = queryset.using(router.db_for_read(queryset.model))
+    paginator = CursorPaginator(
+        queryset.values(*dict.fromkeys(columns + list(keys))), limit,
+        keys=keys
+    )
+    rows = paginator.rows_after(request.GET.get('cursor'))
+    if rows is None:
+        return bad_request(ValidationError('Некорректный курсор'))
+    return StreamingHttpResponse(
+        stream_page(paginator, rows, limit, serialize),
+        content_type='application/json'
+    )
+
+
+@replica_reads
+@require_safe
+@feed_page('index', per_user=False)
+def posts(request):
+    """Общая лента."""
+    return feed_response(request, Post.objects.all(), POST_FIELDS)
+
+
+@replica_reads
+@require_safe
+@feed_page('group:{slug}', per_user=False)
+def group_posts(request, slug):
+    """Лента группы."""
+    group = get_object_or_404(Group.objects.only('pk'), slug=slug)
+    return feed_response(
+        request, Post.objects.filter(group_id=group.pk), POST_FIELDS
+    )
+
+
+@replica_reads
+@require_safe
+@feed_page('author:{username}', per_user=False)
+def profile_posts(request, username):
+    """Лента автора."""
+    author = get_object_or_404(User.objects.only('pk'), username=username)
+    return feed_response(
+        request, Post.objects.filter(author_id=author.pk), POST_FIELDS
+    )
+
+
+@replica_reads
+@require_safe
+@condition(etag_func=post_etag, last_modified_func=post_last_modified)
+def post(request, post_id):
+    """Один пост."""
+    try:
+        fields = parse_fields(request, POST_FIELDS)
+    except ValidationError as error:
+        return bad_request(error)
+    columns, serialize = serializer(fields, POST_FIELDS)
+    row = Post.objects.filter(pk=post_id).values(*columns).first()
+    if row is None:
+        raise Http404
+    return JsonResponse(
+        serialize(row), json_dumps_params={'ensure_ascii': False}
+    )
+
+
+@replica_reads
+@require_safe
+@condition(etag_func=post_etag, last_modified_func=post_last_modified)
+def post_comments(request, post_id):
+    """Комментарии поста, новые сверху."""
+    # Состояние поста уже прочитано для ETag: без лишнего запроса.
+    if post_state(request, post_id) is None:
+        raise Http404
+    return feed_response(
+        request, Comment.objects.filter(post_id=post_id), COMMENT_FIELDS,
+        keys=('create', 'pk')
+    )
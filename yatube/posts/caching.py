@@ -0,0 +1,274 @@
+"""Кэширование отрендеренных лент: карточки постов и целые страницы.
+
+Карточка поста кэшируется по ключу из `post.id` и `post.version`. Версия
+увеличивается при каждом изменении, которое видно в карточке (правка поста,
+новый комментарий, смена имени автора или адреса группы), поэтому
+устаревший фрагмент никогда не будет прочитан, а свежий общий для всех
+пользователей и страниц.
+
+Страницы лент для анонимных посетителей кэшируются целиком. В ключ страницы
+входит номер поколения ленты, который увеличивается при каждом изменении её
+постов, поэтому сброс происходит сразу, а не по истечении TTL.
+"""
+import hashlib
+import threading
+import time
+from collections import Counter
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+from django.db.models.functions import Now
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                patch_vary_headers)
+from django.utils.http import http_date, quote_etag
+
+from core import metrics
+from core.routers import reading_replica
+
+from .follows import following
+from .models import Post
+
+POST_CARD_TIMEOUT = getattr(settings, 'POST_CARD_TIMEOUT', 60 * 60 * 24)
+POST_CARD_TEMPLATE = 'includes/post_card.html'
+PAGE_CACHE_TIMEOUT = getattr(settings, 'PAGE_CACHE_TIMEOUT', 60 * 60)
+# Поколение, общее для всех лент: меняется, когда правка затрагивает
+# страницы, которые нельзя перечислить (переименование автора или группы).
+SITE_FEED = 'site'
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def count(name):
+    with _stats_lock:
+        _stats[name] += 1
+    metrics.record_cache(name)
+
+
+def cache_stats():
+    """Счётчики попаданий и промахов кэша в текущем процессе."""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def bump_post_versions(**filters):
+    """Сбросить кэш карточек постов, подходящих под фильтр."""
+    Post.objects.filter(**filters).update(
+        version=F('version') + 1, updated=Now()
+    )
+
+
+def post_card_key(post, template=POST_CARD_TEMPLATE):
+    return 'post_card:{}:{}:{}:{}'.format(
+        template, post.pk, post.version, post.pub_date.timestamp()
+    )
+
+
+def render_post_card(post, template=POST_CARD_TEMPLATE):
+    key = post_card_key(post, template)
+    html = cache.get(key)
+    if html is not None:
+        count('post_card.hit')
+        return html
+    count('post_card.miss')
+    html = render_to_string(template, {'post': post})
+    cache.set(key, html, POST_CARD_TIMEOUT)
+    return html
+
+
+def _generation_key(feed):
+    return f'feed_gen:{feed}'
+
+
+def _time_key(feed):
+    return f'feed_time:{feed}'
+
+
+def feed_state(*feeds):
+    """Поколения лент и время их последнего изменения за одно обращение."""
+    keys = [_generation_key(feed) for feed in feeds]
+    times = [_time_key(feed) for feed in feeds]
+    found = cache.get_many(keys + times)
+    for key in keys:
+        if key in found:
+            continue
+        # Поколение начинается со времени, чтобы после вытеснения ключа
+        # из кэша не повторить номер, под которым уже лежат страницы.
+        value = int(time.time() * 1000)
+        if not cache.add(key, value, None):
+            value = cache.get(key, value)
+        found[key] = value
+    changed = [found[key] for key in times if key in found]
+    return [found[key] for key in keys], max(changed, default=None)
+
+
+def feed_generations(*feeds):
+    """Текущие поколения лент одним обращением к кэшу."""
+    return feed_state(*feeds)[0]
+
+
+def bump_feeds(*feeds):
+    """Сбросить кэш страниц перечисленных лент."""
+    for feed in feeds:
+        try:
+            cache.incr(_generation_key(feed))
+        except ValueError:
+            feed_generations(feed)
+            cache.incr(_generation_key(feed))
+    now = int(time.time())
+    cache.set_many({_time_key(feed): now for feed in feeds}, None)
+
+
+def post_feeds(author_username, *group_slugs):
+    """Ленты, на страницах которых выводится пост."""
+    feeds = ['index', f'author:{author_username}']
+    feeds.extend(f'group:{slug}' for slug in group_slugs if slug)
+    return feeds
+
+
+def bump_post_feeds(post_id):
+    """Сбросить кэш страниц всех лент, где выводится пост."""
+    names = Post.objects.filter(pk=post_id).values_list(
+        'author__username', 'group__slug'
+    ).first()
+    if names is not None:
+        bump_feeds(*post_feeds(*names))
+
+
+def viewer_tag(request):
+    """Часть ETag, зависящая от пользователя: имя в шапке, CSRF-токен и
+    версия его подписок (кнопки «Подписаться»).
+    """
+    user = request.user
+    return '{}:{}:{}'.format(
+        user.pk or 0,
+        request.COOKIES.get(settings.CSRF_COOKIE_NAME, ''),
+        following(user.pk)['version'] if user.is_authenticated else 0
+    )
+
+
+def make_etag(*parts):
+    raw = '|'.join(map(str, parts))
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def page_timeout():
+    """Сколько хранить страницу, отрендеренную текущим запросом."""
+    if reading_replica():
+        # Реплика могла отстать от записи, сбросившей поколение ленты:
+        # такую страницу хранить не дольше окна закрепления после записи.
+        return min(PAGE_CACHE_TIMEOUT,
+                   getattr(settings, 'REPLICA_PIN_SECONDS', 5))
+    return PAGE_CACHE_TIMEOUT
+
+
+def store_page(key, response, last_modified):
+    """Положить ответ в кэш; потоковый — когда он отправлен целиком."""
+    def store(content):
+        cache.set(key, {
+            'content': content,
+            'content_type': response['Content-Type'],
+            'time': last_modified,
+        }, page_timeout())
+
+    if response.streaming:
+        response.streaming_content = _tee(response.streaming_content, store)
+    else:
+        store(response.content)
+
+
+def _tee(chunks, store):
+    # Потоковые ответы здесь — страницы API, их размер ограничен лимитом.
+    parts = []
+    for chunk in chunks:
+        parts.append(chunk)
+        yield chunk
+    store(b''.join(parts))
+
+
+def _patch_headers(response, etag, last_modified, shared, per_user):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    if shared:
+        patch_cache_control(response, no_cache=True)
+    else:
+        patch_cache_control(response, no_cache=True, private=True)
+    if per_user:
+        patch_vary_headers(response, ('Cookie',))
+
+
+def feed_page(feed, per_user=True):
+    """Кэш и условный GET для страницы ленты.
+
+    `feed` — шаблон имени ленты, в который подставляются аргументы
+    view, например `'group:{slug}'`. ETag строится из поколений ленты, так
+    что запрос с актуальным ETag получает 304 без рендеринга и без обращения
+    к базе. Анонимным посетителям страница отдаётся целиком из кэша.
+    С `per_user=False` (JSON API) ответ одинаков для всех: он кэшируется
+    для любого посетителя, а request.user не читается вовсе.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            shared = not per_user or not request.user.is_authenticated
+            generations, changed = feed_state(SITE_FEED, feed.format(**kwargs))
+            digest = make_etag(
+                request.path,
+                request.GET.urlencode(),
+                *generations,
+                'anonymous' if shared else viewer_tag(request)
+            )
+            key = f'page:{digest}'
+            etag = quote_etag(digest)
+            entry = cache.get(key) if shared else None
+            last_modified = entry['time'] if entry else changed
+            response = get_conditional_response(
+                request, etag=etag, last_modified=last_modified
+            )
+            if response is not None:
+                count('page.not_modified')
+            elif entry is not None:
+                count('page.hit')
+                response = HttpResponse(
+                    entry['content'], content_type=entry['content_type']
+                )
+            else:
+                response = view(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+                if shared:
+                    count('page.miss')
+                    last_modified = last_modified or int(time.time())
+                    store_page(key, response, last_modified)
+            _patch_headers(response, etag, last_modified, shared, per_user)
+            return response
+        return wrapper
+    return decorator
+
+
+def post_state(request, post_id):
+    """Версия и время изменения поста, один запрос по первичному ключу."""
+    if not hasattr(request, '_post_state'):
+        request._post_state = Post.objects.filter(pk=post_id).values_list(
+            'version', 'updated'
+        ).first()
+    return request._post_state
+
+
+def post_etag(request, post_id):
+    state = post_state(request, post_id)
+    if state is not None:
+        return make_etag('post', post_id, state[0], viewer_tag(request))
+
+
+def post_last_modified(request, post_id):
+    state = post_state(request, post_id)
+    if state is not None:
+        return state[1]
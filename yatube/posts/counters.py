@@ -0,0 +1,92 @@
+"""Денормализованные счётчики постов и комментариев.
+
+Счётчики меняются только при записи (см. posts.signals), поэтому страницы
+поста и профиля читают готовые числа и не выполняют COUNT на каждый запрос.
+"""
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery, IntegerField
+from django.db.models.functions import Coalesce, Now
+
+from .models import AuthorStats, Comment, Follow, Group, Post
+
+
+def _change_author(author_id, field, delta):
+    updated = AuthorStats.objects.filter(
+        user_id=author_id, **{f'{field}__gte': -delta}
+    ).update(**{field: F(field) + delta})
+    if not updated and delta > 0:
+        # Строки ещё нет: считаем один раз при записи, а не при чтении.
+        AuthorStats.objects.get_or_create(
+            user_id=author_id,
+            defaults={
+                'post_count': Post.objects.filter(
+                    author_id=author_id
+                ).count(),
+                'follower_count': Follow.objects.filter(
+                    author_id=author_id
+                ).count(),
+            }
+        )
+
+
+def change_author_posts(author_id, delta):
+    _change_author(author_id, 'post_count', delta)
+
+
+def change_author_followers(author_id, delta):
+    _change_author(author_id, 'follower_count', delta)
+
+
+def change_authors_followers(author_ids, delta):
+    """Изменить число подписчиков сразу нескольких авторов."""
+    existing = set(AuthorStats.objects.filter(
+        user_id__in=author_ids
+    ).values_list('user_id', flat=True))
+    AuthorStats.objects.filter(
+        user_id__in=existing, follower_count__gte=-delta
+    ).update(follower_count=F('follower_count') + delta)
+    for author_id in set(author_ids) - existing:
+        _change_author(author_id, 'follower_count', delta)
+
+
+def change_group_posts(group_id, delta):
+    if group_id is not None:
+        Group.objects.filter(pk=group_id, post_count__gte=-delta).update(
+            post_count=F('post_count') + delta
+        )
+
+
+def change_post_comments(post_id, delta):
+    # Число комментариев видно в карточке, поэтому меняется и её версия.
+    Post.objects.filter(pk=post_id, comment_count__gte=-delta).update(
+        comment_count=F('comment_count') + delta,
+        version=F('version') + 1,
+        updated=Now()
+    )
+
+
+def _count_of(queryset, field):
+    counted = queryset.filter(**{field: OuterRef('pk')}).order_by().values(
+        field
+    ).annotate(total=Count('pk')).values('total')
+    return Coalesce(Subquery(counted, output_field=IntegerField()), 0)
+
+
+@transaction.atomic
+def rebuild_counters():
+    """Пересчитать все счётчики с нуля по данным таблиц."""
+    Group.objects.update(post_count=_count_of(Post.objects, 'group'))
+    Post.objects.update(comment_count=_count_of(Comment.objects, 'post'))
+    AuthorStats.objects.all().delete()
+    posts = dict(Post.objects.order_by().values_list('author').annotate(
+        total=Count('pk')
+    ))
+    followers = dict(Follow.objects.order_by().values_list('author').annotate(
+        total=Count('pk')
+    ))
+    AuthorStats.objects.bulk_create(
+        AuthorStats(user_id=author_id,
+                    post_count=posts.get(author_id, 0),
+                    follower_count=followers.get(author_id, 0))
+        for author_id in posts.keys() | followers.keys()
+    )
@@ -0,0 +1,79 @@
+"""Граф подписок: кэш подписок пользователя и массовая подписка.
+
+Множество id авторов, на которых подписан пользователь, хранится в кэше,
+поэтому кнопка «Подписаться» в профиле и в списках авторов — проверка
+вхождения в множество, а не запрос Follow на каждого автора. Любое
+создание или удаление подписки сбрасывает множество (см. posts.signals),
+следующее чтение собирает его одним запросом по индексу
+`(user_id, author_id)`. Версия множества входит в ETag страниц
+пользователя, чтобы после подписки он не получил 304 со старой кнопкой.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from . import timeline
+from .counters import change_authors_followers
+from .models import Follow, User
+
+FOLLOWING_TIMEOUT = getattr(settings, 'FOLLOWING_CACHE_TIMEOUT', 60 * 60 * 24)
+BULK_FOLLOW_LIMIT = getattr(settings, 'BULK_FOLLOW_LIMIT', 50)
+
+
+def _key(user_id):
+    return f'following:{user_id}'
+
+
+def following(user_id):
+    """Версия и множество id авторов, на которых подписан пользователь."""
+    entry = cache.get(_key(user_id))
+    if entry is None:
+        entry = {
+            'version': int(time.time() * 1000),
+            'ids': frozenset(Follow.objects.filter(
+                user_id=user_id
+            ).values_list('author_id', flat=True)),
+        }
+        cache.set(_key(user_id), entry, FOLLOWING_TIMEOUT)
+    return entry
+
+
+def followed_ids(user):
+    """Подписки пользователя; для анонимного — пустое множество."""
+    if not user.is_authenticated:
+        return frozenset()
+    return following(user.pk)['ids']
+
+
+def forget(user_id):
+    """Сбросить кэш подписок пользователя."""
+    cache.delete(_key(user_id))
+    # Параллельный запрос мог собрать множество до фиксации транзакции.
+    transaction.on_commit(lambda: cache.delete(_key(user_id)))
+
+
+def follow_many(user, usernames):
+    """Подписать пользователя на авторов; вернуть новых авторов."""
+    usernames = list(dict.fromkeys(usernames))[:BULK_FOLLOW_LIMIT]
+    with transaction.atomic():
+        current = Follow.objects.filter(user=user).values_list(
+            'author_id', flat=True
+        )
+        authors = list(User.objects.filter(
+            username__in=usernames
+        ).exclude(pk=user.pk).exclude(pk__in=current).only('username'))
+        if not authors:
+            return []
+        # bulk_create не отправляет сигналы: их работа сделана здесь же.
+        Follow.objects.bulk_create(
+            Follow(user=user, author=author) for author in authors
+        )
+        change_authors_followers([author.pk for author in authors], 1)
+        forget(user.pk)
+    for author in authors:
+        timeline.backfill.enqueue(
+            user.pk, author.pk, key=f'backfill:{user.pk}:{author.pk}'
+        )
+    return authors
@@ -1,12 +1,62 @@
 from django.contrib.auth import get_user_model
 from django import forms
+from django.core.exceptions import ValidationError
+from PIL import Image
 
+from . import uploads
 from .models import Post, Group, Comment
 
 
 User = get_user_model()
 
 
+class PostImageField(forms.ImageField):
+    """Проверка картинки по заголовку, без декодирования пикселей.
+
+    Стандартный ImageField читает загрузку из памяти целиком и вызывает
+    `verify()`. Здесь сначала проверяется размер файла, а затем Pillow
+    открывает файл лениво: читаются только формат и размеры.
+    """
+    default_error_messages = {
+        'too_big': 'Файл больше %(limit)s МБ.',
+        'too_many_pixels': 'Картинка больше %(limit)s мегапикселей.',
+    }
+
+    def to_python(self, data):
+        f = forms.FileField.to_python(self, data)
+        if f is None:
+            return None
+        if f.size > uploads.POST_IMAGE_MAX_SIZE:
+            raise ValidationError(
+                self.error_messages['too_big'], code='too_big',
+                params={'limit': uploads.POST_IMAGE_MAX_SIZE // 2 ** 20},
+            )
+        source = (data.temporary_file_path()
+                  if hasattr(data, 'temporary_file_path') else data)
+        try:
+            with Image.open(source) as image:
+                image_format = image.format
+                width, height = image.size
+        except Exception as exc:
+            raise ValidationError(
+                self.error_messages['invalid_image'], code='invalid_image',
+            ) from exc
+        if image_format not in uploads.POST_IMAGE_FORMATS:
+            raise ValidationError(
+                self.error_messages['invalid_image'], code='invalid_image',
+            )
+        if width * height > uploads.POST_IMAGE_MAX_PIXELS:
+            raise ValidationError(
+                self.error_messages['too_many_pixels'],
+                code='too_many_pixels',
+                params={'limit': uploads.POST_IMAGE_MAX_PIXELS // 10 ** 6},
+            )
+        f.content_type = Image.MIME.get(image_format)
+        if hasattr(f, 'seek') and callable(f.seek):
+            f.seek(0)
+        return f
+
+
 class PostForm(forms.ModelForm):
     class Meta():
         model = Post
@@ -22,6 +72,7 @@ class PostForm(forms.ModelForm):
         }
     text = forms.CharField(widget=forms.Textarea)
     group = forms.ModelChoiceField(Group.objects.all(), required=False)
+    image = PostImageField(required=False, label='Картинка поста')
 
 
 class CommentForm(forms.ModelForm):
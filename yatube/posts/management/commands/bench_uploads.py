@@ -0,0 +1,84 @@
+import multiprocessing
+import resource
+from io import BytesIO
+
+from django import forms
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory, override_settings
+from PIL import Image
+
+from posts.forms import PostForm
+
+DJANGO_HANDLERS = [
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+
+
+class DefaultImagePostForm(PostForm):
+    image = forms.ImageField(required=False)
+
+
+def make_image(side, image_format):
+    buffer = BytesIO()
+    Image.effect_noise((side, side), 64).convert('RGB').save(
+        buffer, format=image_format
+    )
+    return buffer.getvalue()
+
+
+def upload_once(content, default, queue):
+    """Разобрать multipart-запрос и проверить форму в отдельном процессе."""
+    # Тело запроса собирается до замера: в реальном сервере оно приходит
+    # из сокета, а не лежит в памяти процесса.
+    request = RequestFactory().post('/create/', {
+        'text': 'Замер',
+        'image': SimpleUploadedFile('bench.png', content),
+    })
+    del content
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    handlers = DJANGO_HANDLERS if default else [
+        'posts.uploads.BoundedTemporaryFileUploadHandler'
+    ]
+    with override_settings(FILE_UPLOAD_HANDLERS=handlers):
+        form_class = DefaultImagePostForm if default else PostForm
+        form = form_class(request.POST, request.FILES)
+        valid = form.is_valid()
+    after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    queue.put((valid, after - before))
+
+
+class Command(BaseCommand):
+    help = (
+        'Замерить пиковый прирост RSS на одну загрузку картинки: '
+        'стандартная обработка Django против потоковой из posts.uploads.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--side', type=int, default=1000)
+        parser.add_argument('--format', default='PNG')
+        parser.add_argument('--runs', type=int, default=3)
+
+    def handle(self, *args, **options):
+        content = make_image(options['side'], options['format'])
+        self.stdout.write(
+            f'Картинка {options["side"]}x{options["side"]} '
+            f'{options["format"]}, {len(content) // 1024} КБ'
+        )
+        context = multiprocessing.get_context('fork')
+        for title, default in (('django', True), ('posts.uploads', False)):
+            peaks = []
+            for _ in range(options['runs']):
+                queue = context.Queue()
+                process = context.Process(
+                    target=upload_once, args=(content, default, queue)
+                )
+                process.start()
+                valid, peak = queue.get()
+                process.join()
+                peaks.append(peak)
+            self.stdout.write(
+                f'{title:>14}: форма валидна={valid}, пиковый прирост RSS '
+                f'{max(peaks)} КБ (мин. {min(peaks)} КБ)'
+            )
@@ -0,0 +1,45 @@
+import posixpath
+
+from django.core.management.base import BaseCommand
+
+from posts import thumbnails
+from posts.models import Post
+from posts.storage import post_image_storage
+
+ROOT = 'posts'
+
+
+class Command(BaseCommand):
+    help = 'Удалить картинки постов, на которые не ссылается ни один пост.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать, какие файлы будут удалены.'
+        )
+
+    def walk(self, path):
+        if not post_image_storage.exists(path):
+            return
+        directories, files = post_image_storage.listdir(path)
+        for name in files:
+            yield posixpath.join(path, name)
+        for directory in directories:
+            yield from self.walk(posixpath.join(path, directory))
+
+    def handle(self, *args, **options):
+        used = set(
+            Post.objects.exclude(image='').values_list('image', flat=True)
+        )
+        removed = 0
+        for name in self.walk(ROOT):
+            if name in used:
+                continue
+            if options['dry_run']:
+                self.stdout.write(name)
+            elif not thumbnails.collect(name):
+                continue
+            removed += 1
+        self.stdout.write(
+            self.style.SUCCESS(f'Неиспользуемых картинок: {removed}.')
+        )
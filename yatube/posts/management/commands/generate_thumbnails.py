@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from posts import thumbnails
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Создать миниатюры для уже загруженных картинок постов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Пересоздать миниатюры и для постов, где они уже есть.'
+        )
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image='')
+        if not options['all']:
+            posts = posts.filter(thumbnail_url='')
+        done = 0
+        for post_id in posts.values_list('pk', flat=True).iterator():
+            thumbnails.generate(post_id)
+            done += 1
+        self.stdout.write(self.style.SUCCESS(f'Миниатюр создано: {done}.'))
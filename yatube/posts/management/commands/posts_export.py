@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts import transfer
+
+
+class Command(BaseCommand):
+    help = 'Выгрузить посты в JSONL или CSV.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?', default='-',
+            help='Файл для выгрузки, "-" — стандартный вывод.'
+        )
+        parser.add_argument('--format', choices=transfer.FORMATS)
+        parser.add_argument(
+            '--batch-size', type=int, default=transfer.BATCH_SIZE
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        data_format = options['format'] or transfer.guess_format(path)
+        started = time.monotonic()
+        if path == '-':
+            written = transfer.export_records(
+                self.stdout, data_format, options['batch_size']
+            )
+        else:
+            with open(path, 'w', encoding='utf-8', newline='') as stream:
+                written = transfer.export_records(
+                    stream, data_format, options['batch_size']
+                )
+        elapsed = max(time.monotonic() - started, 1e-6)
+        # Итог в stderr, чтобы не смешивать его с выгрузкой в stdout.
+        self.stderr.write(
+            f'Выгружено постов: {written} '
+            f'({written / elapsed:.0f} в секунду).'
+        )
@@ -0,0 +1,82 @@
+import sys
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+
+from posts import transfer
+from posts.caching import SITE_FEED, bump_feeds
+from posts.counters import rebuild_counters
+from posts.search import rebuild_index
+from posts.timeline import rebuild_timelines
+
+
+class Command(BaseCommand):
+    help = 'Загрузить посты из JSONL или CSV.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', help='Файл с постами, "-" — стандартный ввод.'
+        )
+        parser.add_argument('--format', choices=transfer.FORMATS)
+        parser.add_argument(
+            '--batch-size', type=int, default=transfer.BATCH_SIZE
+        )
+        parser.add_argument(
+            '--checkpoint',
+            help='Файл контрольной точки; по умолчанию <path>.checkpoint.'
+        )
+        parser.add_argument(
+            '--create-missing', action='store_true',
+            help='Создавать неизвестных авторов и группы.'
+        )
+        parser.add_argument(
+            '--skip-rebuild', action='store_true',
+            help='Не пересобирать счётчики, ленты и поисковый индекс.'
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        data_format = options['format'] or transfer.guess_format(path)
+        checkpoint = options['checkpoint']
+        if checkpoint is None and path != '-':
+            checkpoint = path + '.checkpoint'
+        done = transfer.read_checkpoint(checkpoint)
+        if done:
+            self.stdout.write(f'Продолжение с записи {done}.')
+        importer = transfer.Importer(options['create_missing'])
+        stream = (
+            sys.stdin if path == '-'
+            else open(path, encoding='utf-8', newline='')
+        )
+        started = time.monotonic()
+        try:
+            records = islice(transfer.read_records(stream, data_format),
+                             done, None)
+            while True:
+                batch = list(islice(records, options['batch_size']))
+                if not batch:
+                    break
+                importer.load(batch, checkpoint, done)
+                done += len(batch)
+                self.report(importer, started)
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+        if not options['skip_rebuild'] and importer.imported:
+            rebuild_counters()
+            rebuild_timelines()
+            rebuild_index()
+            bump_feeds(SITE_FEED)
+        self.report(importer, started)
+        self.stdout.write(self.style.SUCCESS(
+            f'Загружено постов: {importer.imported}, '
+            f'пропущено: {importer.skipped}.'
+        ))
+
+    def report(self, importer, started):
+        elapsed = max(time.monotonic() - started, 1e-6)
+        self.stdout.write(
+            f'{importer.imported} постов за {elapsed:.1f} с '
+            f'({importer.imported / elapsed:.0f} в секунду)'
+        )
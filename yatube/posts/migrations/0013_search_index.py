@@ -0,0 +1,54 @@
+# Generated by Django 2.2.16 on 2026-10-18 01:48
+
+from django.db import migrations, models, transaction
+from django.db.utils import OperationalError
+import django.db.models.deletion
+
+# Имя таблицы записано здесь, а не импортировано из posts.search: миграция
+# не должна меняться вместе с кодом приложения. Индекс заполняет команда
+# rebuild_search_index — после этой миграции её нужно выполнить один раз.
+FTS_TABLE = 'posts_post_fts'
+
+
+def create_fts_table(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+    try:
+        with transaction.atomic(using=connection.alias):
+            schema_editor.execute(
+                f'CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5('
+                f'terms, tokenize="unicode61 remove_diacritics 0")'
+            )
+    except OperationalError:
+        # SQLite собран без FTS5 — останется обратный индекс SearchTerm.
+        pass
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0012_post_image_storage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchTerm',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64, verbose_name='Терм')),
+                ('count', models.PositiveIntegerField(default=1, verbose_name='Вхождений')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='posts.Post')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='searchterm',
+            constraint=models.UniqueConstraint(fields=('term', 'post'), name='unique_search_term'),
+        ),
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
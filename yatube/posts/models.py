@@ -1,8 +1,26 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth import get_user_model
 
+from .storage import post_image_storage
+
 User = get_user_model()
 
+FEED_FIELDS = (
+    'text',
+    'pub_date',
+    'image',
+    'author',
+    'author__username',
+    'author__first_name',
+    'author__last_name',
+    'group',
+    'group__slug',
+    'group__title',
+    'comment_count',
+    'version',
+    'thumbnail_url',
+)
+
 
 class Group(models.Model):
     title = models.CharField(
@@ -17,11 +35,24 @@ class Group(models.Model):
     description = models.TextField(
         verbose_name='Описание'
     )
+    post_count = models.PositiveIntegerField(
+        'Число постов',
+        default=0,
+        editable=False
+    )
 
     def __str__(self) -> str:
         return self.title
 
 
+class PostQuerySet(models.QuerySet):
+    def for_feed(self):
+        """Посты для лент: автор и группа одним JOIN и только нужные поля,
+        чтобы шаблон не делал запросов на каждый пост.
+        """
+        return self.select_related('author', 'group').only(*FEED_FIELDS)
+
+
 class Post(models.Model):
     text = models.TextField(
         'Текст поста',
@@ -29,8 +60,11 @@ class Post(models.Model):
     )
     pub_date = models.DateTimeField(
         'Дата публикации',
-        auto_now_add=True,
-        db_index=True
+        auto_now_add=True
+    )
+    updated = models.DateTimeField(
+        'Дата изменения',
+        auto_now=True
     )
     author = models.ForeignKey(
         User,
@@ -50,16 +84,61 @@ class Post(models.Model):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
-        blank=True
+        storage=post_image_storage,
+        blank=True,
+        db_index=True
+    )
+    thumbnail_url = models.CharField(
+        'Адрес миниатюры',
+        max_length=255,
+        blank=True,
+        editable=False
     )
+    comment_count = models.PositiveIntegerField(
+        'Число комментариев',
+        default=0,
+        editable=False
+    )
+    version = models.PositiveIntegerField(
+        'Версия',
+        default=0,
+        editable=False
+    )
+
+    objects = PostQuerySet.as_manager()
 
     def __str__(self) -> str:
         return self.text[:15]
 
+    def save(self, *args, **kwargs):
+        bump = not self._state.adding
+        if bump:
+            # Новая версия сбрасывает кэш карточки поста.
+            self.version = models.F('version') + 1
+        # Счётчики обновляются сигналами внутри той же транзакции.
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+        if bump:
+            self.refresh_from_db(fields=['version'])
+
     class Meta:
         ordering = ('-pub_date',)
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
+        # Ленты сортируются по (pub_date, id) — ключам курсора, поэтому id
+        # входит в индексы: иначе SQLite досортировывает строки с равной
+        # датой во временном B-дереве.
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='post_date_idx'),
+            models.Index(
+                fields=['group', '-pub_date', '-id'],
+                name='post_group_date_idx'),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='post_author_date_idx'),
+        ]
 
 
 class Comment(models.Model):
@@ -83,8 +162,17 @@ class Comment(models.Model):
     def __str__(self):
         return self.text[:15]
 
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
     class Meta:
         ordering = ('-create',)
+        indexes = [
+            models.Index(
+                fields=['post', '-create', '-id'],
+                name='comment_post_create_idx')
+        ]
 
 
 class Follow(models.Model):
@@ -105,6 +193,92 @@ class Follow(models.Model):
                 fields=['author', 'user'],
                 name='unique_follower')
         ]
+        # Списки подписчиков и подписок листаются курсором по id. В SQLite
+        # для этого хватило бы индекса внешнего ключа (он хранит rowid по
+        # порядку), в PostgreSQL без составного индекса строки сортируются.
+        indexes = [
+            models.Index(
+                fields=['user', 'author'],
+                name='follow_user_author_idx'),
+            models.Index(
+                fields=['author', '-id'],
+                name='follow_author_id_idx'),
+            models.Index(
+                fields=['user', '-id'],
+                name='follow_user_id_idx'),
+        ]
 
     def __str__(self):
         return f"{self.author}, follower:{self.user}"
+
+
+class AuthorStats(models.Model):
+    """Денормализованные счётчики автора, чтобы не считать посты на лету."""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats'
+    )
+    post_count = models.PositiveIntegerField(
+        'Число постов',
+        default=0
+    )
+    follower_count = models.PositiveIntegerField(
+        'Число подписчиков',
+        default=0
+    )
+
+    def __str__(self):
+        return f"{self.user}: {self.post_count}"
+
+
+class TimelineEntry(models.Model):
+    """Запись материализованной ленты подписок пользователя."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries'
+    )
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'],
+                name='unique_timeline_post')
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-post'],
+                name='timeline_user_date_idx')
+        ]
+
+    def __str__(self):
+        return f"{self.user}: {self.post_id}"
+
+
+class SearchTerm(models.Model):
+    """Обратный поисковый индекс для СУБД без полнотекстового поиска."""
+    term = models.CharField('Терм', max_length=64)
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='search_terms'
+    )
+    count = models.PositiveIntegerField('Вхождений', default=1)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['term', 'post'],
+                name='unique_search_term')
+        ]
+
+    def __str__(self):
+        return f"{self.term}: {self.post_id}"
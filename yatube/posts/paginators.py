@@ -0,0 +1,244 @@
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import InvalidPage, Page, Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+
+class CursorPage(Page):
+    """Страница ленты, которая знает соседей по курсору, а не по номеру."""
+
+    def __init__(self, object_list, number, paginator,
+                 has_next=False, has_previous=False):
+        super().__init__(object_list, number, paginator)
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        if self.number:
+            return f'<Page {self.number}>'
+        return '<Page (cursor)>'
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def next_page_number(self):
+        return self.number + 1 if self.number else None
+
+    def previous_page_number(self):
+        return self.number - 1 if self.number else None
+
+    @property
+    def next_cursor(self):
+        if not self._has_next or not self.object_list:
+            return ''
+        return self.paginator.encode_cursor(
+            self.object_list[-1], CursorPaginator.AFTER
+        )
+
+    @property
+    def previous_cursor(self):
+        if not self._has_previous or not self.object_list:
+            return ''
+        return self.paginator.encode_cursor(
+            self.object_list[0], CursorPaginator.BEFORE
+        )
+
+    @property
+    def last_cursor(self):
+        return self.paginator.last_cursor
+
+
+class CursorPaginator(Paginator):
+    """Keyset-пагинация по убыванию ключей (по умолчанию `pub_date`, `pk`).
+
+    Вместо `COUNT(*)` и `LIMIT/OFFSET` каждая страница выбирается одним
+    запросом `WHERE (pub_date, id) < (...) LIMIT per_page + 1`, который
+    использует индекс по дате. Номер страницы `?page=N` поддерживается
+    для старых ссылок: такая страница выбирается через OFFSET, но без
+    подсчёта общего количества записей.
+    """
+
+    AFTER = 'a'
+    BEFORE = 'b'
+    LAST = 'l'
+
+    def __init__(self, object_list, per_page, keys=('pub_date', 'pk'),
+                 **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.keys = tuple(keys)
+
+    def _check_object_list_is_ordered(self):
+        # Порядок задаётся самим пагинатором, а не исходным queryset.
+        pass
+
+    @property
+    def last_cursor(self):
+        return self._dump(self.LAST, [])
+
+    def encode_cursor(self, obj, direction):
+        values = []
+        for key in self.keys:
+            if isinstance(obj, dict):
+                # Строка из queryset.values().
+                value = obj[key]
+            else:
+                value = obj.pk if key == 'pk' else getattr(obj, key)
+            values.append(
+                value.isoformat() if hasattr(value, 'isoformat') else value
+            )
+        return self._dump(direction, values)
+
+    def _dump(self, direction, values):
+        raw = json.dumps([direction, values], separators=(',', ':'))
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        """Вернуть (направление, значения ключей) или None."""
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            direction, values = json.loads(
+                base64.urlsafe_b64decode(padded.encode()).decode()
+            )
+        except (TypeError, ValueError, binascii.Error):
+            return None
+        if direction == self.LAST:
+            return direction, []
+        if (direction not in (self.AFTER, self.BEFORE)
+                or not isinstance(values, list)
+                or len(values) != len(self.keys)):
+            return None
+        try:
+            values = [
+                self.to_python(key, value)
+                for key, value in zip(self.keys, values)
+            ]
+        except ValidationError:
+            return None
+        if any(value is None for value in values):
+            return None
+        return direction, values
+
+    def to_python(self, key, value):
+        """Значение ключа из курсора в тип поля модели."""
+        meta = self.object_list.model._meta
+        return meta.get_field(
+            meta.pk.name if key == 'pk' else key
+        ).to_python(value)
+
+    def _ordered(self, queryset, descending=True):
+        prefix = '-' if descending else ''
+        return queryset.order_by(*(prefix + key for key in self.keys))
+
+    def _seek(self, values, lookup):
+        condition = Q()
+        for index, key in enumerate(self.keys):
+            bound = {k: v for k, v in zip(self.keys[:index], values)}
+            bound[f'{key}__{lookup}'] = values[index]
+            condition |= Q(**bound)
+        return condition
+
+    def fetch(self, seek=None, descending=True, offset=0, limit=None):
+        """Выбрать строки страницы; переопределяется для составных лент."""
+        queryset = self._ordered(self.object_list, descending)
+        if seek is not None:
+            queryset = queryset.filter(seek)
+        return list(queryset[offset:offset + limit])
+
+    def rows_after(self, cursor=None):
+        """Ленивый queryset строк после курсора «следующая страница».
+
+        Для потоковой выдачи: страница не собирается в список, а читается
+        по мере отправки. Вернуть None, если курсор некорректен.
+        """
+        queryset = self._ordered(self.object_list)
+        if not cursor:
+            return queryset
+        decoded = self.decode_cursor(cursor)
+        if decoded is None or decoded[0] != self.AFTER:
+            return None
+        return queryset.filter(self._seek(decoded[1], 'lt'))
+
+    def page_by_cursor(self, cursor):
+        decoded = self.decode_cursor(cursor)
+        if decoded is None:
+            return self.page_by_number(1)
+        direction, values = decoded
+        size = self.per_page
+        if direction == self.AFTER:
+            rows = self.fetch(self._seek(values, 'lt'), limit=size + 1)
+            return CursorPage(rows[:size], None, self,
+                              has_next=len(rows) > size, has_previous=True)
+        seek = self._seek(values, 'gt') if direction == self.BEFORE else None
+        rows = self.fetch(seek, descending=False, limit=size + 1)
+        has_previous = len(rows) > size
+        rows = rows[:size][::-1]
+        return CursorPage(rows, None, self, has_next=direction == self.BEFORE,
+                          has_previous=has_previous)
+
+    def page_by_number(self, number):
+        try:
+            number = max(int(number), 1)
+        except (TypeError, ValueError):
+            number = 1
+        size = self.per_page
+        rows = self.fetch(offset=(number - 1) * size, limit=size + 1)
+        if not rows and number > 1:
+            # Как и Paginator.get_page: за пределами ленты — первая страница.
+            return self.page_by_number(1)
+        return CursorPage(rows[:size], number, self,
+                          has_next=len(rows) > size,
+                          has_previous=number > 1)
+
+    def get_page(self, number, cursor=None):
+        if cursor:
+            return self.page_by_cursor(cursor)
+        return self.page_by_number(number)
+
+    def page(self, number):
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise InvalidPage('That page number is not an integer')
+        return self.page_by_number(number)
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator без точного `COUNT(*)` по большой таблице.
+
+    На PostgreSQL размер нефильтрованной таблицы берётся из статистики
+    планировщика. В остальных случаях строки считаются не дальше
+    COUNT_LIMIT: дальние страницы недоступны, зато подсчёт не читает
+    всю таблицу.
+    """
+
+    COUNT_LIMIT = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = self.estimate(queryset)
+            if estimate > self.COUNT_LIMIT:
+                return estimate
+        return queryset[:self.COUNT_LIMIT].count()
+
+    @staticmethod
+    def estimate(queryset):
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return 0
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class WHERE relname = %s',
+                [queryset.model._meta.db_table]
+            )
+            row = cursor.fetchone()
+        return row[0] if row else 0
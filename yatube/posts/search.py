@@ -0,0 +1,325 @@
+"""Полнотекстовый поиск по тексту постов.
+
+Текст разбивается на слова, русские слова приводятся к основе стеммером
+Портера, и в индекс попадают только основы. На SQLite индексом служит
+виртуальная таблица FTS5 `posts_post_fts` (rowid — id поста), результаты
+ранжируются по bm25. Если FTS5 нет (другая СУБД или SQLite без модуля),
+используется обратный индекс в таблице `SearchTerm` с весом tf-idf.
+Индекс обновляется фоновой задачей после сохранения поста и сразу при
+его удалении.
+"""
+import math
+import re
+
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.db.models import (Case, Count, ExpressionWrapper, F, FloatField,
+                              Q, Sum, When)
+from django.db.models.expressions import RawSQL
+
+from core.tasks import task
+
+from .models import Post, SearchTerm
+from .paginators import CursorPaginator
+
+FTS_TABLE = 'posts_post_fts'
+# Сколько слов запроса учитывается и какой длины бывает терм.
+MAX_QUERY_TERMS = 10
+MAX_TERM_LENGTH = 64
+BATCH_SIZE = 500
+
+WORD_RE = re.compile(r'\w+')
+CYRILLIC_RE = re.compile(r'[а-я]')
+
+# Стеммер Портера для русского языка.
+RVRE = re.compile(r'^(.*?[аеиоуыэюя])(.*)$')
+PERFECTIVE_GERUND = re.compile(
+    r'((ив|ивши|ившись|ыв|ывши|ывшись)|((?<=[ая])(в|вши|вшись)))$'
+)
+REFLEXIVE = re.compile(r'(с[яь])$')
+ADJECTIVE = re.compile(
+    r'(ее|ие|ые|ое|ими|ыми|ей|ий|ый|ой|ем|им|ым|ом|его|ого|ему|ому|их|ых|'
+    r'ую|юю|ая|яя|ою|ею)$'
+)
+PARTICIPLE = re.compile(r'((ивш|ывш|ующ)|((?<=[ая])(ем|нн|вш|ющ|щ)))$')
+VERB = re.compile(
+    r'((ила|ыла|ена|ейте|уйте|ите|или|ыли|ей|уй|ил|ыл|им|ым|ен|ило|ыло|ено|'
+    r'ят|ует|уют|ит|ыт|ены|ить|ыть|ишь|ую|ю)|'
+    r'((?<=[ая])(ла|на|ете|йте|ли|й|л|ем|н|ло|но|ет|ют|ны|ть|ешь|нно)))$'
+)
+NOUN = re.compile(
+    r'(а|ев|ов|ие|ье|е|иями|ями|ами|еи|ии|и|ией|ей|ой|ий|й|иям|ям|ием|ем|'
+    r'ам|ом|о|у|ах|иях|ях|ы|ь|ию|ью|ю|ия|ья|я)$'
+)
+DERIVATIONAL = re.compile(r'.*[^аеиоуыэюя]+[аеиоуыэюя].*ость?$')
+DERIVATIONAL_SUFFIX = re.compile(r'ость?$')
+SUPERLATIVE = re.compile(r'(ейше|ейш)$')
+I_ENDING = re.compile(r'и$')
+SOFT_SIGN = re.compile(r'ь$')
+DOUBLE_N = re.compile(r'нн$')
+
+
+def stem(word):
+    """Основа русского слова; прочие слова возвращаются как есть."""
+    match = RVRE.match(word)
+    if not match:
+        return word
+    prefix, rv = match.groups()
+    cut = PERFECTIVE_GERUND.sub('', rv, 1)
+    if cut == rv:
+        rv = REFLEXIVE.sub('', rv, 1)
+        cut = ADJECTIVE.sub('', rv, 1)
+        if cut != rv:
+            rv = PARTICIPLE.sub('', cut, 1)
+        else:
+            cut = VERB.sub('', rv, 1)
+            rv = NOUN.sub('', rv, 1) if cut == rv else cut
+    else:
+        rv = cut
+    rv = I_ENDING.sub('', rv, 1)
+    if DERIVATIONAL.match(rv):
+        rv = DERIVATIONAL_SUFFIX.sub('', rv, 1)
+    cut = SOFT_SIGN.sub('', rv, 1)
+    if cut == rv:
+        rv = DOUBLE_N.sub('н', SUPERLATIVE.sub('', rv, 1), 1)
+    else:
+        rv = cut
+    return prefix + rv
+
+
+def tokenize(text):
+    """Термы текста в порядке появления, с повторами."""
+    terms = []
+    for word in WORD_RE.findall(text.lower().replace('ё', 'е')):
+        if CYRILLIC_RE.search(word):
+            word = stem(word)
+        if word:
+            terms.append(word[:MAX_TERM_LENGTH])
+    return terms
+
+
+def query_terms(query):
+    """Уникальные термы поискового запроса."""
+    return list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TERMS]
+
+
+class FtsIndex:
+    """Индекс в виртуальной таблице SQLite FTS5."""
+
+    def index(self, post_id, text):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post_id]
+            )
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, terms) VALUES (%s, %s)',
+                [post_id, ' '.join(tokenize(text))]
+            )
+
+    def remove(self, post_id):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post_id]
+            )
+
+    @transaction.atomic
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            for batch in _batches():
+                cursor.executemany(
+                    f'INSERT INTO {FTS_TABLE} (rowid, terms) VALUES (%s, %s)',
+                    [(pk, ' '.join(tokenize(text))) for pk, text in batch]
+                )
+
+    @staticmethod
+    def _match(terms):
+        return ' '.join(f'"{term}"' for term in terms)
+
+    def search(self, terms, seek=None, descending=True, offset=0,
+               limit=None):
+        """Пары (id поста, релевантность) по убыванию релевантности."""
+        sql = (
+            f'SELECT id, score FROM (SELECT rowid AS id, '
+            f'-bm25({FTS_TABLE}) AS score FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s)'
+        )
+        params = [self._match(terms)]
+        if seek is not None:
+            (score, pk), lookup = seek
+            op = '<' if lookup == 'lt' else '>'
+            sql += f' WHERE score {op} %s OR (score = %s AND id {op} %s)'
+            params += [score, score, pk]
+        order = 'DESC' if descending else 'ASC'
+        sql += f' ORDER BY score {order}, id {order} LIMIT %s OFFSET %s'
+        params += [-1 if limit is None else limit, offset]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    def filter(self, queryset, terms):
+        return queryset.filter(pk__in=RawSQL(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+            [self._match(terms)]
+        ))
+
+
+class TermIndex:
+    """Обратный индекс в обычной таблице для СУБД без FTS5."""
+
+    @staticmethod
+    def _rows(post_id, text):
+        counts = {}
+        for term in tokenize(text):
+            counts[term] = counts.get(term, 0) + 1
+        return [
+            SearchTerm(term=term, post_id=post_id, count=count)
+            for term, count in counts.items()
+        ]
+
+    def index(self, post_id, text):
+        SearchTerm.objects.filter(post_id=post_id).delete()
+        SearchTerm.objects.bulk_create(self._rows(post_id, text))
+
+    def remove(self, post_id):
+        SearchTerm.objects.filter(post_id=post_id).delete()
+
+    @transaction.atomic
+    def rebuild(self):
+        SearchTerm.objects.all().delete()
+        for batch in _batches():
+            SearchTerm.objects.bulk_create([
+                row for pk, text in batch for row in self._rows(pk, text)
+            ])
+
+    def _matches(self, terms):
+        return SearchTerm.objects.filter(term__in=terms).values(
+            'post'
+        ).annotate(matched=Count('pk')).filter(matched=len(terms))
+
+    def search(self, terms, seek=None, descending=True, offset=0,
+               limit=None):
+        # Редкие слова весят больше частых: idf по числу постов с термом.
+        frequency = dict(
+            SearchTerm.objects.filter(term__in=terms).values_list(
+                'term'
+            ).annotate(Count('pk'))
+        )
+        weights = [
+            When(term=term, then=ExpressionWrapper(
+                F('count') / math.log(2 + frequency.get(term, 0)),
+                output_field=FloatField()
+            ))
+            for term in terms
+        ]
+        rows = self._matches(terms).annotate(
+            score=Sum(Case(*weights, output_field=FloatField()))
+        )
+        if seek is not None:
+            (score, pk), lookup = seek
+            rows = rows.filter(
+                Q(**{f'score__{lookup}': score})
+                | Q(**{'score': score, f'post__{lookup}': pk})
+            )
+        prefix = '-' if descending else ''
+        rows = rows.order_by(prefix + 'score', prefix + 'post')
+        rows = rows.values_list('post', 'score')
+        if limit is None:
+            return list(rows[offset:])
+        return list(rows[offset:offset + limit])
+
+    def filter(self, queryset, terms):
+        return queryset.filter(
+            pk__in=self._matches(terms).values('post')
+        )
+
+
+_fts_available = {}
+
+
+def get_index():
+    """Индекс, подходящий для текущей базы данных."""
+    key = connection.settings_dict['NAME']
+    if key not in _fts_available:
+        _fts_available[key] = (
+            connection.vendor == 'sqlite'
+            and FTS_TABLE in connection.introspection.table_names()
+        )
+    return FtsIndex() if _fts_available[key] else TermIndex()
+
+
+def _batches():
+    last = 0
+    while True:
+        batch = list(
+            Post.objects.filter(pk__gt=last).order_by('pk').values_list(
+                'pk', 'text'
+            )[:BATCH_SIZE]
+        )
+        if not batch:
+            return
+        yield batch
+        last = batch[-1][0]
+
+
+@task()
+def index_post(post_id):
+    """Проиндексировать текущий текст поста."""
+    text = Post.objects.filter(pk=post_id).values_list(
+        'text', flat=True
+    ).first()
+    if text is not None:
+        get_index().index(post_id, text)
+
+
+def remove_post(post_id):
+    get_index().remove(post_id)
+
+
+def rebuild_index():
+    get_index().rebuild()
+
+
+def filter_posts(queryset, query):
+    """Оставить в queryset посты, где встречаются все слова запроса."""
+    terms = query_terms(query)
+    if not terms:
+        return queryset.none()
+    return get_index().filter(queryset, terms)
+
+
+class SearchPaginator(CursorPaginator):
+    """Курсорная пагинация результатов поиска по релевантности."""
+
+    def __init__(self, query, per_page, **kwargs):
+        super().__init__(
+            Post.objects.for_feed(), per_page, keys=('score', 'pk'), **kwargs
+        )
+        self.terms = query_terms(query)
+        self.index = get_index()
+
+    def to_python(self, key, value):
+        if key == 'score':
+            try:
+                return float(value)
+            except (TypeError, ValueError):
+                raise ValidationError('Некорректная релевантность')
+        return super().to_python(key, value)
+
+    def _seek(self, values, lookup):
+        return values, lookup
+
+    def fetch(self, seek=None, descending=True, offset=0, limit=None):
+        if not self.terms:
+            return []
+        hits = self.index.search(
+            self.terms, seek, descending, offset, limit
+        )
+        posts = self.object_list.in_bulk([pk for pk, score in hits])
+        rows = []
+        for pk, score in hits:
+            post = posts.get(pk)
+            if post is not None:
+                post.score = score
+                rows.append(post)
+        return rows
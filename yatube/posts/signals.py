@@ -0,0 +1,150 @@
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+
+from . import follows, search, thumbnails, timeline
+from .caching import (SITE_FEED, bump_feeds, bump_post_feeds,
+                      bump_post_versions, post_feeds)
+from .counters import (change_author_followers, change_author_posts,
+                       change_group_posts, change_post_comments)
+from .models import Comment, Follow, Group, Post, User
+
+# Поля автора и группы, которые выводятся в карточке поста и в записи
+# ленты Atom/RSS.
+CARD_FIELDS = {
+    User: ('username', 'first_name', 'last_name'),
+    Group: ('slug', 'title'),
+}
+
+
+@receiver(pre_save, sender=Post)
+def remember_saved_post(sender, instance, **kwargs):
+    saved = None
+    if instance.pk is not None:
+        saved = Post.objects.filter(pk=instance.pk).values_list(
+            'group_id', 'group__slug', 'image', 'text'
+        ).first()
+    (instance._saved_group_id, instance._saved_group_slug,
+     instance._saved_image, instance._saved_text) = saved or (
+        None, None, '', None)
+
+
+@receiver(post_save, sender=Post)
+def count_saved_post(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        change_author_posts(instance.author_id, 1)
+        change_group_posts(instance.group_id, 1)
+        timeline.fan_out.enqueue(instance.pk)
+    elif instance._saved_group_id != instance.group_id:
+        change_group_posts(instance._saved_group_id, -1)
+        change_group_posts(instance.group_id, 1)
+    if instance.text != instance._saved_text:
+        search.index_post.enqueue(
+            instance.pk, key=f'search:{instance.pk}'
+        )
+    bump_feeds(*post_feeds(
+        instance.author.username,
+        instance.group.slug if instance.group_id else None,
+        instance._saved_group_slug
+    ))
+    if (instance.image.name or '') != instance._saved_image:
+        thumbnails.schedule(instance.pk)
+        thumbnails.release(instance._saved_image)
+
+
+@receiver(pre_delete, sender=Post)
+def drop_deleted_post_pages(sender, instance, **kwargs):
+    # Имена читаются до удаления: при каскаде автор уже может быть удалён.
+    bump_post_feeds(instance.pk)
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    # При каскадном удалении автора строка его счётчиков может быть уже
+    # удалена — UPDATE по ней просто ничего не затронет.
+    change_author_posts(instance.author_id, -1)
+    change_group_posts(instance.group_id, -1)
+    search.remove_post(instance.pk)
+    thumbnails.release(instance.image.name)
+
+
+@receiver(post_save, sender=Comment)
+def count_saved_comment(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        change_post_comments(instance.post_id, 1)
+        bump_post_feeds(instance.post_id)
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    change_post_comments(instance.post_id, -1)
+    bump_post_feeds(instance.post_id)
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        change_author_followers(instance.author_id, 1)
+        timeline.backfill.enqueue(
+            instance.user_id, instance.author_id,
+            key=f'backfill:{instance.user_id}:{instance.author_id}'
+        )
+        follows.forget(instance.user_id)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    change_author_followers(instance.author_id, -1)
+    timeline.remove(instance.user_id, instance.author_id)
+    follows.forget(instance.user_id)
+
+
+@receiver(pre_delete, sender=Group)
+def drop_group_cards(sender, instance, **kwargs):
+    # До SET_NULL: потом посты группы уже не найти.
+    bump_post_versions(group=instance)
+
+
+@receiver(post_delete, sender=Group)
+def drop_group_pages(sender, instance, **kwargs):
+    bump_feeds(SITE_FEED, f'group:{instance.slug}')
+
+
+@receiver(pre_save, sender=User)
+@receiver(pre_save, sender=Group)
+def remember_card_fields(sender, instance, update_fields=None, **kwargs):
+    fields = CARD_FIELDS[sender]
+    instance._card_fields = None
+    if instance.pk is None:
+        return
+    if update_fields is not None and not set(update_fields) & set(fields):
+        return
+    instance._card_fields = sender.objects.filter(
+        pk=instance.pk
+    ).values_list(*fields).first()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Group)
+def refresh_post_cards(sender, instance, created, raw=False, **kwargs):
+    saved = getattr(instance, '_card_fields', None)
+    if created or raw or saved is None:
+        return
+    if saved != tuple(getattr(instance, f) for f in CARD_FIELDS[sender]):
+        field = 'author' if sender is User else 'group'
+        bump_post_versions(**{field: instance})
+        bump_feeds(SITE_FEED)
+
+
+@receiver(post_save, sender=Group)
+def refresh_group_pages(sender, instance, created, raw=False, **kwargs):
+    # Заголовок и описание выводятся на странице группы, а не в карточках.
+    if created or raw:
+        return
+    feeds = {f'group:{instance.slug}'}
+    saved = getattr(instance, '_card_fields', None)
+    if saved is not None:
+        feeds.add(f'group:{saved[0]}')
+    bump_feeds(*feeds)
@@ -0,0 +1,71 @@
+"""Хранилище картинок постов с адресацией по содержимому.
+
+Имя файла — это SHA-256 его содержимого, разложенный по подкаталогам
+(`posts/ab/cd/abcd….jpg`). Одинаковые картинки хранятся один раз, а
+миниатюры sorl-thumbnail, привязанные к имени исходника, становятся общими
+для всех постов с этой картинкой. Ссылками на файл служат строки Post:
+файл удаляется, когда на него не ссылается ни один пост.
+
+Пост с картинкой сохраняется уже после записи файла, поэтому свежие файлы
+не удаляются: повторное использование файла обновляет его mtime, и сборка
+мусора пропускает файлы моложе POST_IMAGE_COLLECT_GRACE секунд.
+"""
+import hashlib
+import os
+import posixpath
+import time
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+
+    def content_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        digest = digest.hexdigest()
+        extension = os.path.splitext(name)[1].lower()
+        return posixpath.join(
+            posixpath.dirname(name), digest[:2], digest[2:4],
+            digest + extension
+        )
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.content_name(name, content)
+        try:
+            # Продлить жизнь файлу, пока не сохранён ссылающийся на него пост.
+            os.utime(self.path(name))
+            return name
+        except FileNotFoundError:
+            return self._save(name, content)
+
+    def _save(self, name, content):
+        try:
+            return super()._save(name, content)
+        except FileExistsError:
+            # Тот же файл успела записать параллельная загрузка.
+            return name
+
+    def get_available_name(self, name, max_length=None):
+        # Другого имени у содержимого нет: занятое имя — это тот же файл.
+        raise FileExistsError(name)
+
+    def is_fresh(self, name):
+        """Файл записан или переиспользован меньше grace-периода назад."""
+        grace = getattr(settings, 'POST_IMAGE_COLLECT_GRACE', 60 * 60)
+        try:
+            return time.time() - os.path.getmtime(self.path(name)) < grace
+        except FileNotFoundError:
+            return False
+
+
+post_image_storage = ContentAddressedStorage()
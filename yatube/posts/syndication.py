@@ -0,0 +1,199 @@
+"""Atom и RSS для общей ленты, групп и авторов.
+
+Документ отдаётся потоком: сначала заголовок ленты, затем записи в порядке
+индекса (pub_date, id). XML записи кэшируется по id и версии поста, как
+карточка в caching.py, поэтому сборка ленты — один запрос постов и одно
+чтение кэша. Last-Modified — дата последнего поста, а ETag включает ещё и
+поколения ленты, чтобы правки тоже меняли ответ. Опрос без изменений
+получает 304 после одного запроса по индексу, до выборки постов.
+"""
+from calendar import timegm
+from io import StringIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import router
+from django.http import HttpResponseNotAllowed, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.feedgenerator import Atom1Feed, Rss201rev2Feed, RssFeed
+from django.utils.http import http_date, quote_etag
+from django.utils.text import Truncator
+from django.utils.timezone import now
+from django.utils.xmlutils import SimplerXMLGenerator
+
+from .caching import SITE_FEED, count, feed_generations, make_etag
+from .models import Group, Post, User
+
+FEED_ITEMS = getattr(settings, 'SYNDICATION_ITEMS', 20)
+ENTRY_TIMEOUT = getattr(settings, 'SYNDICATION_ENTRY_TIMEOUT', 60 * 60 * 24)
+# Сколько секунд читалка может не перезапрашивать ленту.
+MAX_AGE = getattr(settings, 'SYNDICATION_MAX_AGE', 60 * 5)
+FORMATS = {'atom': Atom1Feed, 'rss': Rss201rev2Feed}
+
+
+def entry_key(feed_type, host, post):
+    return 'syndication:{}:{}:{}:{}'.format(
+        feed_type.__name__, host, post.pk, post.version
+    )
+
+
+def author_name(user):
+    return user.get_full_name() or user.username
+
+
+def render_entry(feed_type, request, post):
+    """XML одной записи: <entry> для Atom, <item> для RSS."""
+    link = request.build_absolute_uri(
+        reverse('posts:post_detail', args=[post.pk])
+    )
+    feed = feed_type('', '', '')
+    feed.add_item(
+        title=Truncator(post.text).words(8),
+        link=link,
+        description=post.text,
+        unique_id=link,
+        author_name=author_name(post.author),
+        pubdate=post.pub_date,
+        categories=[post.group.title] if post.group else (),
+    )
+    output = StringIO()
+    feed.write_items(SimplerXMLGenerator(output, 'utf-8'))
+    return output.getvalue()
+
+
+def split_document(feed):
+    """Документ ленты без записей, разрезанный на начало и конец."""
+    output = StringIO()
+    feed.write(output, 'utf-8')
+    document = output.getvalue()
+    end = document.rindex(
+        '</channel>' if isinstance(feed, RssFeed) else '</feed>'
+    )
+    return document[:end], document[end:]
+
+
+class PostFeed:
+    """Лента постов в формате `feed_type`.
+
+    Как `django.contrib.syndication.views.Feed`, экземпляр — это view,
+    а подклассы задают объект ленты, посты и заголовки. `feed` — шаблон
+    имени ленты из caching.py, например `'group:{slug}'`.
+    """
+    feed = 'index'
+    # Лента только читает: ReplicaRoutingMiddleware пустит её на реплику.
+    replica_reads = True
+
+    def __init__(self, feed_type):
+        self.feed_type = feed_type
+
+    def get_object(self, **kwargs):
+        return None
+
+    def items(self, obj):
+        return Post.objects.all()
+
+    def title(self, obj):
+        return 'Yatube: последние записи'
+
+    def link(self, obj):
+        return reverse('posts:index')
+
+    def __call__(self, request, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return HttpResponseNotAllowed(['GET', 'HEAD'])
+        obj = self.get_object(**kwargs)
+        # Записи читаются уже при отдаче тела: база выбирается сейчас.
+        posts = self.items(obj).using(router.db_for_read(Post)).order_by(
+            '-pub_date', '-pk'
+        )
+        latest = posts.values_list('pub_date', flat=True).first()
+        last_modified = timegm(latest.utctimetuple()) if latest else None
+        etag = quote_etag(make_etag(
+            request.build_absolute_uri(request.path), latest,
+            *feed_generations(SITE_FEED, self.feed.format(**kwargs))
+        ))
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is not None:
+            count('syndication.not_modified')
+        else:
+            response = StreamingHttpResponse(
+                self.stream(request, obj, posts, latest),
+                content_type=self.feed_type.content_type
+            )
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, max_age=MAX_AGE)
+        return response
+
+    def stream(self, request, obj, posts, latest):
+        feed = self.feed_type(
+            title=self.title(obj),
+            link=request.build_absolute_uri(self.link(obj)),
+            description=self.title(obj),
+            feed_url=request.build_absolute_uri(request.path),
+            language=settings.LANGUAGE_CODE,
+        )
+        # Записей в объекте нет: дата обновления ленты — дата поста.
+        feed.latest_post_date = lambda: latest or now()
+        head, tail = split_document(feed)
+        yield head
+        posts = list(posts.for_feed()[:FEED_ITEMS])
+        host = request.get_host()
+        keys = [entry_key(self.feed_type, host, post) for post in posts]
+        cached = cache.get_many(keys)
+        rendered = {}
+        for key, post in zip(keys, posts):
+            entry = cached.get(key)
+            if entry is None:
+                count('syndication_entry.miss')
+                entry = rendered[key] = render_entry(
+                    self.feed_type, request, post
+                )
+            else:
+                count('syndication_entry.hit')
+            yield entry
+        if rendered:
+            cache.set_many(rendered, ENTRY_TIMEOUT)
+        yield tail
+
+
+class GroupFeed(PostFeed):
+    feed = 'group:{slug}'
+
+    def get_object(self, slug):
+        return get_object_or_404(
+            Group.objects.only('title', 'slug'), slug=slug
+        )
+
+    def items(self, group):
+        return Post.objects.filter(group_id=group.pk)
+
+    def title(self, group):
+        return f'Yatube: {group.title}'
+
+    def link(self, group):
+        return reverse('posts:group_list', args=[group.slug])
+
+
+class AuthorFeed(PostFeed):
+    feed = 'author:{username}'
+
+    def get_object(self, username):
+        return get_object_or_404(
+            User.objects.only('username', 'first_name', 'last_name'),
+            username=username
+        )
+
+    def items(self, author):
+        return Post.objects.filter(author_id=author.pk)
+
+    def title(self, author):
+        return f'Yatube: {author_name(author)}'
+
+    def link(self, author):
+        return reverse('posts:profile', args=[author.username])
@@ -0,0 +1,12 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from posts.caching import POST_CARD_TEMPLATE, render_post_card
+
+register = template.Library()
+
+
+@register.simple_tag
+def post_card(post, template_name=POST_CARD_TEMPLATE):
+    """Карточка поста из кэша фрагментов."""
+    return mark_safe(render_post_card(post, template_name))
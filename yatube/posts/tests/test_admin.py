@@ -0,0 +1,62 @@
+from unittest import mock
+
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Group, Post, User
+from posts.paginators import EstimatedCountPaginator
+
+CHANGELIST_URL = reverse('admin:posts_post_changelist')
+
+
+class PostAdminTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'a@a.ru', 'pass')
+        cls.groups = [
+            Group.objects.create(title=f'Группа {n}', slug=f'group-{n}')
+            for n in range(5)
+        ]
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.admin)
+
+    def create_posts(self, number):
+        start = Post.objects.count()
+        for n in range(start, start + number):
+            author = User.objects.create_user(username=f'admin_author_{n}')
+            Post.objects.create(
+                author=author, text=f'Пост {n}',
+                group=self.groups[n % len(self.groups)]
+            )
+
+    def changelist_queries(self, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(CHANGELIST_URL, params)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        self.create_posts(3)
+        few = self.changelist_queries()
+        self.create_posts(30)
+        self.assertEqual(self.changelist_queries(), few)
+
+    def test_date_filter(self):
+        self.create_posts(3)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(CHANGELIST_URL, {
+                'pub_date__gte': '2000-01-01 00:00:00+00:00',
+                'pub_date__lt': '2100-01-01 00:00:00+00:00',
+            })
+        self.assertEqual(len(response.context['cl'].result_list), 3)
+        self.assertFalse([q for q in queries if 'django_datetime' in q['sql']])
+
+    def test_count_is_capped(self):
+        self.create_posts(5)
+        with mock.patch.object(EstimatedCountPaginator, 'COUNT_LIMIT', 3):
+            paginator = EstimatedCountPaginator(Post.objects.all(), 2)
+            self.assertEqual(paginator.count, 3)
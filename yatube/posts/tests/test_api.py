@@ -0,0 +1,141 @@
+import json
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Comment, Group, Post, User
+
+API_POSTS_URL = reverse('posts:api_posts')
+
+
+class ApiTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='api_author')
+        cls.group = Group.objects.create(
+            title='Группа', slug='api-group', description=''
+        )
+        Post.objects.bulk_create(
+            Post(author=cls.author, group=cls.group if n % 2 else None,
+                 text=f'Пост {n}')
+            for n in range(25)
+        )
+        cls.post = Post.objects.filter(group=cls.group).first()
+        Comment.objects.bulk_create(
+            Comment(post=cls.post, author=cls.author, text=f'Ответ {n}')
+            for n in range(15)
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+
+    def get(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return json.loads(b''.join(response.streaming_content))
+
+    def walk(self, url, **params):
+        """Все строки ленты, страница за страницей."""
+        rows = []
+        data = self.get(url, **params)
+        rows.extend(data['results'])
+        while data['next']:
+            data = self.get(url, cursor=data['next'], **params)
+            rows.extend(data['results'])
+        return rows
+
+    def test_feeds_page_through_every_post_once(self):
+        feeds = (
+            (API_POSTS_URL, Post.objects.all()),
+            (reverse('posts:api_group_posts', args=[self.group.slug]),
+             self.group.posts.all()),
+            (reverse('posts:api_profile_posts', args=[self.author]),
+             self.author.posts.all()),
+        )
+        for url, queryset in feeds:
+            with self.subTest(url=url):
+                rows = self.walk(url, limit=10)
+                expected = list(queryset.order_by(
+                    '-pub_date', '-pk'
+                ).values_list('pk', flat=True))
+                self.assertEqual([row['id'] for row in rows], expected)
+
+    def test_full_row(self):
+        row = self.get(API_POSTS_URL, limit=1)['results'][0]
+        post = Post.objects.order_by('-pub_date', '-pk').first()
+        self.assertEqual(row, {
+            'id': post.pk,
+            'text': post.text,
+            'pub_date': post.pub_date.isoformat(),
+            'author': 'api_author',
+            'group': post.group.slug if post.group else None,
+            'image': None,
+            'comment_count': post.comment_count,
+        })
+
+    def test_sparse_fields_limit_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            data = self.get(API_POSTS_URL, fields='id,text')
+        self.assertEqual(set(data['results'][0]), {'id', 'text'})
+        sql = next(
+            query['sql'] for query in queries
+            if 'FROM "posts_post"' in query['sql']
+        )
+        self.assertNotIn('JOIN', sql)
+        self.assertNotIn('"image"', sql)
+
+    def test_bad_parameters(self):
+        for params in ({'fields': 'id,password'}, {'limit': 'many'},
+                       {'cursor': 'broken'}):
+            with self.subTest(params=params):
+                response = self.client.get(API_POSTS_URL, params)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', json.loads(response.content))
+
+    def test_post_and_comments(self):
+        url = reverse('posts:api_post', args=[self.post.pk])
+        response = self.client.get(url, {'fields': 'id,author,group'})
+        self.assertEqual(json.loads(response.content), {
+            'id': self.post.pk, 'author': 'api_author', 'group': 'api-group'
+        })
+        rows = self.walk(
+            reverse('posts:api_post_comments', args=[self.post.pk]),
+            limit=4, fields='text'
+        )
+        self.assertEqual(
+            [row['text'] for row in rows],
+            [f'Ответ {n}' for n in reversed(range(15))]
+        )
+
+    def test_missing_objects(self):
+        for url in (reverse('posts:api_post', args=[0]),
+                    reverse('posts:api_post_comments', args=[0]),
+                    reverse('posts:api_group_posts', args=['missing']),
+                    reverse('posts:api_profile_posts', args=['missing'])):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_feed_conditional_get(self):
+        response = self.client.get(API_POSTS_URL)
+        b''.join(response.streaming_content)
+        response = self.client.get(
+            API_POSTS_URL, HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_api_ignores_session_and_caches_pages(self):
+        self.client.force_login(self.author)
+        with self.assertNumQueries(1):
+            self.get(API_POSTS_URL)
+        with self.assertNumQueries(0):
+            response = self.client.get(API_POSTS_URL)
+        self.assertFalse(response.streaming)
+        self.assertEqual(len(json.loads(response.content)['results']), 10)
+        Post.objects.create(author=self.author, text='Свежий')
+        data = self.get(API_POSTS_URL, fields='text')
+        self.assertEqual(data['results'][0], {'text': 'Свежий'})
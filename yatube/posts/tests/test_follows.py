@@ -0,0 +1,136 @@
+import json
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import AuthorStats, Follow, Post, TimelineEntry, User
+from posts.views import PEOPLE_PER_PAGE
+
+
+def follow_queries(fetch):
+    """Число запросов к таблице подписок, которые выполнил fetch()."""
+    with CaptureQueriesContext(connection) as captured:
+        response = fetch()
+    return response, sum(
+        'posts_follow' in query['sql'] for query in captured
+    )
+
+
+class FollowGraphTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user(username='reader')
+        cls.author = User.objects.create_user(username='author')
+        cls.fans = [
+            User.objects.create(username=f'fan{n}')
+            for n in range(PEOPLE_PER_PAGE + 5)
+        ]
+        Follow.objects.bulk_create(
+            Follow(user=fan, author=cls.author) for fan in cls.fans
+        )
+        Follow.objects.create(user=cls.reader, author=cls.fans[0])
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.reader)
+
+    def test_profile_follow_state_is_cached(self):
+        url = reverse('posts:profile', args=[self.fans[0].username])
+        response, queries = follow_queries(lambda: self.client.get(url))
+        self.assertTrue(response.context['following'])
+        self.assertEqual(queries, 1)
+        url = reverse('posts:profile', args=[self.author.username])
+        response, queries = follow_queries(lambda: self.client.get(url))
+        self.assertFalse(response.context['following'])
+        self.assertEqual(queries, 0)
+
+    def test_follow_changes_profile(self):
+        url = reverse('posts:profile', args=[self.author.username])
+        etag = self.client.get(url)['ETag']
+        self.client.get(
+            reverse('posts:profile_follow', args=[self.author.username])
+        )
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['following'])
+        self.client.get(
+            reverse('posts:profile_unfollow', args=[self.author.username])
+        )
+        self.assertFalse(self.client.get(url).context['following'])
+
+    def test_followers_pages(self):
+        url = reverse('posts:followers', args=[self.author.username])
+        response = self.client.get(url)
+        people = response.context['people']
+        self.assertEqual(len(people), PEOPLE_PER_PAGE)
+        self.assertEqual(people[0], self.fans[-1])
+        next_page = self.client.get(
+            url, {'cursor': response.context['page_obj'].next_cursor}
+        )
+        seen = people + next_page.context['people']
+        self.assertEqual(
+            sorted(user.pk for user in seen),
+            sorted(fan.pk for fan in self.fans)
+        )
+        self.assertContains(
+            next_page,
+            reverse('posts:profile_unfollow', args=[self.fans[0].username])
+        )
+
+    def test_following_page(self):
+        response = self.client.get(
+            reverse('posts:following', args=[self.reader.username])
+        )
+        self.assertEqual(response.context['people'], [self.fans[0]])
+        self.assertEqual(
+            self.client.get(
+                reverse('posts:following', args=['missing'])
+            ).status_code, 404
+        )
+
+
+class BulkFollowTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='newcomer')
+        cls.authors = [
+            User.objects.create_user(username=f'writer{n}') for n in range(3)
+        ]
+        Post.objects.create(author=cls.authors[0], text='Первый пост')
+        Follow.objects.create(user=cls.user, author=cls.authors[2])
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def test_bulk_follow(self):
+        url = reverse('posts:profile', args=['writer0'])
+        self.assertFalse(self.client.get(url).context['following'])
+        response = self.client.post(reverse('posts:bulk_follow'), {
+            'username': ['writer0', 'writer1', 'writer2', 'newcomer',
+                         'missing', 'writer0'],
+        })
+        self.assertEqual(
+            json.loads(response.content), {'followed': ['writer0', 'writer1']}
+        )
+        self.assertEqual(
+            set(Follow.objects.filter(user=self.user).values_list(
+                'author__username', flat=True
+            )),
+            {'writer0', 'writer1', 'writer2'}
+        )
+        self.assertEqual(
+            AuthorStats.objects.get(user=self.authors[0]).follower_count, 1
+        )
+        self.assertTrue(
+            TimelineEntry.objects.filter(user=self.user).exists()
+        )
+        self.assertTrue(self.client.get(url).context['following'])
+
+    def test_bad_requests(self):
+        url = reverse('posts:bulk_follow')
+        self.assertEqual(self.client.get(url).status_code, 405)
+        self.assertEqual(self.client.post(url).status_code, 400)
@@ -1,17 +1,36 @@
+import hashlib
+import os
 import shutil
 import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
 
 from django import forms
 from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image
 
+from posts import thumbnails
 from posts.models import Group, Post, User
 from posts.forms import PostForm
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
 NEW_POST = reverse('posts:post_create')
 
 
@@ -58,6 +77,7 @@ class PostCreateFormTests(TestCase):
         shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
 
     def setUp(self):
+        cache.clear()
         self.guest_client = Client()
         self.authorized_client = Client()
         self.authorized_client.force_login(self.user)
@@ -95,12 +115,13 @@ class PostCreateFormTests(TestCase):
         self.assertEqual(data['group'], post.group.id)
         self.assertEqual(post.author, self.user)
         self.assertRedirects(response, self.PROFILE_URL)
+        digest = hashlib.sha256(small_gif).hexdigest()
         self.assertTrue(
             Post.objects.filter(
                 author=self.user,
                 text='test text',
                 group=self.group.pk,
-                image='posts/small.gif',
+                image=f'posts/{digest[:2]}/{digest[2:4]}/{digest}.gif',
             ).exists()
         )
 
@@ -141,3 +162,195 @@ class PostCreateFormTests(TestCase):
                 group=self.group.id
             ).exists()
         )
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, TASKS_EAGER=True)
+class PostThumbnailTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='thumb_author')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        # Записи sorl о миниатюрах кэшируются, а файлы удаляются с MEDIA_ROOT.
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def upload(self, name='thumb.gif'):
+        return SimpleUploadedFile(name, SMALL_GIF, content_type='image/gif')
+
+    def test_thumbnail_is_stored_on_post(self):
+        """Миниатюра готовится при сохранении и выводится без sorl."""
+        self.authorized_client.post(
+            NEW_POST, {'text': 'С картинкой', 'image': self.upload()}
+        )
+        post = Post.objects.get(text='С картинкой')
+        self.assertTrue(post.thumbnail_url)
+        relative = post.thumbnail_url[len(settings.MEDIA_URL):]
+        self.assertTrue(
+            os.path.exists(os.path.join(TEMP_MEDIA_ROOT, relative))
+        )
+        with CaptureQueriesContext(connection) as queries:
+            html = self.authorized_client.get(
+                reverse('posts:index')
+            ).content.decode()
+        self.assertIn(post.thumbnail_url, html)
+        self.assertFalse(
+            [q for q in queries if 'thumbnail_kvstore' in q['sql']]
+        )
+
+    def test_backfill_command(self):
+        post = Post.objects.create(
+            author=self.user, text='Старый', image=self.upload('old.gif')
+        )
+        Post.objects.filter(pk=post.pk).update(thumbnail_url='')
+        call_command('generate_thumbnails', stdout=StringIO())
+        post.refresh_from_db()
+        self.assertTrue(post.thumbnail_url)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class PostImageUploadTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='upload_author')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        # Счётчики лимита частоты публикаций живут в кэше.
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def post_image(self, content, name='image.png'):
+        return self.authorized_client.post(NEW_POST, {
+            'text': 'Картинка',
+            'image': SimpleUploadedFile(name, content),
+        })
+
+    def png(self, size):
+        buffer = BytesIO()
+        Image.new('RGB', size).save(buffer, format='PNG')
+        return buffer.getvalue()
+
+    def test_oversized_file_is_rejected_without_storing_it(self):
+        with mock.patch('posts.uploads.POST_IMAGE_MAX_SIZE', 100):
+            response = self.post_image(self.png((200, 200)) + b'0' * 1000)
+        form = response.context['form']
+        self.assertTrue(form.has_error('image', 'too_big'))
+        # Текст пришёл до картинки и прочитан, хотя чтение прервано.
+        self.assertNotIn('text', form.errors)
+        self.assertFalse(Post.objects.filter(text='Картинка').exists())
+
+    def test_too_many_pixels_is_rejected_by_header(self):
+        with mock.patch('posts.uploads.POST_IMAGE_MAX_PIXELS', 100):
+            response = self.post_image(self.png((20, 20)))
+        self.assertIn('image', response.context['form'].errors)
+
+    def test_not_an_image_is_rejected(self):
+        response = self.post_image(b'not an image', name='fake.png')
+        self.assertIn('image', response.context['form'].errors)
+
+    def test_valid_image_is_saved(self):
+        self.post_image(self.png((20, 20)))
+        self.assertTrue(
+            Post.objects.filter(text='Картинка').exclude(image='').exists()
+        )
+
+    @override_settings(POST_IMAGE_STRIP_METADATA=True,
+                       TASKS_EAGER=True)
+    def test_metadata_is_stripped_in_background_step(self):
+        buffer = BytesIO()
+        exif = Image.Exif()
+        exif[0x010F] = 'Camera'
+        Image.new('RGB', (20, 20)).save(buffer, format='JPEG', exif=exif)
+        self.post_image(buffer.getvalue(), name='photo.jpg')
+        post = Post.objects.get(text='Картинка')
+        with post.image.open('rb') as source, Image.open(source) as image:
+            self.assertFalse(image.getexif())
+        self.assertTrue(post.thumbnail_url)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, TASKS_EAGER=True,
+                   POST_IMAGE_COLLECT_GRACE=0)
+class ContentAddressedImageTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='dedup_author')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+
+    def create(self, name='same.gif', content=SMALL_GIF):
+        return Post.objects.create(
+            author=self.user, text=name,
+            image=SimpleUploadedFile(name, content, content_type='image/gif')
+        )
+
+    def test_identical_uploads_share_file(self):
+        """Одинаковые картинки хранятся одним файлом с общей миниатюрой."""
+        first = self.create('first.gif')
+        second = self.create('second.gif')
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertEqual(
+            len(os.listdir(os.path.dirname(first.image.path))), 1
+        )
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.thumbnail_url, second.thumbnail_url)
+
+    def test_file_is_collected_after_last_reference(self):
+        first = self.create()
+        second = self.create()
+        path = first.image.path
+        first.delete()
+        self.assertFalse(thumbnails.collect(first.image.name))
+        self.assertTrue(os.path.exists(path))
+        second.delete()
+        self.assertTrue(thumbnails.collect(second.image.name))
+        self.assertFalse(os.path.exists(path))
+
+    def test_concurrent_write_of_same_file(self):
+        """Файл, записанный параллельной загрузкой, не ищет нового имени."""
+        first = self.create()
+        storage = first.image.storage
+        with mock.patch('os.utime', side_effect=FileNotFoundError):
+            name = storage.save(
+                'posts/other.gif',
+                SimpleUploadedFile('other.gif', SMALL_GIF)
+            )
+        self.assertEqual(name, first.image.name)
+
+    @override_settings(POST_IMAGE_COLLECT_GRACE=60)
+    def test_fresh_file_is_kept(self):
+        """Свежий файл может принадлежать ещё не сохранённому посту."""
+        post = self.create()
+        Post.objects.filter(pk=post.pk).delete()
+        self.assertFalse(thumbnails.collect(post.image.name))
+        self.assertTrue(os.path.exists(post.image.path))
+
+    def test_collect_command_removes_orphans(self):
+        post = self.create()
+        orphan = self.create('orphan.gif', SMALL_GIF + b'\x00')
+        path = orphan.image.path
+        Post.objects.filter(pk=orphan.pk).delete()
+        call_command('collect_post_images', stdout=StringIO())
+        self.assertFalse(os.path.exists(path))
+        self.assertTrue(os.path.exists(post.image.path))
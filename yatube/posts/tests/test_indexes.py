@@ -0,0 +1,102 @@
+from unittest import skipUnless
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from posts.models import Comment, Follow, Group, Post, User
+from posts.paginators import CursorPaginator
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN есть в SQLite')
+class FeedIndexTest(TestCase):
+    """Запросы лент читают строки по индексу в нужном порядке."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='indexed')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='indexed', description=''
+        )
+        Post.objects.bulk_create(
+            Post(author=cls.author, group=cls.group, text=str(n))
+            for n in range(30)
+        )
+        cls.post = Post.objects.first()
+        Comment.objects.create(post=cls.post, author=cls.reader, text='Да')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def plans(self, fetch):
+        """Планы всех SELECT, которые выполнил fetch()."""
+        with CaptureQueriesContext(connection) as captured:
+            fetch()
+        plans = []
+        with connection.cursor() as cursor:
+            for query in captured:
+                cursor.execute('EXPLAIN QUERY PLAN ' + query['sql'])
+                plans.append(' / '.join(row[-1] for row in cursor))
+        return plans
+
+    def assertUsesIndex(self, fetch, index='INDEX'):
+        plans = self.plans(fetch)
+        self.assertTrue(plans)
+        for plan in plans:
+            self.assertIn(index, plan)
+            self.assertNotIn('TEMP B-TREE', plan)
+
+    def feed_pages(self, queryset):
+        """Первая, следующая, предыдущая и последняя страницы ленты."""
+        paginator = CursorPaginator(queryset, 10)
+        page = paginator.get_page(1)
+        return [
+            lambda: paginator.get_page(1),
+            lambda: paginator.get_page(2),
+            lambda: paginator.page_by_cursor(page.next_cursor),
+            lambda: paginator.page_by_cursor(
+                paginator.page_by_cursor(page.next_cursor).previous_cursor
+            ),
+            lambda: paginator.page_by_cursor(paginator.last_cursor),
+        ]
+
+    def test_feeds(self):
+        feeds = (
+            (Post.objects.for_feed(), 'post_date_idx'),
+            (self.group.posts.for_feed(), 'post_group_date_idx'),
+            (self.author.posts.for_feed(), 'post_author_date_idx'),
+        )
+        for queryset, index in feeds:
+            for number, fetch in enumerate(self.feed_pages(queryset)):
+                with self.subTest(index=index, page=number):
+                    self.assertUsesIndex(fetch, index)
+
+    def test_comments(self):
+        self.assertUsesIndex(
+            lambda: list(self.post.comments.all()), 'comment_post_create_idx'
+        )
+
+    def test_follow_lookups(self):
+        self.assertUsesIndex(
+            lambda: Follow.objects.filter(
+                user=self.reader, author=self.author
+            ).exists()
+        )
+        self.assertUsesIndex(
+            lambda: list(Follow.objects.filter(
+                user=self.reader
+            ).values_list('author', flat=True)),
+            'follow_user_author_idx'
+        )
+
+    def test_follow_lists(self):
+        # SQLite может выбрать и индекс внешнего ключа: rowid в нём уже
+        # упорядочен, досортировки нет и так.
+        for queryset in (Follow.objects.filter(author=self.author),
+                         Follow.objects.filter(user=self.reader)):
+            paginator = CursorPaginator(queryset, 10, keys=('pk',))
+            page = paginator.get_page(1)
+            with self.subTest(query=str(queryset.query)):
+                self.assertUsesIndex(lambda: paginator.get_page(1))
+                self.assertUsesIndex(
+                    lambda: paginator.page_by_cursor(page.next_cursor)
+                )
@@ -1,7 +1,10 @@
+from io import StringIO
+
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
 from django.test import TestCase
 
-from posts.models import Group, Post, User
+from posts.models import AuthorStats, Comment, Group, Post, User
 
 User = get_user_model()
 
@@ -65,3 +68,74 @@ class PostModelTest(TestCase):
         p4 = PostModelTest.group.title
         self.assertEqual(p1, p2, 'post error')
         self.assertEqual(p3, p4, 'group error')
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='counter_author')
+        cls.reader = User.objects.create_user(username='counter_reader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='counters', description='Описание'
+        )
+        cls.other_group = Group.objects.create(
+            title='Другая', slug='counters-other', description='Описание'
+        )
+
+    def refresh(self):
+        self.user.stats.refresh_from_db()
+        self.group.refresh_from_db()
+        self.other_group.refresh_from_db()
+
+    def test_counters_follow_posts_and_comments(self):
+        """Счётчики меняются при создании, переносе и удалении."""
+        post = Post.objects.create(
+            author=self.user, group=self.group, text='Пост'
+        )
+        Post.objects.create(author=self.user, text='Без группы')
+        Comment.objects.create(post=post, author=self.reader, text='Ок')
+        comment = Comment.objects.create(
+            post=post, author=self.reader, text='Ещё'
+        )
+        self.refresh()
+        post.refresh_from_db()
+        self.assertEqual(self.user.stats.post_count, 2)
+        self.assertEqual(self.group.post_count, 1)
+        self.assertEqual(post.comment_count, 2)
+
+        post.group = self.other_group
+        post.save()
+        comment.delete()
+        self.refresh()
+        post.refresh_from_db()
+        self.assertEqual(self.group.post_count, 0)
+        self.assertEqual(self.other_group.post_count, 1)
+        self.assertEqual(post.comment_count, 1)
+
+        post.delete()
+        self.refresh()
+        self.assertEqual(self.user.stats.post_count, 1)
+        self.assertEqual(self.other_group.post_count, 0)
+
+    def test_cascade_delete_of_commenter(self):
+        commenter = User.objects.create_user(username='short_lived')
+        post = Post.objects.create(author=self.user, text='Пост')
+        Comment.objects.create(post=post, author=commenter, text='Ок')
+        commenter.delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 0)
+
+    def test_rebuild_counters_command(self):
+        post = Post.objects.create(
+            author=self.user, group=self.group, text='Пост'
+        )
+        Comment.objects.create(post=post, author=self.reader, text='Ок')
+        Post.objects.update(comment_count=0)
+        Group.objects.update(post_count=0)
+        AuthorStats.objects.all().delete()
+        call_command('rebuild_counters', stdout=StringIO())
+        self.refresh()
+        post.refresh_from_db()
+        self.assertEqual(self.user.stats.post_count, 1)
+        self.assertEqual(self.group.post_count, 1)
+        self.assertEqual(post.comment_count, 1)
@@ -0,0 +1,118 @@
+import json
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from posts import search
+from posts.models import Post, SearchTerm, User
+
+SEARCH_URL = reverse('posts:search')
+SEARCH_API_URL = reverse('posts:search_api')
+
+
+class StemmerTest(TestCase):
+    def test_word_forms_share_stem(self):
+        for forms in (('котики', 'котиков', 'котикам'),
+                      ('программирование', 'программированием'),
+                      ('бегать', 'бегали', 'бегает')):
+            with self.subTest(forms=forms):
+                self.assertEqual(len({search.stem(w) for w in forms}), 1)
+
+    def test_tokenize(self):
+        self.assertEqual(
+            search.tokenize('Ёжики и Django!'), ['ежик', 'и', 'django']
+        )
+
+
+class SearchTestMixin:
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='searcher')
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+
+    def post(self, text):
+        return Post.objects.create(author=self.user, text=text)
+
+    def found(self, query):
+        response = self.client.get(SEARCH_URL, {'q': query})
+        return [post.pk for post in response.context['page_obj']]
+
+    def test_finds_other_word_forms(self):
+        post = self.post('Мои котики спят на диване')
+        self.post('Собаки гуляют во дворе')
+        self.assertEqual(self.found('котиков'), [post.pk])
+
+    def test_all_words_required(self):
+        both = self.post('Рыжий кот сидит на окне')
+        self.post('Рыжий пёс сидит на крыльце')
+        self.assertEqual(self.found('рыжий кот'), [both.pk])
+
+    def test_ranked_by_relevance(self):
+        weak = self.post('Про погоду, и немного про чай, хлеб и сыр')
+        strong = self.post('Чай, чай и ещё раз чай')
+        self.assertEqual(self.found('чай'), [strong.pk, weak.pk])
+
+    def test_index_follows_edit_and_delete(self):
+        post = self.post('Старый текст')
+        post.text = 'Новый текст'
+        post.save()
+        self.assertEqual(self.found('старый'), [])
+        self.assertEqual(self.found('новый'), [post.pk])
+        post.delete()
+        self.assertEqual(self.found('новый'), [])
+
+    def test_cursor_pages_do_not_overlap(self):
+        for number in range(15):
+            self.post('Заметка номер ' + 'заметка ' * number)
+        first = self.client.get(SEARCH_URL, {'q': 'заметки'})
+        page = first.context['page_obj']
+        self.assertTrue(page.has_next())
+        second = self.client.get(
+            SEARCH_URL, {'q': 'заметки', 'cursor': page.next_cursor}
+        )
+        ids = [post.pk for post in page]
+        ids += [post.pk for post in second.context['page_obj']]
+        self.assertEqual(len(ids), 15)
+        self.assertEqual(len(set(ids)), 15)
+        self.assertFalse(second.context['page_obj'].has_next())
+
+    def test_admin_search_uses_index(self):
+        post = self.post('Модерация записей')
+        self.post('Другая запись')
+        admin = User.objects.create_superuser('admin', 'a@a.ru', 'pass')
+        self.client.force_login(admin)
+        response = self.client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'модерации'}
+        )
+        self.assertEqual(
+            [obj.pk for obj in response.context['cl'].result_list], [post.pk]
+        )
+
+    def test_api(self):
+        post = self.post('Поиск через API')
+        response = self.client.get(SEARCH_API_URL, {'q': 'поиска'})
+        data = json.loads(response.content)
+        self.assertEqual([item['id'] for item in data['results']], [post.pk])
+        self.assertIsNone(data['next'])
+
+
+class FtsSearchTest(SearchTestMixin, TestCase):
+    def test_uses_fts(self):
+        self.assertIsInstance(search.get_index(), search.FtsIndex)
+        self.post('Запись без обратного индекса')
+        self.assertFalse(SearchTerm.objects.exists())
+
+
+@mock.patch('posts.search.get_index', search.TermIndex)
+class TermSearchTest(SearchTestMixin, TestCase):
+    def test_terms_stored(self):
+        post = self.post('кот кот пёс')
+        self.assertEqual(
+            dict(post.search_terms.values_list('term', 'count')),
+            {'кот': 2, 'пес': 1}
+        )
@@ -0,0 +1,139 @@
+from xml.etree import ElementTree
+
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from django.utils.http import http_date
+
+from posts.models import Group, Post, User
+from posts.syndication import FEED_ITEMS
+
+ATOM = '{http://www.w3.org/2005/Atom}'
+
+
+class SyndicationTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='writer', first_name='Лев', last_name='Толстой'
+        )
+        cls.group = Group.objects.create(
+            title='Классика', slug='classic', description=''
+        )
+        Post.objects.bulk_create(
+            Post(author=cls.author, group=cls.group if n % 2 else None,
+                 text=f'Запись {n}')
+            for n in range(FEED_ITEMS + 5)
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def fetch(self, url, **headers):
+        response = self.client.get(url, **headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, ElementTree.fromstring(
+            b''.join(response.streaming_content)
+        )
+
+    def test_atom_entries_in_feed_order(self):
+        response, root = self.fetch(reverse('posts:index_atom'))
+        self.assertTrue(response['Content-Type'].startswith(
+            'application/atom+xml'
+        ))
+        entries = root.findall(f'{ATOM}entry')
+        latest = Post.objects.order_by('-pub_date', '-pk')
+        self.assertEqual(
+            [entry.find(f'{ATOM}summary').text for entry in entries],
+            [post.text for post in latest[:FEED_ITEMS]]
+        )
+        self.assertEqual(
+            entries[0].find(f'{ATOM}author/{ATOM}name').text, 'Лев Толстой'
+        )
+        self.assertEqual(
+            response['Last-Modified'],
+            http_date(latest[0].pub_date.timestamp())
+        )
+
+    def test_group_and_author_rss(self):
+        feeds = (
+            (reverse('posts:group_rss', args=[self.group.slug]),
+             self.group.posts.count()),
+            (reverse('posts:profile_rss', args=[self.author.username]),
+             FEED_ITEMS),
+        )
+        for url, expected in feeds:
+            with self.subTest(url=url):
+                _, root = self.fetch(url)
+                self.assertEqual(len(root.findall('channel/item')), expected)
+        _, root = self.fetch(reverse('posts:group_rss', args=['classic']))
+        self.assertEqual(
+            {item.find('category').text
+             for item in root.findall('channel/item')},
+            {'Классика'}
+        )
+
+    def test_missing_objects(self):
+        for url in (reverse('posts:group_atom', args=['missing']),
+                    reverse('posts:profile_rss', args=['missing'])):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_conditional_get(self):
+        url = reverse('posts:index_rss')
+        response, _ = self.fetch(url)
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']
+            )
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304
+        )
+        post = Post.objects.order_by('pub_date').first()
+        post.text = 'Исправлено'
+        post.save()
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200
+        )
+
+    def test_entries_are_cached(self):
+        url = reverse('posts:index_atom')
+        self.fetch(url)
+        post = Post.objects.order_by('-pub_date', '-pk').first()
+        # Устаревшая запись в кэше была бы видна: текст меняется в обход
+        # save(), версия поста та же.
+        Post.objects.filter(pk=post.pk).update(text='Без новой версии')
+        _, root = self.fetch(url)
+        self.assertEqual(
+            root.find(f'{ATOM}entry/{ATOM}summary').text, post.text
+        )
+        post.text = 'Новая версия'
+        post.save()
+        _, root = self.fetch(url)
+        self.assertEqual(
+            root.find(f'{ATOM}entry/{ATOM}summary').text, 'Новая версия'
+        )
+
+    def test_group_rename_refreshes_entries(self):
+        url = reverse('posts:group_atom', args=[self.group.slug])
+        self.fetch(url)
+        group = Group.objects.get(pk=self.group.pk)
+        group.title = 'Русская классика'
+        group.save()
+        _, root = self.fetch(url)
+        self.assertEqual(
+            root.find(f'{ATOM}entry/{ATOM}category').get('term'),
+            'Русская классика'
+        )
+
+    def test_pages_link_feeds(self):
+        response = self.client.get(
+            reverse('posts:group_list', args=[self.group.slug])
+        )
+        self.assertContains(
+            response, reverse('posts:group_atom', args=[self.group.slug])
+        )
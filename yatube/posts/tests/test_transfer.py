@@ -0,0 +1,139 @@
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from posts import transfer
+from posts.models import Group, Post, User
+
+TEMP_DIR = tempfile.mkdtemp(dir=settings.BASE_DIR)
+PUB_DATE = timezone.make_aware(datetime(2020, 5, 17, 12, 30))
+
+
+class PostTransferTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='exporter')
+        cls.group = Group.objects.create(
+            title='Группа', slug='transfer', description='Описание'
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_DIR, ignore_errors=True)
+
+    def path(self, name):
+        return os.path.join(TEMP_DIR, name)
+
+    def write_jsonl(self, name, records):
+        with open(self.path(name), 'w', encoding='utf-8') as stream:
+            for record in records:
+                stream.write(json.dumps(record, ensure_ascii=False) + '\n')
+        return self.path(name)
+
+    def import_file(self, path, *args):
+        call_command('posts_import', path, *args, stdout=StringIO())
+
+    def test_round_trip(self):
+        for data_format in ('jsonl', 'csv'):
+            with self.subTest(data_format=data_format):
+                Post.objects.all().delete()
+                Post.objects.create(
+                    author=self.user, group=self.group, text='Первый, "в"\nдве'
+                )
+                Post.objects.create(author=self.user, text='Второй')
+                path = self.path(f'posts.{data_format}')
+                call_command('posts_export', path, stderr=StringIO())
+                expected = set(Post.objects.values_list(
+                    'text', 'pub_date', 'author', 'group'
+                ))
+                Post.objects.all().delete()
+                self.import_file(path)
+                self.assertEqual(set(Post.objects.values_list(
+                    'text', 'pub_date', 'author', 'group'
+                )), expected)
+
+    def test_import_keeps_dates_and_rebuilds_counters(self):
+        path = self.write_jsonl('dates.jsonl', [{
+            'text': 'Старый пост', 'pub_date': PUB_DATE.isoformat(),
+            'author': 'exporter', 'group': 'transfer',
+        }])
+        self.import_file(path)
+        post = Post.objects.get(text='Старый пост')
+        self.assertEqual(post.pub_date, PUB_DATE)
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.post_count, 1)
+        self.assertEqual(self.user.stats.post_count, 1)
+
+    def test_unknown_authors(self):
+        records = [
+            {'text': 'Есть', 'author': 'exporter'},
+            {'text': 'Новый', 'author': 'newcomer', 'group': 'fresh'},
+        ]
+        self.import_file(self.write_jsonl('skip.jsonl', records))
+        self.assertEqual(Post.objects.count(), 1)
+        self.import_file(
+            self.write_jsonl('create.jsonl', records), '--create-missing'
+        )
+        post = Post.objects.get(text='Новый')
+        self.assertEqual(post.author.username, 'newcomer')
+        self.assertEqual(post.group.slug, 'fresh')
+        self.assertFalse(post.author.has_usable_password())
+
+    def test_resume_from_checkpoint(self):
+        path = self.write_jsonl('resume.jsonl', [
+            {'text': f'Пост {n}', 'author': 'exporter'} for n in range(5)
+        ])
+        with open(path + '.checkpoint', 'w') as checkpoint:
+            json.dump({'done': 3}, checkpoint)
+        self.import_file(path, '--batch-size', '2')
+        self.assertEqual(
+            sorted(Post.objects.values_list('text', flat=True)),
+            ['Пост 3', 'Пост 4']
+        )
+        with open(path + '.checkpoint') as checkpoint:
+            self.assertEqual(json.load(checkpoint), {'done': 5})
+
+    def test_invalid_date_is_skipped(self):
+        path = self.write_jsonl('bad_dates.jsonl', [
+            {'text': 'Плохая дата', 'author': 'exporter',
+             'pub_date': '2020-13-01T00:00:00'},
+            {'text': 'Хорошая', 'author': 'exporter'},
+        ])
+        output = StringIO()
+        call_command('posts_import', path, stdout=output)
+        self.assertEqual(
+            list(Post.objects.values_list('text', flat=True)), ['Хорошая']
+        )
+        self.assertIn('пропущено: 1', output.getvalue())
+
+    def test_batch_and_checkpoint_commit_together(self):
+        path = self.write_jsonl('crash.jsonl', [
+            {'text': f'Пост {n}', 'author': 'exporter'} for n in range(4)
+        ])
+        write_checkpoint = transfer.write_checkpoint
+
+        def crash_on_last(checkpoint, done):
+            # Сбой при записи контрольной точки второй пачки.
+            if done == 4:
+                raise OSError('Сбой')
+            write_checkpoint(checkpoint, done)
+
+        with mock.patch('posts.transfer.write_checkpoint', crash_on_last):
+            with self.assertRaises(OSError):
+                self.import_file(path, '--batch-size', '2')
+        self.assertEqual(transfer.read_checkpoint(path + '.checkpoint'), 2)
+        self.import_file(path, '--batch-size', '2', '--skip-rebuild')
+        self.assertEqual(
+            sorted(Post.objects.values_list('text', flat=True)),
+            [f'Пост {n}' for n in range(4)]
+        )
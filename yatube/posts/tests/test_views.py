@@ -1,9 +1,15 @@
+from unittest import mock
+
 from django.contrib.auth import get_user_model
+from django.db import connection
 from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django import forms
+from django.core.cache import cache
 
-from posts.models import Post, Group
+from posts.caching import cache_stats
+from posts.models import Comment, Follow, Post, Group, TimelineEntry
 
 User = get_user_model()
 INDEX_URL = reverse('posts:index')
@@ -120,6 +126,10 @@ class PaginatorViewsTest(TestCase):
         ]
         Post.objects.bulk_create(cls.posts)
 
+    def setUp(self):
+        # bulk_create не шлёт сигналов и не сбрасывает кэш страниц.
+        cache.clear()
+
     def test_first_page_contains_ten_records(self):
         """Количество постов на страницах index, group_list, profile
         равно 10.
@@ -159,3 +169,451 @@ class PaginatorViewsTest(TestCase):
             response = self.client.get(url)
             amount_posts = len(response.context.get('page_obj').object_list)
             self.assertEqual(amount_posts, 3)
+
+    def test_cursor_pages_walk_whole_feed(self):
+        """Курсоры next/prev обходят ленту без COUNT и без OFFSET."""
+        url = reverse('posts:index')
+        first_page = self.client.get(url).context['page_obj']
+        self.assertTrue(first_page.has_next())
+        with CaptureQueriesContext(connection) as queries:
+            second_page = self.client.get(
+                url, {'cursor': first_page.next_cursor}
+            ).context['page_obj']
+        sql = ' '.join(query['sql'] for query in queries).upper()
+        self.assertNotIn('COUNT(*)', sql)
+        self.assertNotIn('OFFSET', sql)
+        self.assertEqual(len(second_page.object_list), 3)
+        self.assertFalse(second_page.has_next())
+        self.assertTrue(second_page.has_previous())
+        back = self.client.get(
+            url, {'cursor': second_page.previous_cursor}
+        ).context['page_obj']
+        self.assertEqual(list(back.object_list), list(first_page.object_list))
+        self.assertFalse(back.has_previous())
+        last = self.client.get(
+            url, {'cursor': first_page.last_cursor}
+        ).context['page_obj']
+        self.assertEqual(list(last.object_list)[-1], Post.objects.last())
+
+    def test_broken_cursor_falls_back_to_first_page(self):
+        response = self.client.get(
+            reverse('posts:index'), {'cursor': 'not-a-cursor'}
+        )
+        self.assertEqual(len(response.context['page_obj'].object_list), 10)
+
+
+class FeedQueriesTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(
+            username='FeedAuthor', first_name='Лев', last_name='Толстой'
+        )
+        cls.reader = User.objects.create_user(username='FeedReader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='feed-slug',
+            description='Тестовое описание',
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def add_posts(self, amount):
+        for i in range(amount):
+            post = Post.objects.create(
+                author=self.author, group=self.group, text=f'Пост {i}'
+            )
+            Comment.objects.create(post=post, author=self.reader, text='!')
+
+    def count_queries(self, client, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_feed_queries_do_not_grow_with_page_size(self):
+        """Число запросов в лентах не зависит от числа постов на странице."""
+        urls = (
+            (self.client, reverse('posts:index')),
+            (self.client, reverse('posts:group_list', args=[self.group.slug])),
+            (self.client, reverse('posts:profile', args=[self.author])),
+            (self.reader_client, reverse('posts:follow_index')),
+        )
+        self.add_posts(1)
+        small = [self.count_queries(client, url) for client, url in urls]
+        self.add_posts(9)
+        full = [self.count_queries(client, url) for client, url in urls]
+        self.assertEqual(small, full)
+
+    def test_profile_and_detail_use_stored_counters(self):
+        """Число постов автора берётся из счётчика, без COUNT."""
+        self.add_posts(3)
+        post = Post.objects.first()
+        for url in (reverse('posts:profile', args=[self.author]),
+                    reverse('posts:post_detail', args=[post.pk])):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            sql = ' '.join(query['sql'] for query in queries).upper()
+            with self.subTest(url=url):
+                self.assertNotIn('COUNT(', sql)
+                self.assertEqual(
+                    response.context.get('sum_posts',
+                                         response.context.get('count_post')),
+                    3
+                )
+
+    def test_feed_posts_carry_comment_count(self):
+        self.add_posts(2)
+        response = self.client.get(reverse('posts:index'))
+        for post in response.context['page_obj']:
+            with self.subTest(post=post.pk):
+                self.assertEqual(post.comment_count, 1)
+
+
+class FollowTimelineTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='TimelineAuthor')
+        cls.stranger = User.objects.create_user(username='Stranger')
+        cls.reader = User.objects.create_user(username='TimelineReader')
+        cls.FOLLOW_URL = reverse(
+            'posts:profile_follow', args=[cls.author.username]
+        )
+        cls.UNFOLLOW_URL = reverse(
+            'posts:profile_unfollow', args=[cls.author.username]
+        )
+
+    def setUp(self):
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def feed(self):
+        response = self.reader_client.get(reverse('posts:follow_index'))
+        return [post.text for post in response.context['page_obj']]
+
+    def test_follow_backfills_and_new_posts_fan_out(self):
+        """Лента подписок заполняется при подписке и при новых постах."""
+        Post.objects.create(author=self.author, text='старый')
+        Post.objects.create(author=self.stranger, text='чужой')
+        self.reader_client.get(self.FOLLOW_URL)
+        self.assertEqual(self.feed(), ['старый'])
+        Post.objects.create(author=self.author, text='новый')
+        self.assertEqual(self.feed(), ['новый', 'старый'])
+        self.reader_client.get(self.UNFOLLOW_URL)
+        self.assertEqual(self.feed(), [])
+        self.assertFalse(TimelineEntry.objects.filter(user=self.reader))
+
+    def test_timeline_is_capped(self):
+        self.reader_client.get(self.FOLLOW_URL)
+        with mock.patch('posts.timeline.TIMELINE_LENGTH', 3):
+            for i in range(5):
+                Post.objects.create(author=self.author, text=f'пост {i}')
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.reader).count(), 3
+        )
+        self.assertEqual(self.feed(), ['пост 4', 'пост 3', 'пост 2'])
+
+    def test_heavy_author_is_read_on_demand(self):
+        """Посты авторов с множеством подписчиков подмешиваются при чтении."""
+        Follow.objects.create(user=self.reader, author=self.stranger)
+        with mock.patch('posts.timeline.TIMELINE_FANOUT_LIMIT', 0):
+            self.reader_client.get(self.FOLLOW_URL)
+            for i in range(12):
+                Post.objects.create(
+                    author=self.author if i % 2 else self.stranger,
+                    text=f'пост {i}'
+                )
+            self.assertFalse(TimelineEntry.objects.filter(user=self.reader))
+            first = self.reader_client.get(reverse('posts:follow_index'))
+            page = first.context['page_obj']
+            second = self.reader_client.get(
+                reverse('posts:follow_index'), {'cursor': page.next_cursor}
+            )
+        texts = [post.text for post in page] + [
+            post.text for post in second.context['page_obj']
+        ]
+        self.assertEqual(texts, [f'пост {i}' for i in range(11, -1, -1)])
+
+
+class PostCardCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='CardAuthor')
+        cls.other = User.objects.create_user(username='CardOther')
+        cls.post = Post.objects.create(author=cls.author, text='Первый')
+        Post.objects.create(author=cls.other, text='Второй')
+
+    def setUp(self):
+        cache.clear()
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+
+    def index_html(self, client=None):
+        return (client or self.client).get(INDEX_URL).content.decode()
+
+    def test_each_card_shows_its_own_author(self):
+        html = self.index_html()
+        self.assertIn('>CardAuthor</a>', html)
+        self.assertIn('>CardOther</a>', html)
+
+    def test_cards_are_shared_between_users(self):
+        self.index_html()
+        hits = cache_stats().get('post_card.hit', 0)
+        self.index_html(self.author_client)
+        self.assertEqual(cache_stats().get('post_card.hit', 0), hits + 2)
+
+    def test_edit_and_comment_refresh_card(self):
+        self.index_html()
+        self.author_client.post(
+            reverse('posts:post_edit', args=[self.post.pk]),
+            {'text': 'Исправленный'}
+        )
+        self.assertIn('Исправленный', self.index_html())
+        self.author_client.post(
+            reverse('posts:add_comment', args=[self.post.pk]),
+            {'text': 'Комментарий'}
+        )
+        self.assertIn('комментариев: 1', self.index_html())
+
+    def test_author_rename_refreshes_card(self):
+        self.index_html()
+        self.other.first_name = 'Фёдор'
+        self.other.last_name = 'Достоевский'
+        self.other.save()
+        self.assertIn('Фёдор Достоевский', self.index_html())
+
+
+class AnonymousPageCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='PageAuthor')
+        cls.group = Group.objects.create(
+            title='Группа', slug='page-cache', description='Описание'
+        )
+        Post.objects.create(author=cls.author, group=cls.group, text='Пост')
+        cls.urls = (
+            INDEX_URL,
+            reverse('posts:group_list', args=[cls.group.slug]),
+            reverse('posts:profile', args=[cls.author.username]),
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_repeated_anonymous_get_skips_database(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                first = self.client.get(url)
+                with self.assertNumQueries(0):
+                    second = self.client.get(url)
+                self.assertEqual(first.content, second.content)
+                self.assertEqual(first['ETag'], second['ETag'])
+                self.assertIn('Last-Modified', second)
+
+    def test_conditional_get_returns_304(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                with self.assertNumQueries(0):
+                    response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+
+    def test_new_post_invalidates_pages_immediately(self):
+        etags = [self.client.get(url)['ETag'] for url in self.urls]
+        Post.objects.create(
+            author=self.author, group=self.group, text='Свежий'
+        )
+        for url, etag in zip(self.urls, etags):
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+                self.assertIn('Свежий', response.content.decode())
+
+    def test_group_edit_refreshes_group_page(self):
+        url = reverse('posts:group_list', args=[self.group.slug])
+        etag = self.client.get(url)['ETag']
+        group = Group.objects.get(pk=self.group.pk)
+        group.description = 'Новое описание'
+        group.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Новое описание')
+
+    def test_group_delete_refreshes_pages(self):
+        group_url = reverse('posts:group_list', args=[self.group.slug])
+        self.assertIn(group_url, self.client.get(INDEX_URL).content.decode())
+        etag = self.client.get(group_url)['ETag']
+        Group.objects.filter(pk=self.group.pk).delete()
+        self.assertNotIn(
+            group_url, self.client.get(INDEX_URL).content.decode()
+        )
+        self.assertEqual(
+            self.client.get(group_url, HTTP_IF_NONE_MATCH=etag).status_code,
+            404
+        )
+
+    def test_authenticated_pages_are_not_cached(self):
+        client = Client()
+        client.force_login(self.author)
+        client.get(INDEX_URL)
+        response = client.get(INDEX_URL)
+        self.assertIsNotNone(response.context)
+        anonymous = self.client.get(INDEX_URL)
+        self.assertNotEqual(response['ETag'], anonymous['ETag'])
+        self.assertIn('private', response['Cache-Control'])
+
+
+class ConditionalGetTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='EtagAuthor')
+        cls.group = Group.objects.create(
+            title='Группа', slug='etag-group', description='Описание'
+        )
+        cls.post = Post.objects.create(
+            author=cls.author, group=cls.group, text='Пост'
+        )
+        cls.POST_URL = reverse('posts:post_detail', args=[cls.post.pk])
+
+    def setUp(self):
+        cache.clear()
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+
+    def test_unchanged_pages_answer_304_for_logged_in_user(self):
+        urls = (
+            self.POST_URL,
+            reverse('posts:group_list', args=[self.group.slug]),
+            reverse('posts:profile', args=[self.author.username]),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                # Первый ответ с формой выдаёт CSRF-cookie, он входит в ETag.
+                self.author_client.get(url)
+                etag = self.author_client.get(url)['ETag']
+                response = self.author_client.get(
+                    url, HTTP_IF_NONE_MATCH=etag
+                )
+                self.assertEqual(response.status_code, 304)
+
+    def test_post_detail_304_costs_one_query(self):
+        etag = self.client.get(self.POST_URL)['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                self.POST_URL, HTTP_IF_NONE_MATCH=etag
+            )
+        self.assertEqual(response.status_code, 304)
+
+    def test_comment_and_edit_change_post_etag(self):
+        etag = self.author_client.get(self.POST_URL)['ETag']
+        self.author_client.post(
+            reverse('posts:add_comment', args=[self.post.pk]),
+            {'text': 'Комментарий'}
+        )
+        response = self.author_client.get(
+            self.POST_URL, HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.author_client.post(
+            reverse('posts:post_edit', args=[self.post.pk]),
+            {'text': 'Исправленный'}
+        )
+        response = self.author_client.get(
+            self.POST_URL, HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_if_modified_since_uses_last_change(self):
+        last_modified = self.client.get(self.POST_URL)['Last-Modified']
+        response = self.client.get(
+            self.POST_URL, HTTP_IF_MODIFIED_SINCE=last_modified
+        )
+        self.assertEqual(response.status_code, 304)
+
+
+class CommentPagesTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Commented')
+        cls.readers = [
+            User.objects.create_user(username=f'Commenter{i}')
+            for i in range(3)
+        ]
+        cls.post = Post.objects.create(author=cls.author, text='Пост')
+        cls.POST_URL = reverse('posts:post_detail', args=[cls.post.pk])
+
+    def setUp(self):
+        cache.clear()
+
+    def add_comments(self, amount):
+        start = Comment.objects.count()
+        Comment.objects.bulk_create(
+            Comment(post=self.post, author=self.readers[i % 3],
+                    text=f'Комментарий {start + i}')
+            for i in range(amount)
+        )
+
+    def detail_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.POST_URL)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_detail_cost_does_not_grow_with_comments(self):
+        self.add_comments(3)
+        few = self.detail_queries()
+        self.add_comments(100)
+        self.assertEqual(self.detail_queries(), few)
+
+    def test_pages_cover_all_comments_once(self):
+        self.add_comments(45)
+        response = self.client.get(self.POST_URL)
+        page = response.context['comments']
+        self.assertEqual(len(page), 20)
+        texts = [comment.text for comment in page]
+        url = (reverse('posts:post_comments', args=[self.post.pk])
+               + f'?cursor={page.next_cursor}')
+        self.assertContains(response, url)
+        while page.has_next():
+            response = self.client.get(
+                reverse('posts:post_comments', args=[self.post.pk]),
+                {'cursor': page.next_cursor}
+            )
+            self.assertTemplateUsed(response, 'includes/comments.html')
+            self.assertNotContains(response, '<html')
+            page = response.context['comments']
+            texts.extend(comment.text for comment in page)
+        self.assertEqual(len(texts), 45)
+        self.assertEqual(
+            set(texts), {f'Комментарий {i}' for i in range(45)}
+        )
+        self.assertEqual(texts[0], 'Комментарий 44')
+
+    def test_fragment_loads_authors_in_one_query(self):
+        self.add_comments(30)
+        page = self.client.get(self.POST_URL).context['comments']
+        url = reverse('posts:post_comments', args=[self.post.pk])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'cursor': page.next_cursor})
+        self.assertContains(response, 'Commenter1')
+        comment_queries = [
+            query for query in queries if 'posts_comment' in query['sql']
+        ]
+        self.assertEqual(len(comment_queries), 1)
+        self.assertIn('auth_user', comment_queries[0]['sql'])
+
+    def test_fragment_for_missing_post(self):
+        response = self.client.get(
+            reverse('posts:post_comments', args=[self.post.pk + 100])
+        )
+        self.assertEqual(response.status_code, 404)
@@ -0,0 +1,93 @@
+"""Заранее подготовленные миниатюры картинок постов.
+
+Миниатюра для карточки создаётся не в шаблоне во время запроса, а фоновой
+задачей (core.tasks) после сохранения поста. Готовый адрес записывается в
+`Post.thumbnail_url`, и шаблоны выводят его без обращений к sorl-thumbnail
+и его key-value хранилищу. Там же, если включено POST_IMAGE_STRIP_METADATA,
+картинка перекодируется без EXIF и других метаданных.
+
+Картинки постов общие для одинакового содержимого (см. posts.storage), так
+что файл и его миниатюры удаляются, только когда на них не ссылается
+ни один пост.
+"""
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from PIL import Image
+from sorl.thumbnail import delete, get_thumbnail
+
+from core.tasks import task
+
+from .caching import bump_post_feeds, bump_post_versions
+from .models import Post
+from .storage import post_image_storage
+
+# Размер и параметры совпадают с тем, что раньше делал тег {% thumbnail %}.
+CARD_GEOMETRY = '960x339'
+CARD_OPTIONS = {'crop': 'center', 'upscale': True}
+# Однокадровые форматы, которые можно пересохранить без метаданных.
+STRIP_FORMATS = ('JPEG', 'PNG', 'WEBP')
+
+
+def strip_metadata(post):
+    """Перекодировать картинку поста без метаданных; True, если заменена."""
+    old_name = post.image.name
+    with post.image.open('rb') as source, Image.open(source) as image:
+        if image.format not in STRIP_FORMATS or not (
+                image.info or image.getexif()):
+            return False
+        buffer = BytesIO()
+        image.save(buffer, format=image.format)
+    post.image.save(
+        os.path.basename(old_name), ContentFile(buffer.getvalue()),
+        save=False
+    )
+    if Post.objects.filter(pk=post.pk, image=old_name).update(
+            image=post.image.name):
+        release(old_name)
+        return True
+    release(post.image.name)
+    return False
+
+
+def collect(name):
+    """Удалить картинку и её миниатюры, если на неё не ссылаются посты."""
+    if not name or Post.objects.filter(image=name).exists():
+        return False
+    # Свежий файл может принадлежать посту, который ещё не сохранён.
+    if post_image_storage.is_fresh(name):
+        return False
+    delete(Post(image=name).image)
+    return True
+
+
+def release(name):
+    """Проверить ссылки на картинку после фиксации транзакции."""
+    if name:
+        transaction.on_commit(lambda: collect(name))
+
+
+@task()
+def generate(post_id):
+    """Создать миниатюру поста и сохранить её адрес."""
+    post = Post.objects.filter(pk=post_id).only('image').first()
+    if post is None:
+        return
+    if post.image and getattr(settings, 'POST_IMAGE_STRIP_METADATA', False):
+        strip_metadata(post)
+    url = ''
+    if post.image:
+        url = get_thumbnail(post.image, CARD_GEOMETRY, **CARD_OPTIONS).url
+    # Картинку могли заменить, пока готовилась миниатюра.
+    if Post.objects.filter(pk=post_id, image=post.image.name).exclude(
+            thumbnail_url=url).update(thumbnail_url=url):
+        bump_post_versions(pk=post_id)
+        bump_post_feeds(post_id)
+
+
+def schedule(post_id):
+    """Поставить миниатюру в очередь после фиксации транзакции."""
+    generate.enqueue(post_id, key=f'thumbnail:{post_id}')
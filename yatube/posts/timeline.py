@@ -0,0 +1,150 @@
+"""Материализованная лента подписок (fan-out on write).
+
+Новый пост автора раскладывается по лентам его подписчиков фоновой
+задачей сразу после публикации, поэтому страница `/follow/` читается одним
+диапазоном индекса `(user_id, pub_date, post_id)`. Авторы с очень большим
+числом подписчиков не раскладываются: их посты подмешиваются при чтении
+(fan-out on read).
+"""
+from heapq import merge
+
+from django.conf import settings
+from django.db.models import F, OuterRef, Subquery
+
+from core.tasks import task
+
+from .models import FEED_FIELDS, AuthorStats, Follow, Post, TimelineEntry
+from .paginators import CursorPaginator
+
+TIMELINE_LENGTH = getattr(settings, 'TIMELINE_LENGTH', 1000)
+TIMELINE_FANOUT_LIMIT = getattr(settings, 'TIMELINE_FANOUT_LIMIT', 5000)
+BATCH_SIZE = 500
+
+
+def is_fanned_out(author_id):
+    """Раскладываются ли посты автора по лентам при записи."""
+    followers = AuthorStats.objects.filter(user_id=author_id).values_list(
+        'follower_count', flat=True
+    ).first() or 0
+    return followers <= TIMELINE_FANOUT_LIMIT
+
+
+def trim(user_ids):
+    """Оставить в каждой ленте не больше TIMELINE_LENGTH записей."""
+    oldest_kept = TimelineEntry.objects.filter(
+        user_id=OuterRef('user_id')
+    ).order_by('-pub_date', '-post_id').values('pub_date')[
+        TIMELINE_LENGTH - 1:TIMELINE_LENGTH
+    ]
+    TimelineEntry.objects.filter(
+        user_id__in=user_ids, pub_date__lt=Subquery(oldest_kept)
+    ).delete()
+
+
+@task()
+def fan_out(post_id):
+    """Разложить новый пост по лентам подписчиков автора."""
+    post = Post.objects.filter(pk=post_id).only('author', 'pub_date').first()
+    if post is None or not is_fanned_out(post.author_id):
+        return
+    followers = Follow.objects.filter(author_id=post.author_id).values_list(
+        'user_id', flat=True
+    ).order_by('user_id').iterator()
+    batch = []
+    for user_id in followers:
+        batch.append(user_id)
+        if len(batch) == BATCH_SIZE:
+            _push(post, batch)
+            batch = []
+    if batch:
+        _push(post, batch)
+
+
+def _push(post, user_ids):
+    TimelineEntry.objects.bulk_create(
+        (TimelineEntry(user_id=user_id, post_id=post.pk,
+                       pub_date=post.pub_date) for user_id in user_ids),
+        ignore_conflicts=True
+    )
+    trim(user_ids)
+
+
+@task()
+def backfill(user_id, author_id):
+    """Добавить в ленту последние посты автора после подписки."""
+    if not is_fanned_out(author_id):
+        return
+    posts = Post.objects.filter(author_id=author_id).order_by(
+        '-pub_date'
+    ).values_list('pk', 'pub_date')[:TIMELINE_LENGTH]
+    TimelineEntry.objects.bulk_create(
+        (TimelineEntry(user_id=user_id, post_id=pk, pub_date=pub_date)
+         for pk, pub_date in posts),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True
+    )
+    trim([user_id])
+
+
+def remove(user_id, author_id):
+    """Убрать посты автора из ленты после отписки."""
+    TimelineEntry.objects.filter(
+        user_id=user_id, post__author_id=author_id
+    ).delete()
+
+
+def rebuild_timelines():
+    """Собрать все ленты заново по текущим подпискам."""
+    TimelineEntry.objects.all().delete()
+    for user_id, author_id in Follow.objects.values_list(
+            'user_id', 'author_id').iterator():
+        backfill(user_id, author_id)
+
+
+class TimelinePaginator(CursorPaginator):
+    """Курсорная пагинация ленты подписок.
+
+    Строки берутся из материализованной ленты пользователя и, если он
+    подписан на «тяжёлых» авторов, сливаются с их постами по тем же
+    ключам `(pub_date, post_id)`.
+    """
+
+    def __init__(self, user, per_page):
+        super().__init__(
+            TimelineEntry.objects.filter(user=user), per_page,
+            keys=('pub_date', 'post_id')
+        )
+        self.heavy_authors = list(Follow.objects.filter(
+            user=user, author__stats__follower_count__gt=TIMELINE_FANOUT_LIMIT
+        ).values_list('author_id', flat=True))
+
+    def fetch(self, seek=None, descending=True, offset=0, limit=None):
+        entries = self._ordered(self.object_list, descending).select_related(
+            'post__author', 'post__group'
+        ).only('pub_date', 'post', *('post__' + f for f in FEED_FIELDS))
+        if seek is not None:
+            entries = entries.filter(seek)
+        rows = []
+        for entry in entries[:offset + limit]:
+            entry.post.post_id = entry.post_id
+            rows.append(entry.post)
+        if self.heavy_authors:
+            posts = self._ordered(
+                Post.objects.for_feed().filter(
+                    author_id__in=self.heavy_authors
+                ).annotate(post_id=F('pk')),
+                descending
+            )
+            if seek is not None:
+                posts = posts.filter(seek)
+            rows = self._merge(rows, posts[:offset + limit], descending)
+        return rows[offset:offset + limit]
+
+    def _merge(self, rows, posts, descending):
+        merged, seen = [], set()
+        for post in merge(rows, posts, reverse=descending,
+                          key=lambda post: (post.pub_date, post.post_id)):
+            if post.post_id not in seen:
+                seen.add(post.post_id)
+                merged.append(post)
+        return merged
@@ -0,0 +1,195 @@
+"""Потоковые импорт и экспорт постов в JSONL и CSV.
+
+Записи читаются и пишутся по одной, а в памяти держится только текущая
+пачка, поэтому объём файла не ограничен памятью процесса. При импорте
+авторы и группы ищутся одним запросом на пачку, посты вставляются через
+bulk_create, а номер последней записанной записи сохраняется в файл
+контрольной точки в той же транзакции, что и пачка, — прямо перед её
+фиксацией. Если фиксация не удалась, файл возвращается к прежнему номеру,
+так что при продолжении пачка не загружается второй раз.
+"""
+import csv
+import json
+import os
+from contextlib import contextmanager
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+from django.utils import timezone
+
+from .models import Group, Post, User
+
+FIELDS = ('text', 'pub_date', 'author', 'group', 'image')
+FORMATS = ('jsonl', 'csv')
+BATCH_SIZE = 5000
+# Сколько авторов и групп помнить между пачками.
+LOOKUP_CACHE_SIZE = 100000
+
+
+def guess_format(path, default='jsonl'):
+    extension = os.path.splitext(path)[1].lstrip('.').lower()
+    return extension if extension in FORMATS else default
+
+
+def read_records(stream, data_format):
+    """Записи файла по одной, в виде словарей."""
+    if data_format == 'csv':
+        yield from csv.DictReader(stream)
+        return
+    for line in stream:
+        if line.strip():
+            yield json.loads(line)
+
+
+def export_records(stream, data_format, batch_size=BATCH_SIZE):
+    """Записать все посты в поток; вернуть число записей."""
+    writer = None
+    if data_format == 'csv':
+        writer = csv.DictWriter(stream, fieldnames=FIELDS)
+        writer.writeheader()
+    written = 0
+    last = 0
+    while True:
+        # Keyset по pk: каждая пачка — один запрос по индексу.
+        rows = list(
+            Post.objects.filter(pk__gt=last).order_by('pk').values_list(
+                'pk', 'text', 'pub_date', 'author__username', 'group__slug',
+                'image'
+            )[:batch_size]
+        )
+        if not rows:
+            return written
+        for pk, text, pub_date, author, group, image in rows:
+            record = {
+                'text': text,
+                'pub_date': pub_date.isoformat(),
+                'author': author,
+                'group': group or '',
+                'image': image or '',
+            }
+            if writer is None:
+                stream.write(json.dumps(record, ensure_ascii=False) + '\n')
+            else:
+                writer.writerow(record)
+        written += len(rows)
+        last = rows[-1][0]
+
+
+def read_checkpoint(path):
+    if not path or not os.path.exists(path):
+        return 0
+    with open(path, encoding='utf-8') as checkpoint:
+        return json.load(checkpoint)['done']
+
+
+def write_checkpoint(path, done):
+    if not path:
+        return
+    # Запись через временный файл, чтобы не оставить обрезанный JSON.
+    with open(path + '.tmp', 'w', encoding='utf-8') as checkpoint:
+        json.dump({'done': done}, checkpoint)
+    os.replace(path + '.tmp', path)
+
+
+@contextmanager
+def keep_dates():
+    """Не перезаписывать даты импортируемых постов текущим временем."""
+    fields = [Post._meta.get_field(name) for name in ('pub_date', 'updated')]
+    saved = [(field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, saved):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Importer:
+    """Загрузка пачек записей в базу.
+
+    Неизвестные авторы и группы создаются при `create_missing`, иначе
+    записи с неизвестным автором пропускаются, а неизвестная группа
+    заменяется пустой.
+    """
+
+    def __init__(self, create_missing=False):
+        self.create_missing = create_missing
+        self.authors = {}
+        self.groups = {}
+        self.imported = 0
+        self.skipped = 0
+
+    def _resolve(self, cache, names, model, field, make):
+        if len(cache) > LOOKUP_CACHE_SIZE:
+            cache.clear()
+        missing = {name for name in names if name and name not in cache}
+        if not missing:
+            return
+        found = dict(model.objects.filter(
+            **{f'{field}__in': missing}
+        ).values_list(field, 'pk'))
+        if self.create_missing and missing - found.keys():
+            model.objects.bulk_create(
+                [make(name) for name in missing - found.keys()],
+                ignore_conflicts=True
+            )
+            found = dict(model.objects.filter(
+                **{f'{field}__in': missing}
+            ).values_list(field, 'pk'))
+        cache.update(found)
+
+    @staticmethod
+    def _new_user(username):
+        return User(username=username, password=make_password(None))
+
+    @staticmethod
+    def _new_group(slug):
+        return Group(title=slug, slug=slug, description='')
+
+    def _post(self, record):
+        author_id = self.authors.get(record.get('author'))
+        if author_id is None or not record.get('text'):
+            return None
+        try:
+            pub_date = parse_datetime(record.get('pub_date') or '')
+        except ValueError:
+            # Дата по формату, но несуществующая: 2020-13-01.
+            return None
+        if pub_date is None:
+            pub_date = timezone.now()
+        elif timezone.is_naive(pub_date):
+            pub_date = timezone.make_aware(pub_date)
+        return Post(
+            text=record['text'],
+            pub_date=pub_date,
+            updated=pub_date,
+            author_id=author_id,
+            group_id=self.groups.get(record.get('group')),
+            image=record.get('image') or '',
+        )
+
+    def load(self, records, checkpoint=None, done=0):
+        """Записать пачку в одной транзакции вместе с контрольной точкой.
+
+        `done` — сколько записей файла обработано до этой пачки.
+        """
+        self._resolve(
+            self.authors, {r.get('author') for r in records}, User,
+            'username', self._new_user
+        )
+        self._resolve(
+            self.groups, {r.get('group') for r in records}, Group,
+            'slug', self._new_group
+        )
+        posts = [post for post in map(self._post, records) if post]
+        try:
+            with keep_dates(), transaction.atomic():
+                Post.objects.bulk_create(posts)
+                write_checkpoint(checkpoint, done + len(records))
+        except BaseException:
+            write_checkpoint(checkpoint, done)
+            raise
+        self.imported += len(posts)
+        self.skipped += len(records) - len(posts)
@@ -0,0 +1,51 @@
+"""Потоковая загрузка картинок постов с ограниченным расходом памяти.
+
+Загружаемый файл всегда пишется во временный файл на диске кусками, а не
+собирается в памяти. Как только файл превысил POST_IMAGE_MAX_SIZE, чтение
+тела запроса прекращается: на диск попадает не больше лимита, а остаток
+не читается вовсе. Превысивший лимит файл запоминается в запросе, и
+`request_files()` отдаёт форме его заглушку с размером, так что форма
+отклоняет файл с ошибкой too_big, не открывая его.
+"""
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import (StopUpload,
+                                             TemporaryFileUploadHandler)
+
+POST_IMAGE_MAX_SIZE = getattr(settings, 'POST_IMAGE_MAX_SIZE', 10 * 2 ** 20)
+POST_IMAGE_MAX_PIXELS = getattr(
+    settings, 'POST_IMAGE_MAX_PIXELS', 40 * 10 ** 6
+)
+POST_IMAGE_FORMATS = ('JPEG', 'PNG', 'GIF', 'WEBP')
+
+
+class BoundedTemporaryFileUploadHandler(TemporaryFileUploadHandler):
+    """Пишет загрузку во временный файл и не хранит байты сверх лимита."""
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received <= POST_IMAGE_MAX_SIZE:
+            self.file.write(raw_data)
+            return
+        if self.request is not None:
+            self.request.oversized_uploads = {self.field_name: UploadedFile(
+                name=self.file_name, content_type=self.content_type,
+                size=self.received
+            )}
+        # Поля формы идут до файла и уже прочитаны; остаток тела не нужен.
+        raise StopUpload(connection_reset=True)
+
+
+def request_files(request):
+    """request.FILES и заглушки файлов, загрузка которых прервана."""
+    oversized = getattr(request, 'oversized_uploads', None)
+    if not oversized:
+        return request.FILES
+    files = request.FILES.copy()
+    for field_name, stub in oversized.items():
+        files[field_name] = stub
+    return files
@@ -1,6 +1,7 @@
 from django.urls import path
 
-from . import views
+from . import api, views
+from .syndication import FORMATS, AuthorFeed, GroupFeed, PostFeed
 
 app_name = 'posts'
 
@@ -11,8 +12,14 @@ urlpatterns = [
     path('posts/<int:post_id>/', views.post_detail, name='post_detail'),
     path('create/', views.post_create, name='post_create'),
     path('posts/<int:post_id>/edit/', views.post_edit, name='post_edit'),
+    path(
+        'posts/<int:post_id>/comments/',
+        views.post_comments, name='post_comments'
+    ),
     path('post/<int:post_id>/comment', views.add_comment, name='add_comment'),
     path('follow/', views.follow_index, name='follow_index'),
+    path('search/', views.search, name='search'),
+    path('search/api/', views.search_api, name='search_api'),
     path(
         'profile/<str:username>/follow/',
         views.profile_follow, name='profile_follow'
@@ -21,4 +28,41 @@ urlpatterns = [
         'profile/<str:username>/unfollow/',
         views.profile_unfollow, name='profile_unfollow'
     ),
+    path(
+        'profile/<str:username>/followers/',
+        views.followers, name='followers'
+    ),
+    path(
+        'profile/<str:username>/following/',
+        views.following, name='following'
+    ),
+    path('follow/bulk/', views.bulk_follow, name='bulk_follow'),
+    path('api/posts/', api.posts, name='api_posts'),
+    path('api/posts/<int:post_id>/', api.post, name='api_post'),
+    path(
+        'api/posts/<int:post_id>/comments/',
+        api.post_comments, name='api_post_comments'
+    ),
+    path(
+        'api/group/<slug:slug>/posts/',
+        api.group_posts, name='api_group_posts'
+    ),
+    path(
+        'api/profile/<str:username>/posts/',
+        api.profile_posts, name='api_profile_posts'
+    ),
 ]
+
+# Atom и RSS: /feed/atom/, /group/<slug>/rss/, /profile/<username>/atom/...
+for name, feed_type in FORMATS.items():
+    urlpatterns += [
+        path(f'feed/{name}/', PostFeed(feed_type), name=f'index_{name}'),
+        path(
+            f'group/<slug:slug>/{name}/',
+            GroupFeed(feed_type), name=f'group_{name}'
+        ),
+        path(
+            f'profile/<str:username>/{name}/',
+            AuthorFeed(feed_type), name=f'profile_{name}'
+        ),
+    ]
@@ -1,20 +1,40 @@
-from django.core.paginator import Paginator
+from urllib.parse import urlencode
+
+from django.http import Http404, JsonResponse
 from django.shortcuts import render, get_object_or_404, redirect
+from django.urls import reverse
 from django.contrib.auth.decorators import login_required
-from django.views.decorators.cache import cache_page
+from django.views.decorators.http import condition, require_POST
 import django
 
-from .models import Post, Group, User, Follow
+from core.ratelimit import ratelimit
+from core.routers import replica_reads
+
+from . import uploads
+from .models import Comment, Post, Group, User, Follow
+from .caching import feed_page, post_etag, post_last_modified
+from .follows import BULK_FOLLOW_LIMIT, follow_many, followed_ids
 from .forms import PostForm, CommentForm
+from .paginators import CursorPaginator
+from .search import SearchPaginator
+from .timeline import TimelinePaginator
 
 
 NUMBER_TEN = 10
+PEOPLE_PER_PAGE = 30
+COMMENTS_PER_PAGE = 20
+SEARCH_API_MAX_LIMIT = 50
 
 
 def get_paginator(posts, request):
-    paginator = Paginator(posts, NUMBER_TEN)
+    return get_page_context(CursorPaginator(posts, NUMBER_TEN), request)
+
+
+def get_page_context(paginator, request):
     page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = paginator.get_page(
+        page_number, cursor=request.GET.get('cursor')
+    )
     return {
         'paginator': paginator,
         'page_number': page_number,
@@ -22,49 +42,63 @@ def get_paginator(posts, request):
     }
 
 
+@replica_reads
+@feed_page('index')
 def index(request: django.http.HttpRequest) -> django.http.HttpResponse:
     """Return a HttpResponse whose content is filled with the result of calling
     django.template.loader.render_to_string() with the passed arguments.
     """
     template = 'posts/index.html'
-    context = get_paginator(Post.objects.all(), request)
+    context = get_paginator(Post.objects.for_feed(), request)
     return render(request, template, context)
 
 
+@replica_reads
+@feed_page('group:{slug}')
 def group_posts(request: django.http.HttpRequest,
                 slug: str) -> django.http.HttpResponse:
     """Return a HttpResponse whose content is filled with the result of calling
     django.template.loader.render_to_string() with the passed arguments.
     """
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.all()
     template = 'posts/group_list.html'
     context = {
         'group': group,
-        'posts': posts,
     }
-    context.update(get_paginator(group.posts.all(), request))
+    context.update(get_paginator(group.posts.for_feed(), request))
     return render(request, template, context)
 
 
+@replica_reads
+@feed_page('author:{username}')
 def profile(request: django.http.HttpRequest,
             username: str) -> django.http.HttpResponse:
     """This view render profile page by its username."""
-    author = get_object_or_404(User, username=username)
+    author = get_object_or_404(
+        User.objects.select_related('stats'), username=username
+    )
+    stats = getattr(author, 'stats', None)
     context = {
         'author': author,
+        'sum_posts': stats.post_count if stats else 0,
+        'following': author.pk in followed_ids(request.user),
     }
-    context.update(get_paginator(author.posts.all(), request))
+    context.update(get_paginator(author.posts.for_feed(), request))
     return render(request, 'posts/profile.html', context)
 
 
+@replica_reads
+@condition(etag_func=post_etag, last_modified_func=post_last_modified)
 def post_detail(request: django.http.HttpRequest,
                 post_id: int) -> django.http.HttpResponse:
     """This view render profile page by its username."""
-    post = get_object_or_404(Post, pk=post_id)
+    post = get_object_or_404(
+        Post.objects.select_related('author__stats', 'group'), pk=post_id
+    )
     form = CommentForm()
-    count_post = post.author.posts.count()
-    comments = post.comments.all()
+    stats = getattr(post.author, 'stats', None)
+    count_post = stats.post_count if stats else 0
+    comments = get_comments_page(post.pk)
     context = {
         'author': post.author,
         'post': post,
@@ -75,11 +109,37 @@ def post_detail(request: django.http.HttpRequest,
     return render(request, 'posts/post_detail.html', context)
 
 
+def get_comments_page(post_id, cursor=None):
+    """Страница комментариев поста вместе с авторами, новые сверху."""
+    comments = Comment.objects.filter(post_id=post_id).select_related(
+        'author'
+    ).only('post_id', 'text', 'create', 'author__username')
+    paginator = CursorPaginator(
+        comments, COMMENTS_PER_PAGE, keys=('create', 'pk')
+    )
+    return paginator.get_page(1, cursor=cursor)
+
+
+@replica_reads
+@condition(etag_func=post_etag, last_modified_func=post_last_modified)
+def post_comments(request: django.http.HttpRequest,
+                  post_id: int) -> django.http.HttpResponse:
+    """Следующая страница комментариев — фрагмент HTML без обёртки."""
+    comments = get_comments_page(post_id, request.GET.get('cursor'))
+    if not comments and not Post.objects.filter(pk=post_id).exists():
+        raise Http404
+    return render(request, 'includes/comments.html', {
+        'comments': comments,
+        'post_id': post_id,
+    })
+
+
 @login_required
+@ratelimit('post_create', key='user')
 def post_create(request):
     form = PostForm(
         request.POST or None,
-        files=request.FILES or None
+        files=uploads.request_files(request) or None
     )
     if request.method == "POST":
         if form.is_valid():
@@ -100,7 +160,7 @@ def post_edit(request, post_id):
         return redirect('post:post_detail', post_id=post_id)
     form = PostForm(
         request.POST or None,
-        files=request.FILES or None,
+        files=uploads.request_files(request) or None,
         instance=post
     )
     if form.is_valid():
@@ -114,6 +174,7 @@ def post_edit(request, post_id):
 
 
 @login_required
+@ratelimit('add_comment', key='user')
 def add_comment(request, post_id):
     post = get_object_or_404(Post, id=post_id)
     form = CommentForm(request.POST or None)
@@ -125,23 +186,21 @@ def add_comment(request, post_id):
     return redirect('posts:post_detail', post_id=post_id)
 
 
-@cache_page(60 * 15)
-def my_view(request):
-    return render(request, 'posts/index.html')
-
-
 @login_required
 def follow_index(request):
     """Информация о текущем пользователе доступа."""
-    post = Post.objects.filter(Post, author=request.user)
     context = {
         'title': "Посты в подписке",
-        'post': post,
+        'follow': True,
     }
+    context.update(get_page_context(
+        TimelinePaginator(request.user, NUMBER_TEN), request
+    ))
     return render(request, 'posts/follow.html', context)
 
 
 @login_required
+@ratelimit('follow', key='user', methods=None)
 def profile_follow(request, username):
     """Подписаться на автора."""
     author = get_object_or_404(User, username=username)
@@ -151,9 +210,112 @@ def profile_follow(request, username):
 
 
 @login_required
+@ratelimit('follow', key='user', methods=None)
 def profile_unfollow(request, username):
     """Дизлайк,отписка."""
     Follow.objects.filter(
         user=request.user, author__username=username
     ).delete()
     return redirect("posts:profile", username)
+
+
+def follow_list(request, username, field, title):
+    """Страница подписчиков или подписок, новые подписки сверху."""
+    owner = get_object_or_404(User.objects.only('username'), username=username)
+    other = 'user' if field == 'author' else 'author'
+    follows = Follow.objects.filter(**{field: owner}).select_related(
+        other
+    ).only(other, *(f'{other}__{name}' for name in (
+        'username', 'first_name', 'last_name'
+    )))
+    context = get_page_context(
+        CursorPaginator(follows, PEOPLE_PER_PAGE, keys=('pk',)), request
+    )
+    context.update({
+        'owner': owner,
+        'title': title,
+        'people': [getattr(follow, other) for follow in context['page_obj']],
+        'followed': followed_ids(request.user),
+    })
+    return render(request, 'posts/follow_list.html', context)
+
+
+@replica_reads
+def followers(request, username):
+    """Подписчики автора."""
+    return follow_list(request, username, 'author', 'Подписчики')
+
+
+@replica_reads
+def following(request, username):
+    """Авторы, на которых подписан пользователь."""
+    return follow_list(request, username, 'user', 'Подписки')
+
+
+@login_required
+@require_POST
+@ratelimit('follow', key='user')
+def bulk_follow(request):
+    """Подписаться сразу на нескольких авторов, например при регистрации.
+
+    Имена передаются повторяющимся параметром `username`; в ответе —
+    авторы, на которых подписка появилась только что.
+    """
+    usernames = request.POST.getlist('username')
+    if not usernames or len(usernames) > BULK_FOLLOW_LIMIT:
+        return JsonResponse({
+            'error': f'Нужно от 1 до {BULK_FOLLOW_LIMIT} имён в username'
+        }, status=400, json_dumps_params={'ensure_ascii': False})
+    authors = follow_many(request.user, usernames)
+    return JsonResponse(
+        {'followed': [author.username for author in authors]},
+        json_dumps_params={'ensure_ascii': False}
+    )
+
+
+@replica_reads
+def search(request):
+    """Поиск постов по словам с ранжированием по релевантности."""
+    query = request.GET.get('q', '').strip()
+    context = {
+        'query': query,
+        'page_query': urlencode({'q': query}) + '&',
+    }
+    if query:
+        context.update(get_page_context(
+            SearchPaginator(query, NUMBER_TEN), request
+        ))
+    return render(request, 'posts/search.html', context)
+
+
+@replica_reads
+def search_api(request):
+    """Результаты поиска в JSON с курсором следующей страницы."""
+    query = request.GET.get('q', '').strip()
+    try:
+        limit = int(request.GET.get('limit', NUMBER_TEN))
+    except ValueError:
+        limit = NUMBER_TEN
+    limit = min(max(limit, 1), SEARCH_API_MAX_LIMIT)
+    page_obj = SearchPaginator(query, limit).get_page(
+        1, cursor=request.GET.get('cursor')
+    )
+    return JsonResponse({
+        'query': query,
+        'results': [
+            {
+                'id': post.pk,
+                'text': post.text,
+                'author': post.author.username,
+                'group': post.group.slug if post.group_id else None,
+                'pub_date': post.pub_date.isoformat(),
+                'score': post.score,
+                'url': request.build_absolute_uri(
+                    reverse('posts:post_detail', args=[post.pk])
+                ),
+            }
+            for post in page_obj
+        ],
+        'next': page_obj.next_cursor or None,
+        'previous': page_obj.previous_cursor or None,
+    }, json_dumps_params={'ensure_ascii': False})
@@ -50,6 +50,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.PerformanceMiddleware',
+    'core.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -67,7 +69,7 @@ STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
 TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'core.template_backends.TimedDjangoTemplates',
         # Добавлено: Искать шаблоны на уровне проекта
         'DIRS': [TEMPLATES_DIR],
         'APP_DIRS': True,
@@ -89,12 +91,72 @@ WSGI_APPLICATION = 'yatube.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+# База выбирается переменными окружения. Соединения живут DB_CONN_MAX_AGE
+# секунд и проверяются перед запросом, поэтому их установка не входит в
+# стоимость каждого запроса.
+DB_ENGINE = os.getenv('DB_ENGINE', 'sqlite')
+DB_CONN_MAX_AGE = int(os.getenv('DB_CONN_MAX_AGE', 600))
+
+if DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('DB_NAME', 'yatube'),
+            'USER': os.getenv('DB_USER', 'yatube'),
+            'PASSWORD': os.getenv('DB_PASSWORD', ''),
+            'HOST': os.getenv('DB_HOST', 'localhost'),
+            'PORT': os.getenv('DB_PORT', '5432'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'connect_timeout': int(os.getenv('DB_CONNECT_TIMEOUT', 5)),
+            },
+        }
     }
-}
+    # За PgBouncer в режиме пула транзакций серверные курсоры не работают:
+    # соседние запросы могут попасть в разные серверные соединения.
+    if os.getenv('DB_POOLER') == 'pgbouncer':
+        DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = True
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'core.backends.sqlite3',
+            'NAME': os.getenv('DB_NAME', os.path.join(BASE_DIR, 'db.sqlite3')),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                # Сколько секунд писатель ждёт освобождения блокировки.
+                'timeout': int(os.getenv('DB_TIMEOUT', 20)),
+            },
+            'PRAGMAS': {
+                'journal_mode': 'wal',
+                'synchronous': 'normal',
+                'cache_size': -int(os.getenv('SQLITE_CACHE_KB', 64000)),
+                'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', 2 ** 28)),
+                'temp_store': 'memory',
+            },
+        }
+    }
+
+# Реплики для чтения: через запятую пути к файлам SQLite или адреса
+# серверов PostgreSQL (host[:port]). В тестах реплики — зеркала default.
+DATABASE_REPLICAS = []
+for number, replica in enumerate(
+        filter(None, os.getenv('DB_REPLICAS', '').split(',')), 1):
+    alias = f'replica{number}'
+    DATABASES[alias] = dict(DATABASES['default'], TEST={'MIRROR': 'default'})
+    if DB_ENGINE == 'postgresql':
+        host, _, port = replica.strip().partition(':')
+        DATABASES[alias]['HOST'] = host
+        DATABASES[alias]['PORT'] = port or DATABASES[alias]['PORT']
+    else:
+        DATABASES[alias]['NAME'] = replica.strip()
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+
+# Сколько секунд после записи посетитель читает из основной базы.
+REPLICA_PIN_SECONDS = int(os.getenv('DB_REPLICA_PIN_SECONDS', 5))
 
 
 # Password validation
@@ -150,8 +212,82 @@ CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Общий для процессов кэш выбирается переменной CACHE_BACKEND: sqlite
+# (файл, без внешних сервисов), redis (нужен пакет django-redis), memcached
+# или locmem. Перед ним стоит LRU процесса с инвалидацией по журналу.
+# В отладке кэш по умолчанию живёт в памяти и не переживает перезапуск.
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'locmem' if DEBUG else 'sqlite')
+SHARED_CACHES = {
+    'sqlite': {
+        'BACKEND': 'core.cache.SQLiteCache',
+        'LOCATION': os.getenv(
+            'CACHE_LOCATION', os.path.join(BASE_DIR, 'cache.sqlite3')
+        ),
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+    'redis': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': os.getenv('CACHE_LOCATION', 'redis://127.0.0.1:6379/1'),
+    },
+    'memcached': {
+        'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+        'LOCATION': os.getenv('CACHE_LOCATION', '127.0.0.1:11211'),
+    },
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+        'BACKEND': 'core.cache.TwoLevelCache',
+        'LOCATION': 'shared',
+        'OPTIONS': {
+            'LOCAL_MAX_ENTRIES': int(os.getenv('CACHE_LOCAL_ENTRIES', 1000)),
+            'LOCAL_TIMEOUT': int(os.getenv('CACHE_LOCAL_TIMEOUT', 60)),
+        },
+    },
+    'shared': SHARED_CACHES[CACHE_BACKEND],
 }
+
+# Фоновые задачи (миниатюры, лента подписок, поисковый индекс) ждут
+# в очереди в базе и выполняются командой `manage.py run_tasks`.
+# С TASKS_EAGER они выполняются сразу при постановке, без обработчика.
+TASKS_EAGER = os.getenv('TASKS_EAGER', '1' if DEBUG else '0') == '1'
+# Через сколько секунд задачу упавшего обработчика заберёт другой.
+TASKS_LEASE = 60 * 5
+# Счётчики очереди общие для всех процессов, поэтому пишутся мимо
+# локального уровня кэша.
+TASKS_STATS_CACHE = 'shared'
+
+# Загрузки всегда пишутся во временный файл кусками и не растут сверх лимита.
+FILE_UPLOAD_HANDLERS = ['posts.uploads.BoundedTemporaryFileUploadHandler']
+POST_IMAGE_MAX_SIZE = 10 * 2 ** 20
+POST_IMAGE_MAX_PIXELS = 40 * 10 ** 6
+# Перекодировать загруженные картинки в фоне, убирая EXIF и прочие метаданные.
+POST_IMAGE_STRIP_METADATA = False
+# Сколько секунд не удалять записанную или переиспользованную картинку:
+# пост, который на неё сошлётся, может быть ещё не сохранён.
+POST_IMAGE_COLLECT_GRACE = 60 * 60
+
+# Лимиты частоты записей по областям (core.ratelimit): всплеск в минуту
+# и предел на длинной дистанции. Счётчики — в общем кэше, мимо локального
+# уровня, чтобы все процессы видели один счёт.
+RATELIMIT_ENABLED = os.getenv('RATELIMIT_ENABLED', '1') == '1'
+RATELIMIT_CACHE = 'shared'
+# За обратным прокси адрес клиента берётся из его заголовка, например
+# HTTP_X_FORWARDED_FOR. Начало заголовка присылает сам клиент, поэтому
+# адрес берётся RATELIMIT_PROXY_HOPS-м с конца: сколько доверенных прокси
+# дописывают в заголовок адрес того, кто к ним подключился.
+RATELIMIT_IP_META = os.getenv('RATELIMIT_IP_META', 'REMOTE_ADDR')
+RATELIMIT_PROXY_HOPS = int(os.getenv('RATELIMIT_PROXY_HOPS', '1'))
+RATELIMITS = {
+    'post_create': ('5/m', '100/d'),
+    'add_comment': ('10/m', '500/d'),
+    'follow': ('30/m', '500/d'),
+    'signup': ('5/h',),
+}
+
+# Доля запросов, для которых PerformanceMiddleware замеряет SQL, шаблоны и
+# кэш; сводка замеров — /metrics/ (только для персонала).
+PERFORMANCE_SAMPLE_RATE = 1.0 if DEBUG else 0.1
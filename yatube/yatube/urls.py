@@ -18,6 +18,8 @@ from django.urls import include, path
 from django.conf import settings
 from django.conf.urls.static import static
 
+from core.views import cache_metrics, performance_metrics, task_metrics
+
 handler404 = 'core.views.page_not_found'
 
 urlpatterns = [
@@ -26,6 +28,9 @@ urlpatterns = [
     path('auth/', include('django.contrib.auth.urls')),
     path('', include('posts.urls', namespace='posts')),
     path('about/', include('about.urls', namespace='about')),
+    path('metrics/', performance_metrics, name='performance_metrics'),
+    path('metrics/cache/', cache_metrics, name='cache_metrics'),
+    path('metrics/tasks/', task_metrics, name='task_metrics'),
 ]
 
 if settings.DEBUG: